@@ -0,0 +1,228 @@
+import os
+import time
+import asyncio
+import logging
+from collections import defaultdict, deque
+
+logger = logging.getLogger(__name__)
+
+ROUTER_WINDOW = int(os.getenv('ROUTER_WINDOW', '50'))  # Recent requests kept per backend for latency and error stats
+ROUTER_MAX_ERROR_RATE = float(os.getenv('ROUTER_MAX_ERROR_RATE', '0.5'))  # Error rate above which a backend is avoided
+ROUTER_RETRY_AFTER = float(os.getenv('ROUTER_RETRY_AFTER', '60'))  # Seconds before an unhealthy backend is tried again
+ROUTER_HEDGE = os.getenv('ROUTER_HEDGE', 'false').lower() == 'true'  # Race a second backend when the first is slow
+ROUTER_HEDGE_MIN_DELAY = float(os.getenv('ROUTER_HEDGE_MIN_DELAY', '1.0'))  # Never hedge sooner than this many seconds
+ROUTER_MIN_SAMPLES = 5  # Requests needed before a backend's stats are trusted
+
+class Backend:
+    """A model endpoint the router can send a chat request to.
+
+    chat is awaited as chat(messages, timeout, on_token) and returns the reply text.
+    The key doubles as the scheduler key for the backend's model.
+    """
+
+    def __init__(self, key, chat, options=None):
+        self.key = key
+        self.chat = chat
+        self.options = options or {}
+
+    def __repr__(self):
+        return f"Backend({self.key})"
+
+class BackendStats:
+    """Rolling latency and error record for one backend."""
+
+    def __init__(self, window=ROUTER_WINDOW):
+        self.latencies = deque(maxlen=window)  # Seconds to first token of recent successes
+        self.outcomes = deque(maxlen=window)  # True for success, False for failure
+        self.last_failure = 0.0
+
+    def record(self, latency=None, ok=True):
+        self.outcomes.append(ok)
+        if ok and latency is not None:
+            self.latencies.append(latency)
+        if not ok:
+            self.last_failure = time.monotonic()
+
+    def error_rate(self):
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+    def percentile(self, fraction):
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def healthy(self, max_error_rate=ROUTER_MAX_ERROR_RATE, retry_after=ROUTER_RETRY_AFTER):
+        if len(self.outcomes) < ROUTER_MIN_SAMPLES or self.error_rate() <= max_error_rate:
+            return True
+        # Let an unhealthy backend prove itself again once things have been quiet for a while
+        return time.monotonic() - self.last_failure >= retry_after
+
+class RouterError(Exception):
+    """Raised when every backend tried for a request failed."""
+
+    def __init__(self, errors):
+        self.errors = errors  # List of (backend key, exception)
+        super().__init__("; ".join(f"{key}: {error}" for key, error in errors) or "No backend available")
+
+class _Attempt:
+    def __init__(self, backend):
+        self.backend = backend
+        self.started = time.monotonic()
+        self.first_token = None
+        self.task = None
+
+class BackendRouter:
+    """Sends each request to the fastest healthy backend, with fallback and hedging.
+
+    Backends are ranked by their median time to first token, with unhealthy ones
+    last. If an attempt fails before it has streamed anything, the next backend is
+    tried. With hedging on, a second backend is started once the first has taken
+    longer than its own p95; whichever streams first wins and the other is cancelled.
+    """
+
+    def __init__(self, hedge=ROUTER_HEDGE, hedge_min_delay=ROUTER_HEDGE_MIN_DELAY,
+                 max_error_rate=ROUTER_MAX_ERROR_RATE, retry_after=ROUTER_RETRY_AFTER, window=ROUTER_WINDOW):
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.max_error_rate = max_error_rate
+        self.retry_after = retry_after
+        self.stats = defaultdict(lambda: BackendStats(window))
+        self.fallbacks = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def rank(self, backends, prefer=None):
+        """Order backends for a request; a preferred backend goes first if it is healthy."""
+        def score(item):
+            position, backend = item
+            stats = self.stats[backend.key]
+            healthy = stats.healthy(self.max_error_rate, self.retry_after)
+            preferred = prefer is not None and backend.key == prefer
+            median = stats.percentile(0.5)
+            # Backends without samples rank as fast so they get measured
+            return (not healthy, not preferred, median if median is not None else 0.0, position)
+        return [backend for _, backend in sorted(enumerate(backends), key=score)]
+
+    def hedge_delay(self, backend):
+        """Seconds to wait on backend before starting a hedged request, or None."""
+        stats = self.stats[backend.key]
+        if len(stats.latencies) < ROUTER_MIN_SAMPLES:
+            return None
+        return max(self.hedge_min_delay, stats.percentile(0.95))
+
+    async def run(self, backends, call, on_token=None, prefer=None):
+        """Run call(backend, on_token) on the best backend and return its reply.
+
+        call must stream through the on_token it is given; only the winning
+        attempt's fragments are passed on to the caller's on_token.
+        """
+        remaining = self.rank(backends, prefer)
+        if not remaining:
+            raise RouterError([])
+
+        pending = {}  # Maps task -> _Attempt
+        errors = []
+        winner = None
+
+        def start(backend):
+            attempt = _Attempt(backend)
+
+            async def relay(token):
+                nonlocal winner
+                if attempt.first_token is None:
+                    attempt.first_token = time.monotonic()
+                if winner is None:
+                    winner = attempt
+                    # The first attempt to stream owns the reply; stop the others
+                    for task, other in pending.items():
+                        if other is not attempt:
+                            task.cancel()
+                if winner is attempt and on_token:
+                    await on_token(token)
+
+            attempt.task = asyncio.create_task(call(backend, relay))
+            pending[attempt.task] = attempt
+            return attempt
+
+        primary = start(remaining.pop(0))
+        hedged = False
+        try:
+            while pending:
+                delay = None
+                if self.hedge and not hedged and remaining and winner is None and primary.task in pending:
+                    delay = self.hedge_delay(primary.backend)
+                    if delay is not None:
+                        delay = max(0.0, primary.started + delay - time.monotonic())
+
+                done, _ = await asyncio.wait(pending, timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    self.hedges += 1
+                    backend = remaining.pop(0)
+                    logger.info(f"{primary.backend.key} slower than its p95, hedging with {backend.key}")
+                    start(backend)
+                    continue
+
+                for task in done:
+                    attempt = pending.pop(task)
+                    if task.cancelled():
+                        self._record_loss(attempt)
+                        continue
+                    error = task.exception()
+                    if error is None and (winner is None or winner is attempt):
+                        self._record_success(attempt)
+                        if hedged and attempt is not primary:
+                            self.hedge_wins += 1
+                        return task.result()
+                    if error is None:
+                        continue
+                    self.stats[attempt.backend.key].record(ok=False)
+                    errors.append((attempt.backend.key, error))
+                    logger.warning(f"Backend {attempt.backend.key} failed: {error}")
+                    if winner is attempt:
+                        # Part of this reply is already on screen, so another backend can't take over
+                        raise RouterError(errors)
+
+                if not pending and remaining and winner is None:
+                    self.fallbacks += 1
+                    backend = remaining.pop(0)
+                    logger.info(f"Falling back to {backend.key}")
+                    start(backend)
+
+            raise RouterError(errors)
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def _record_success(self, attempt):
+        first_token = attempt.first_token or time.monotonic()
+        self.stats[attempt.backend.key].record(first_token - attempt.started, ok=True)
+
+    def _record_loss(self, attempt):
+        # A cancelled loser was at least this slow, which keeps its median honest
+        if attempt.first_token is None:
+            self.stats[attempt.backend.key].record(time.monotonic() - attempt.started, ok=True)
+
+    def get_stats(self):
+        """Per-backend latency and error figures plus router counters."""
+        backends = {}
+        for key, stats in self.stats.items():
+            backends[key] = {
+                'requests': len(stats.outcomes),
+                'error_rate': stats.error_rate(),
+                'p50': stats.percentile(0.5),
+                'p95': stats.percentile(0.95),
+                'healthy': stats.healthy(self.max_error_rate, self.retry_after)
+            }
+        return {
+            'backends': backends,
+            'fallbacks': self.fallbacks,
+            'hedges': self.hedges,
+            'hedge_wins': self.hedge_wins
+        }
+
+# Create global router instance
+backend_router = BackendRouter()
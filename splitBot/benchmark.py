@@ -0,0 +1,373 @@
+"""
+End-to-end latency benchmark for the bot against the fake Ollama server.
+
+Starts fake_ollama in-process, points the bot's services at it and drives
+get_ollama_response, the streamed mention reply, send_in_chunks and the
+!profile, !crawl and !arxiv handlers through fake Discord objects at increasing
+concurrency. !crawl reads the saved bench_pages and !arxiv a generated feed,
+both served locally. Reports p50/p95/p99 latency, time to first token and
+throughput for each scenario.
+
+Run it with: python benchmark.py --concurrency 1,4,16 --requests 32
+"""
+
+import os
+import sys
+import json
+import glob
+import time
+import asyncio
+import argparse
+import logging
+import tempfile
+from contextlib import asynccontextmanager
+from aiohttp import web
+from tabulate import tabulate
+
+from fake_ollama import FakeOllama
+
+FAKE_MODEL = 'fake-model:latest'
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_pages')
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+# ---------- Fake Discord Objects ----------
+
+class FakePermissions:
+    def __init__(self, administrator=False):
+        self.administrator = administrator
+
+class FakeAuthor:
+    def __init__(self, user_id, name):
+        self.id = user_id
+        self.name = name
+        self.display_name = name
+        self.guild_permissions = FakePermissions()
+
+class FakeGuild:
+    def __init__(self, guild_id):
+        self.id = guild_id
+        self.owner_id = 0
+
+class FakeMessage:
+    def __init__(self, channel, content, author=None, guild=None):
+        self.channel = channel
+        self.content = content
+        self.author = author
+        self.guild = guild
+        self.attachments = []
+
+    async def edit(self, content=None):
+        self.content = content
+        self.channel.record(content)
+
+class FakeChannel:
+    """Records when each message is sent so the first visible output can be timed."""
+
+    def __init__(self):
+        self.first_output = None
+        self.messages = 0
+        self.errors = []  # Warnings the command handlers sent instead of raising
+
+    def record(self, content):
+        if content and content.startswith("⚠️"):
+            self.errors.append(content)
+        # Queue notices are not an answer, so they don't count as first output
+        if self.first_output is None and content and not content.startswith("⏳"):
+            self.first_output = time.perf_counter()
+
+    async def send(self, content=None, reference=None, **kwargs):
+        self.messages += 1
+        self.record(content)
+        return FakeMessage(self, content)
+
+    @asynccontextmanager
+    async def typing(self):
+        yield
+
+class FakeContext:
+    """Just enough of discord.ext.commands.Context for the command handlers."""
+
+    def __init__(self, index):
+        self.channel = FakeChannel()
+        self.guild = FakeGuild(1000 + index % 4)
+        self.author = FakeAuthor(index, f"bench-user-{index}")
+        self.message = FakeMessage(self.channel, "", self.author, self.guild)
+
+    async def send(self, content=None, reference=None, **kwargs):
+        return await self.channel.send(content, reference=reference, **kwargs)
+
+    def typing(self):
+        return self.channel.typing()
+
+class FakeBot:
+    """Collects the handlers register_commands() attaches."""
+
+    def __init__(self):
+        self.commands = {}
+
+    def command(self, name=None, **kwargs):
+        def decorator(func):
+            self.commands[name or func.__name__] = func
+            return func
+        return decorator
+
+# ---------- Fake Sources ----------
+
+class FakeSources:
+    """Serves the saved bench_pages for !crawl and an arXiv-style Atom feed for !arxiv."""
+
+    def __init__(self, corpus_dir=CORPUS_DIR):
+        self.pages = {}
+        for path in sorted(glob.glob(os.path.join(corpus_dir, '*.html'))):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.pages[os.path.basename(path)] = f.read()
+        self.runner = None
+
+    async def handle_page(self, request):
+        html = self.pages.get(request.match_info['name'])
+        if html is None:
+            raise web.HTTPNotFound()
+        return web.Response(text=html, content_type='text/html')
+
+    async def handle_arxiv(self, request):
+        entries = []
+        for arxiv_id in request.query.get('id_list', '').split(','):
+            entries.append(f"""<entry>
+    <id>http://arxiv.org/abs/{arxiv_id}v1</id>
+    <title>Benchmark paper {arxiv_id}</title>
+    <author><name>Bench Author</name></author>
+    <summary>{' '.join(['Attention lets each token weigh every other token.'] * 20)}</summary>
+    <published>2024-01-01T00:00:00Z</published>
+    <link href="http://arxiv.org/abs/{arxiv_id}v1" rel="alternate" type="text/html"/>
+    <link href="http://arxiv.org/pdf/{arxiv_id}v1" rel="related" type="application/pdf"/>
+    <category term="cs.LG"/>
+  </entry>""")
+        feed = f'<feed xmlns="http://www.w3.org/2005/Atom">{"".join(entries)}</feed>'
+        return web.Response(text=feed, content_type='application/atom+xml')
+
+    async def start(self, host='127.0.0.1', port=11436):
+        """Start serving in the current event loop and return the base URL."""
+        app = web.Application()
+        app.router.add_get('/pages/{name}', self.handle_page)
+        app.router.add_get('/api/query', self.handle_arxiv)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, host, port).start()
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
+            self.runner = None
+
+# ---------- Scenarios ----------
+
+class Benchmark:
+    def __init__(self, data_dir, sources_url, page_names):
+        # Imported here so the environment set in main() is picked up
+        import services
+        import utils
+        from commands import register_commands
+        from context_builder import build_context
+
+        self.services = services
+        self.utils = utils
+        self.build_context = build_context
+        self.bot = FakeBot()
+        self.profiles_dir = os.path.join(data_dir, 'profiles')
+        for directory in (self.profiles_dir, os.path.join(data_dir, 'papers'), os.path.join(data_dir, 'crawls')):
+            os.makedirs(directory, exist_ok=True)
+        self.sources_url = sources_url
+        self.page_names = page_names
+        services.ARXIV_API_URL = f"{sources_url}/api/query"
+        self.user_conversations = {}
+        self.conversation_logs = [{'role': 'system', 'content': utils.SYSTEM_PROMPT}]
+        register_commands(self.bot, self.user_conversations, {}, self.conversation_logs, self.profiles_dir)
+        self.scenarios = {
+            'get_ollama_response': self.run_llm,
+            'mention (streamed)': self.run_mention,
+            '!profile <question>': self.run_profile,
+            '!crawl <question>': self.run_crawl,
+            '!arxiv <question>': self.run_arxiv,
+            'send_in_chunks': self.run_chunks,
+        }
+
+    async def run_llm(self, index, ctx):
+        first_token = None
+
+        async def on_token(token):
+            nonlocal first_token
+            if first_token is None:
+                first_token = time.perf_counter()
+
+        response = await self.services.get_ollama_response(
+            f"Benchmark question {index}: what does attention do?", with_context=False,
+            on_token=on_token, user_key=f"{ctx.guild.id}_{ctx.author.id}", use_cache=False
+        )
+        if response.startswith("Error"):
+            raise RuntimeError(response)
+        return first_token
+
+    async def run_mention(self, index, ctx):
+        user_turn = {'role': 'user', 'content': f"{ctx.author.name} asks: explain backprop ({index})"}
+        messages = self.build_context(self.conversation_logs, user_turn)
+        streamer = self.utils.StreamingMessage(ctx.channel, reference=ctx.message)
+        response = await self.services.get_ollama_response(
+            user_turn['content'], with_context=True, conversation_history=messages,
+            on_token=streamer.push, user_key=f"{ctx.guild.id}_{ctx.author.id}", use_cache=False
+        )
+        if response.startswith("Error"):
+            raise RuntimeError(response)
+        await streamer.finish(response)
+        return ctx.channel.first_output
+
+    @staticmethod
+    def command_output(ctx):
+        """Time of a command's first output; handlers report failures as warnings, so raise on those."""
+        if ctx.channel.errors:
+            raise RuntimeError(ctx.channel.errors[0])
+        return ctx.channel.first_output
+
+    async def run_profile(self, index, ctx):
+        user_key = f"{ctx.guild.id}_{ctx.author.id}"
+        profile_path = os.path.join(self.profiles_dir, f"{user_key}_profile.json")
+        if not os.path.exists(profile_path):
+            with open(profile_path, 'w', encoding='utf-8') as f:
+                json.dump({'analysis': "Interested in transformers and optimizers.", 'timestamp': 'now'}, f)
+        await self.bot.commands['profile'](ctx, question=f"What should I study next? ({index})")
+        return self.command_output(ctx)
+
+    async def run_crawl(self, index, ctx):
+        # Pages are fetched through the HTTP cache, so repeats revalidate instead of downloading
+        url = f"{self.sources_url}/pages/{self.page_names[index % len(self.page_names)]}"
+        await self.bot.commands['crawl'](ctx, url, question=f"What is the main point? ({index})")
+        return self.command_output(ctx)
+
+    async def run_arxiv(self, index, ctx):
+        # Each ID is fetched from the feed once; later concurrency levels read it from the paper cache
+        await self.bot.commands['arxiv'](ctx, f"2401.{10000 + index}", question=f"What does it propose? ({index})")
+        return self.command_output(ctx)
+
+    async def run_chunks(self, index, ctx):
+        paragraph = "Gradient descent updates each weight against the slope of the loss. " * 8
+        await self.utils.send_in_chunks(ctx, "\n\n".join([paragraph] * 10), reference=ctx.message)
+        return ctx.channel.first_output
+
+    async def measure(self, scenario, concurrency, requests):
+        """Run requests calls of a scenario with at most concurrency in flight."""
+        run = self.scenarios[scenario]
+        # Answers cached by an earlier run would hide the model's latency
+        self.services.response_cache.clear()
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies, ttfts, failures = [], [], 0
+
+        async def one(index):
+            nonlocal failures
+            async with semaphore:
+                ctx = FakeContext(index)
+                started = time.perf_counter()
+                try:
+                    first = await run(index, ctx)
+                except Exception as e:
+                    logging.error(f"{scenario} request {index} failed: {e}")
+                    failures += 1
+                    return
+                latencies.append(time.perf_counter() - started)
+                if first is not None:
+                    ttfts.append(first - started)
+
+        wall_started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        wall = time.perf_counter() - wall_started
+        return {
+            'scenario': scenario,
+            'concurrency': concurrency,
+            'requests': requests,
+            'failures': failures,
+            'p50': percentile(latencies, 0.50),
+            'p95': percentile(latencies, 0.95),
+            'p99': percentile(latencies, 0.99),
+            'ttft_p50': percentile(ttfts, 0.50),
+            'ttft_p95': percentile(ttfts, 0.95),
+            'throughput': len(latencies) / wall if wall else 0.0
+        }
+
+def format_seconds(value):
+    return f"{value * 1000:.0f} ms" if value is not None else "n/a"
+
+async def run_benchmark(args):
+    server = FakeOllama(args.ttft, args.tokens_per_second, args.reply_tokens, args.parallel, models=(FAKE_MODEL,))
+    url = await server.start(port=args.port)
+    sources = FakeSources()
+    sources_url = await sources.start(port=args.sources_port)
+
+    data_dir = tempfile.mkdtemp(prefix='ollama-teacher-bench-')
+    os.environ.update({
+        'OLLAMA_HOST': url,
+        'OLLAMA_MODEL': FAKE_MODEL,
+        'DATA_DIR': data_dir,
+        'RESPONSE_CACHE_PERSIST': 'false',
+        'LLM_MAX_INFLIGHT': str(args.parallel),
+    })
+    for name in ('OLLAMA_HOSTS', 'GROQ_API_KEY', 'RESPONSE_CACHE_EMBED_MODEL'):
+        os.environ.pop(name, None)
+
+    benchmark = Benchmark(data_dir, sources_url, list(sources.pages))
+    scenarios = args.scenario or list(benchmark.scenarios)
+    results = []
+    try:
+        for scenario in scenarios:
+            for concurrency in args.concurrency:
+                result = await benchmark.measure(scenario, concurrency, max(args.requests, concurrency))
+                results.append(result)
+                print(f"{scenario} @ {concurrency}: p50 {format_seconds(result['p50'])}, "
+                      f"p95 {format_seconds(result['p95'])}, {result['throughput']:.1f} req/s")
+    finally:
+        await benchmark.services.close_services()
+        await sources.stop()
+        await server.stop()
+
+    print()
+    print(tabulate(
+        [[
+            r['scenario'], r['concurrency'], r['requests'], r['failures'],
+            format_seconds(r['p50']), format_seconds(r['p95']), format_seconds(r['p99']),
+            format_seconds(r['ttft_p50']), format_seconds(r['ttft_p95']), f"{r['throughput']:.2f}"
+        ] for r in results],
+        headers=['Scenario', 'Concurrency', 'Requests', 'Failed', 'p50', 'p95', 'p99',
+                 'TTFT p50', 'TTFT p95', 'Req/s'],
+        tablefmt='github'
+    ))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'settings': vars(args), 'results': results}, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the bot end to end against a fake Ollama server")
+    parser.add_argument('--concurrency', default='1,4,16',
+                        type=lambda value: [int(v) for v in value.split(',')],
+                        help="Comma-separated concurrency levels")
+    parser.add_argument('--requests', type=int, default=32, help="Requests per scenario and concurrency level")
+    parser.add_argument('--scenario', action='append', help="Scenario to run (repeatable); default is all")
+    parser.add_argument('--port', type=int, default=11435)
+    parser.add_argument('--sources-port', type=int, default=11436, help="Port serving the pages and feed for !crawl and !arxiv")
+    parser.add_argument('--ttft', type=float, default=0.2, help="Fake server seconds before the first token")
+    parser.add_argument('--tokens-per-second', type=float, default=40.0)
+    parser.add_argument('--reply-tokens', type=int, default=64)
+    parser.add_argument('--parallel', type=int, default=4, help="Fake server requests generated at once")
+    parser.add_argument('--output', help="Write the results as JSON to this file")
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+    asyncio.run(run_benchmark(args))
+
+if __name__ == "__main__":
+    sys.exit(main())
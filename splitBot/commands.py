@@ -2,6 +2,7 @@ import os
 import re
 import logging
 import json
+import urllib.parse
 from datetime import datetime, timezone, UTC
 from pathlib import Path
 from collections import defaultdict
@@ -12,13 +13,21 @@ from io import BytesIO
 import re
 
 from utils import (
-    send_in_chunks, get_user_key, store_user_conversation,
-    ParquetStorage, PandasQueryEngine, DEFAULT_RESOURCES, SYSTEM_PROMPT
+    send_in_chunks, get_user_key, store_user_conversation, queue_notifier,
+    process_image_attachment, ParquetStorage, PandasQueryEngine, DEFAULT_RESOURCES, SYSTEM_PROMPT
 )
 from services import (
-    get_ollama_response, ArxivSearcher, DuckDuckGoSearcher, WebCrawler
+    get_ollama_response, process_image_with_llava, response_cache, inflight_generations, ollama_hosts, llm_scheduler, CRAWL_SUMMARIZE_CONCURRENCY, ArxivSearcher, DuckDuckGoSearcher, WebCrawler
 )
+from backend_router import backend_router
+from context_builder import prompt_eval_stats
+from metrics import metrics
 from image_queue import ImageGenerationQueue
+from conversation_memory import conversation_compactor
+from profile_analysis import profile_analyzer
+from paper_text import paper_fulltext, select_chunks
+from http_cache import http_cache
+from link_ingest import link_ingest
 
 # Initialize logging
 logger = logging.getLogger(__name__)
@@ -38,6 +47,8 @@ def register_commands(bot, USER_CONVERSATIONS, COMMAND_MEMORY, conversation_logs
         user_key = get_user_key(ctx)
         USER_CONVERSATIONS[user_key] = [{'role': 'system', 'content': SYSTEM_PROMPT}]
         COMMAND_MEMORY[user_key].clear()
+        conversation_compactor.forget(user_key)
+        profile_analyzer.forget(user_key)
         await ctx.send("✅ Your conversation context has been reset.")
 
     @bot.command(name='globalReset')
@@ -49,8 +60,121 @@ def register_commands(bot, USER_CONVERSATIONS, COMMAND_MEMORY, conversation_logs
             
         USER_CONVERSATIONS.clear()
         COMMAND_MEMORY.clear()
+        conversation_compactor.forget()
+        profile_analyzer.forget()
         await ctx.send("🔄 Global conversation context has been reset.")
 
+    @bot.command(name='cache_stats')
+    async def cache_stats(ctx, action: str = None):
+        """Show response cache statistics or clear the cache (admin only)."""
+        if not ctx.author.guild_permissions.administrator and ctx.author.id != ctx.guild.owner_id:
+            await ctx.send("⚠️ Only server administrators and owner can use this command.")
+            return
+            
+        if action == 'clear':
+            response_cache.clear()
+            await ctx.send("🧹 Response cache cleared.")
+            return
+            
+        stats = response_cache.stats()
+        shared = inflight_generations.stats()
+        prompts = prompt_eval_stats.stats()
+        pages = http_cache.get_stats()
+        await ctx.send(f"""# 🗃️ Response Cache
+- Entries: {stats['entries']}
+- Exact hits: {stats['hits']}
+- Semantic hits: {stats['semantic_hits']}
+- Misses: {stats['misses']}
+- Hit rate: {stats['hit_rate']:.1%}
+
+## Shared Generations
+- Upstream generations: {shared['started']}
+- Requests that joined one in flight: {shared['coalesced']}
+
+## Prompt Prefix Reuse
+- Ollama requests measured: {prompts['requests']}
+- Avg prompt size: ~{prompts['avg_prompt_tokens']:.0f} tokens
+- Avg tokens evaluated: {prompts['avg_evaluated_tokens']:.0f}
+- Avg tokens reused from the prompt cache: ~{prompts['avg_tokens_saved']:.0f}
+
+## Crawled Page Cache
+- Pages: {pages['entries']} ({pages['bytes'] / (1024 * 1024):.1f} of {pages['max_bytes'] / (1024 * 1024):.0f} MB)
+- Fresh hits: {pages['hits']}
+- Revalidated unchanged: {pages['revalidated']}
+- Downloads: {pages['misses']}
+""")
+
+    @bot.command(name='backends')
+    async def backends(ctx):
+        """Show latency and error rates of the model backends (admin only)."""
+        if not ctx.author.guild_permissions.administrator and ctx.author.id != ctx.guild.owner_id:
+            await ctx.send("⚠️ Only server administrators and owner can use this command.")
+            return
+            
+        stats = backend_router.get_stats()
+        lines = ["# 🔀 Model Backends"]
+        if not stats['backends']:
+            lines.append("No model requests have been routed yet.")
+        for key, backend in sorted(stats['backends'].items()):
+            p50 = f"{backend['p50']:.2f}s" if backend['p50'] is not None else "n/a"
+            p95 = f"{backend['p95']:.2f}s" if backend['p95'] is not None else "n/a"
+            status = "✅ healthy" if backend['healthy'] else "⚠️ avoided"
+            lines.append(
+                f"- **{key}**: {status}, first token p50 {p50} / p95 {p95}, "
+                f"errors {backend['error_rate']:.0%} of last {backend['requests']}"
+            )
+        lines.append(f"\nFallbacks: {stats['fallbacks']} | Hedged requests: {stats['hedges']} | Hedges won: {stats['hedge_wins']}")
+        
+        lines.append("\n## Ollama Hosts")
+        for name, host in ollama_hosts.get_status().items():
+            status = "✅ admitted" if host['admitted'] else f"⛔ ejected for {host['ejected_for']:.0f}s"
+            models = ", ".join(host['models']) or "none"
+            lines.append(
+                f"- **{name}**: {status}, {host['outstanding']} in flight, {host['served']} served, loaded: {models}"
+            )
+        await send_in_chunks(ctx, "\n".join(lines))
+
+    @bot.command(name='stats')
+    async def stats(ctx):
+        """Show command, model and stage latencies plus queue depths (admin only)."""
+        if not ctx.author.guild_permissions.administrator and ctx.author.id != ctx.guild.owner_id:
+            await ctx.send("⚠️ Only server administrators and owner can use this command.")
+            return
+            
+        def seconds(value):
+            return f"{value:.2f}s" if value is not None else "n/a"
+            
+        lines = ["# 📈 Bot Stats", "", "## Commands"]
+        for labels, count, p50, p95 in metrics.summary('bot_command_seconds'):
+            errors = metrics.counter_total('bot_command_total', command=labels['command'], status='error')
+            lines.append(f"- `{labels['command']}`: {count} calls, p50 {seconds(p50)}, p95 {seconds(p95)}, {errors:.0f} errors")
+            
+        lines += ["", "## Models"]
+        first_tokens = {labels['model']: p50 for labels, _, p50, _ in metrics.summary('bot_llm_first_token_seconds')}
+        for labels, count, p50, p95 in metrics.summary('bot_llm_request_seconds'):
+            model = labels['model']
+            errors = metrics.counter_total('bot_llm_request_total', model=model, status='error')
+            lines.append(
+                f"- `{model}`: {count} requests, p50 {seconds(p50)}, p95 {seconds(p95)}, "
+                f"first token p50 {seconds(first_tokens.get(model))}, {errors:.0f} errors"
+            )
+            
+        lines += ["", "## Stages"]
+        for labels, count, p50, p95 in metrics.summary('bot_stage_seconds'):
+            lines.append(f"- {labels['stage']} ({labels['source']}): {count}x, p50 {seconds(p50)}, p95 {seconds(p95)}")
+            
+        lines += ["", "## Queues"]
+        for model, status in llm_scheduler.get_queue_status().items():
+            lines.append(f"- `{model}`: {status['in_flight']}/{status['limit']} in flight, {status['waiting']} waiting")
+        lines.append(f"- Shared generations in flight: {len(inflight_generations.calls)}")
+        
+        lag = metrics.summary('bot_event_loop_lag_seconds')
+        if lag:
+            _, count, p50, p95 = lag[0]
+            lines += ["", "## Event Loop", f"- Lag: p50 {p50 * 1000:.1f}ms, p95 {p95 * 1000:.1f}ms, max {metrics.max_loop_lag * 1000:.0f}ms over {count} probes"]
+        
+        await send_in_chunks(ctx, "\n".join(lines))
+
     # Update the help_command function in commands.py
     @bot.command(name='help')
     async def help_command(ctx):
@@ -63,9 +187,9 @@ def register_commands(bot, USER_CONVERSATIONS, COMMAND_MEMORY, conversation_logs
 - `!reset` - Clear your conversation history
 
 ## AI-Powered Commands
-- `!arxiv <arxiv_url_or_id> [--memory] [--groq] <question>` - Learn from ArXiv papers
-- `!ddg <query> [--groq] [--llava] <question>` - Search DuckDuckGo and learn
-- `!crawl <url1> [url2 url3...] [--groq] <question>` - Learn from web pages
+- `!arxiv <arxiv_url_or_id> [--memory] [--groq] [--fresh] [--full] <question>` - Learn from ArXiv papers
+- `!ddg <query> [--groq] [--llava] [--fresh] <question>` - Search DuckDuckGo and learn
+- `!crawl <url1> [url2 url3...] [--groq] [--fresh] <question>` - Learn from web pages
 - `!pandas <query>` - Query stored data using natural language
 - `!links [limit]` - Collect and organize links from channel history
 
@@ -75,11 +199,17 @@ def register_commands(bot, USER_CONVERSATIONS, COMMAND_MEMORY, conversation_logs
 
 ## Admin Commands
 - `!globalReset` - Reset all conversations (admin only)
+- `!cache_stats [clear]` - Show response cache hit rate, or clear the cache (admin only)
+- `!backends` - Show model backend latency and Ollama host health (admin only)
+- `!stats` - Show command, model and stage latencies plus queue depths (admin only)
+- `!ingest [retry]` - Show link extraction progress, or retry failed links (admin only)
 
 ## Special Features
-- Add `--groq` flag to use Groq's API for potentially improved responses
+- Add `--groq` flag to prefer Groq's API for potentially improved responses
 - Add `--llava` flag with an attached image to use vision models
 - Add `--memory` with arxiv command to enable persistent memory
+- Add `--fresh` to skip cached answers and generate a new response
+- Add `--full` to `!arxiv` to answer from the relevant parts of the paper's full text
 - Simply mention the bot to start a conversation without commands
 
 ## Examples
@@ -153,9 +283,13 @@ https://github.com/Leoleojames1/OllamaDiscordTeacher/tree/master
             user_key = get_user_key(ctx)
             use_memory = '--memory' in arxiv_ids
             use_groq = '--groq' in arxiv_ids
+            use_fresh = '--fresh' in arxiv_ids or '--fresh' in (question or '')
+            use_full = '--full' in arxiv_ids or '--full' in (question or '')
             
             # Remove flags from the arxiv_ids string
-            arxiv_ids = arxiv_ids.replace('--memory', '').replace('--groq', '').strip()
+            arxiv_ids = arxiv_ids.replace('--memory', '').replace('--groq', '').replace('--fresh', '').replace('--full', '').strip()
+            if question:
+                question = question.replace('--fresh', '').replace('--full', '').strip()
             
             async with ctx.typing():
                 # Get previous context if using memory
@@ -165,32 +299,35 @@ https://github.com/Leoleojames1/OllamaDiscordTeacher/tree/master
                 id_list = re.split(r'[,\s]+', arxiv_ids.strip())
                 all_papers = []
                 
+                requested_ids = []
                 for arxiv_id_or_url in id_list:
                     try:
-                        arxiv_id = ArxivSearcher.extract_arxiv_id(arxiv_id_or_url.strip())
-                        
-                        # Check cache
-                        paper_file = f"{DATA_DIR}/papers/{arxiv_id}.parquet"
-                        existing_paper = ParquetStorage.load_from_parquet(paper_file)
-                        
-                        if (existing_paper is not None and len(existing_paper) > 0):
-                            paper_info = existing_paper.iloc[0].to_dict()
-                            logger.info(f"Using cached paper info for {arxiv_id}")
-                        else:
-                            paper_info = await ArxivSearcher.fetch_paper_info(arxiv_id)
-                            
-                        paper_text = await ArxivSearcher.format_paper_for_learning(paper_info)
-                        all_papers.append({"id": arxiv_id, "content": paper_text})
-                        
-                        # Store the paper details in user's memory if memory flag is used
-                        if use_memory:
-                            memory_key = f"paper_{arxiv_id}"
-                            COMMAND_MEMORY[user_key][memory_key] = paper_text
-                            
+                        requested_ids.append(ArxivSearcher.extract_arxiv_id(arxiv_id_or_url.strip()))
                     except Exception as e:
                         logger.error(f"Error processing {arxiv_id_or_url}: {e}")
                         await ctx.send(f"⚠️ Error with {arxiv_id_or_url}: {str(e)}")
                 
+                # Cached papers are read from disk and the rest fetched in one arXiv request
+                try:
+                    papers = await ArxivSearcher.get_papers(requested_ids)
+                except Exception as e:
+                    logger.error(f"Error fetching papers {requested_ids}: {e}")
+                    await ctx.send(f"⚠️ Error fetching papers from arXiv: {str(e)}")
+                    papers = []
+                
+                for arxiv_id, paper_info in zip(requested_ids, papers):
+                    if paper_info is None:
+                        await ctx.send(f"⚠️ Error with {arxiv_id}: No paper found with the provided ID")
+                        continue
+                        
+                    paper_text = await ArxivSearcher.format_paper_for_learning(paper_info)
+                    all_papers.append({"id": arxiv_id, "content": paper_text, "info": paper_info})
+                    
+                    # Store the paper details in user's memory if memory flag is used
+                    if use_memory:
+                        memory_key = f"paper_{arxiv_id}"
+                        COMMAND_MEMORY[user_key][memory_key] = paper_text
+                
                 if not all_papers:
                     await ctx.send("Could not process any of the provided ArXiv papers")
                     return
@@ -203,13 +340,34 @@ https://github.com/Leoleojames1/OllamaDiscordTeacher/tree/master
                     else:
                         combined_prompt = ""
 
+                    # In full-text mode add the parts of each paper most relevant to the question
+                    excerpts = defaultdict(list)
+                    if use_full:
+                        results = await asyncio.gather(
+                            *(paper_fulltext.get_chunks(paper['info']) for paper in all_papers), return_exceptions=True
+                        )
+                        candidates = []
+                        for paper, result in zip(all_papers, results):
+                            if isinstance(result, Exception):
+                                logger.error(f"Full text of {paper['id']} unavailable: {result}")
+                                await ctx.send(f"⚠️ Using the abstract of {paper['id']}: {str(result)}")
+                            else:
+                                candidates.extend(dict(chunk, id=paper['id']) for chunk in result)
+                        for chunk in select_chunks(candidates, question):
+                            excerpts[chunk['id']].append(chunk)
+
                     combined_prompt += "I want to learn from these research papers:\n\n"
                     for paper in all_papers:
                         combined_prompt += f"--- Paper: {paper['id']} ---\n{paper['content']}\n\n"
+                        for chunk in excerpts[paper['id']]:
+                            combined_prompt += f"Excerpt ({chunk['section']}):\n{chunk['text']}\n\n"
 
                     combined_prompt += f"\nMy question is: {question}\n\nPlease provide a detailed answer using information from all papers."
 
-                    ai_response = await get_ollama_response(combined_prompt, with_context=False, use_groq=use_groq)
+                    ai_response = await get_ollama_response(
+                        combined_prompt, with_context=False, use_groq=use_groq, use_cache=not use_fresh,
+                        user_key=user_key, on_queued=queue_notifier(ctx, ctx.message), question=question
+                    )
                     
                     # Save context for future use if memory flag is enabled
                     if use_memory:
@@ -289,9 +447,12 @@ https://github.com/Leoleojames1/OllamaDiscordTeacher/tree/master
             # Check for flags
             use_groq = '--groq' in query
             use_llava = '--llava' in query
+            use_fresh = '--fresh' in query or '--fresh' in (question or '')
             
             # Clean flags from query
-            query = query.replace('--groq', '').replace('--llava', '').strip()
+            query = query.replace('--groq', '').replace('--llava', '').replace('--fresh', '').strip()
+            if question:
+                question = question.replace('--fresh', '').strip()
             
             # Handle image input for llava
             image_data = None
@@ -300,7 +461,10 @@ https://github.com/Leoleojames1/OllamaDiscordTeacher/tree/master
                     image_data = await process_image_attachment(ctx.message.attachments[0])
                     # Get image description from llava
                     vision_prompt = f"Describe this image in detail and extract key searchable concepts that would be relevant to the query: {query}"
-                    image_description = await process_image_with_llava(image_data, vision_prompt)
+                    image_description = await process_image_with_llava(
+                        image_data, vision_prompt,
+                        user_key=get_user_key(ctx), on_queued=queue_notifier(ctx, ctx.message)
+                    )
                     
                     # Combine image insights with original query
                     query = f"{query} {image_description}"
@@ -339,7 +503,10 @@ My question is: {question}
 Please provide a concise, accurate response based on the search results.
 If the search results don't contain relevant information about {query}, please explain what {query} is based on your knowledge.
 """
-                    ai_response = await get_ollama_response(prompt, with_context=False, use_groq=use_groq)
+                    ai_response = await get_ollama_response(
+                        prompt, with_context=False, use_groq=use_groq, use_cache=not use_fresh,
+                        user_key=get_user_key(ctx), on_queued=queue_notifier(ctx, ctx.message), question=question
+                    )
                     
                     # Add Groq indicator if used
                     if use_groq:
@@ -363,68 +530,89 @@ If the search results don't contain relevant information about {query}, please e
             if '--groq' in urls:
                 use_groq = True
                 urls = urls.replace('--groq', '').strip()
+            
+            # Check for fresh flag to bypass the response cache
+            use_fresh = '--fresh' in urls or '--fresh' in (question or '')
+            urls = urls.replace('--fresh', '').strip()
+            if question:
+                question = question.replace('--fresh', '').strip()
                 
             async with ctx.typing():
                 # Split URLs by space or comma
-                url_list = re.split(r'[,\s]+', urls.strip())
-                all_content = []
+                url_list = [url.strip() for url in re.split(r'[,\s]+', urls.strip()) if url.strip()]
                 
-                for url in url_list:
-                    url = url.strip()
-                    if not url:
-                        continue
+                # Fetch, parse and summarize stages of different URLs overlap, each with its own limit
+                page_tasks = WebCrawler.crawl_pages(url_list)
+                summarize_slots = asyncio.Semaphore(CRAWL_SUMMARIZE_CONCURRENCY)
+                
+                async def summarize(page_task):
+                    item = await page_task
+                    if not item or not item['content']:
+                        return item, None
+                    async with summarize_slots:
+                        summary = await get_ollama_response(
+                            f"Summarize this content:\n{item['content'][:7000]}", with_context=False, use_groq=use_groq,
+                            use_cache=not use_fresh, user_key=get_user_key(ctx), on_queued=queue_notifier(ctx, ctx.message)
+                        )
+                    return item, summary
+                
+                summary_tasks = [] if question else [asyncio.create_task(summarize(task)) for task in page_tasks]
+                try:
+                    # Combine all content for the question
+                    if question:
+                        pages = [item for item in await asyncio.gather(*page_tasks) if item]
+                        for item in pages:
+                            if item['note']:
+                                await ctx.send(f"ℹ️ {item['url']}: {item['note']}")
+                        all_content = [item for item in pages if item['content']]
+                        if not all_content:
+                            await ctx.send("⚠️ Could not fetch content from any of the provided URLs")
+                            return
                         
-                    # Check if it's a PyPI package
-                    pypi_match = re.match(r'https?://pypi\.org/project/([^/]+)/?.*', url)
-                    
-                    if pypi_match:
-                        # Handle PyPI URL
-                        package_name = pypi_match.group(1)
-                        html_content = await WebCrawler.fetch_url_content(url)
-                        if html_content:
-                            package_data = await WebCrawler.extract_pypi_content(html_content, package_name)
-                            if package_data:
-                                content_text = package_data.get('documentation', 'No documentation available')
-                                all_content.append({'url': url, 'content': content_text})
-                    else:
-                        # Handle regular URL
-                        html_content = await WebCrawler.fetch_url_content(url)
-                        if html_content:
-                            content_text = await WebCrawler.extract_text_from_html(html_content)
-                            all_content.append({'url': url, 'content': content_text})
-                
-                if not all_content:
-                    await ctx.send("⚠️ Could not fetch content from any of the provided URLs")
-                    return
-                    
-                # Combine all content for the question
-                if question:
-                    combined_prompt = "I've gathered information from multiple sources:\n\n"
-                    for item in all_content:
-                        combined_prompt += f"From {item['url']}:\n{item['content'][:5000]}...\n\n"
-                    combined_prompt += f"\nMy question is: {question}\n\nPlease provide a detailed answer using information from all sources."
-                    
-                    ai_response = await get_ollama_response(combined_prompt, with_context=False, use_groq=use_groq)
-                    
-                    # Add Groq indicator if used
-                    if use_groq:
-                        response_text = f"🤖 Using Groq API\n\n{ai_response}"
-                    else:
-                        response_text = ai_response
+                        combined_prompt = "I've gathered information from multiple sources:\n\n"
+                        for item in all_content:
+                            combined_prompt += f"From {item['url']}:\n{item['content'][:5000]}...\n\n"
+                        combined_prompt += f"\nMy question is: {question}\n\nPlease provide a detailed answer using information from all sources."
                         
-                    await send_in_chunks(ctx, response_text, reference=ctx.message)
-                else:
-                    # Send summaries of each source
-                    for item in all_content:
-                        header = f"# 🌐 Summary: {item['url']}\n\n"
-                        summary = await get_ollama_response(f"Summarize this content:\n{item['content'][:7000]}", with_context=False, use_groq=use_groq)
+                        ai_response = await get_ollama_response(
+                            combined_prompt, with_context=False, use_groq=use_groq, use_cache=not use_fresh,
+                            user_key=get_user_key(ctx), on_queued=queue_notifier(ctx, ctx.message), question=question
+                        )
                         
+                        # Add Groq indicator if used
                         if use_groq:
-                            response_text = f"🤖 Using Groq API\n\n{summary}"
+                            response_text = f"🤖 Using Groq API\n\n{ai_response}"
                         else:
-                            response_text = summary
+                            response_text = ai_response
+                            
+                        await send_in_chunks(ctx, response_text, reference=ctx.message)
+                    else:
+                        # Send summaries of each source in input order as soon as each is ready
+                        sent = 0
+                        for task in summary_tasks:
+                            item, summary = await task
+                            if item and not item['content']:
+                                await ctx.send(f"ℹ️ {item['url']}: {item['note'] or 'no readable text'}")
+                            if summary is None:
+                                continue
+                            header = f"# 🌐 Summary: {item['url']}\n\n"
+                            if item['note']:
+                                header += f"*Note: {item['note']}*\n\n"
+                            
+                            if use_groq:
+                                response_text = f"🤖 Using Groq API\n\n{summary}"
+                            else:
+                                response_text = summary
+                            
+                            await send_in_chunks(ctx, header + response_text, reference=ctx.message)
+                            sent += 1
                         
-                        await send_in_chunks(ctx, header + response_text, reference=ctx.message)
+                        if not sent:
+                            await ctx.send("⚠️ Could not fetch content from any of the provided URLs")
+                finally:
+                    # Stop work nobody will read if the command fails part way
+                    for task in page_tasks + summary_tasks:
+                        task.cancel()
                 
         except Exception as e:
             logging.error(f"Error in crawl_url: {e}")
@@ -526,9 +714,13 @@ Try queries like:
 
             if question:
                 # Create context for answering questions about the user
+                memory = conversation_compactor.summaries.get(user_key, {}).get('summary', '')
                 context = f"""User Profile Information:
 {profile_data.get('analysis', '')}
 
+Conversation Memory:
+{memory or 'No earlier conversations summarized yet.'}
+
 Recent Conversations:
 {chr(10).join([f"- {msg['content']}" for msg in user_messages[-10:]])}
 
@@ -538,7 +730,10 @@ Please provide a detailed, personalized answer based on the user's profile and c
 Address the user by name ({user_name}) in your response."""
 
                 async with ctx.typing():
-                    answer = await get_ollama_response(context, with_context=False)
+                    answer = await get_ollama_response(
+                        context, with_context=False,
+                        user_key=user_key, on_queued=queue_notifier(ctx, ctx.message), question=question
+                    )
                     await send_in_chunks(ctx, f"# 🔍 Profile Query\n\n{answer}", reference=ctx.message)
             else:
                 # Just show the profile
@@ -557,7 +752,7 @@ Address the user by name ({user_name}) in your response."""
                     limit = 100  # Default limit
                 
                 # Fetch messages
-                messages = await ctx.channel.history(limit=limit).flatten()
+                messages = [message async for message in ctx.channel.history(limit=limit)]
                 
                 # Extract links with metadata
                 links_data = defaultdict(list)
@@ -653,66 +848,58 @@ Address the user by name ({user_name}) in your response."""
                     ParquetStorage.save_to_parquet(all_links, str(links_file))
                     logging.info(f"Links saved to {links_file}")
                     
-                # Schedule a background content extraction
-                asyncio.create_task(extract_content_from_links(links_data, ctx.guild.id))
+                # Queue the links for background content extraction
+                counts = link_ingest.enqueue(links_data, ctx.guild.id)
+                await ctx.send(
+                    f"📥 Queued {counts['queued']} new links for content extraction "
+                    f"({counts['known']} already known, {counts['duplicates']} shared more than once)"
+                )
                     
         except Exception as e:
             logging.error(f"Error collecting links: {e}")
             await ctx.send(f"⚠️ Error collecting links: {str(e)}")
 
-    # New function to extract content from links periodically
-    async def extract_content_from_links(links_data, guild_id):
-        """Extract content from collected links for the knowledge database."""
-        try:
-            from services import WebCrawler
-            
-            # Create knowledge directory
-            knowledge_dir = Path(f"{DATA_DIR}/knowledge/{guild_id}")
-            knowledge_dir.mkdir(parents=True, exist_ok=True)
+    @bot.command(name='ingest')
+    async def ingest_status(ctx, action: str = None):
+        """Show progress of the link content extraction queue, or retry failed links (admin only)."""
+        if not ctx.author.guild_permissions.administrator and ctx.author.id != ctx.guild.owner_id:
+            await ctx.send("⚠️ Only server administrators and owner can use this command.")
+            return
             
-            # Process links by category
-            for category, links in links_data.items():
-                for link in links:
-                    url = link['url']
-                    domain = urllib.parse.urlparse(url).netloc
-                    
-                    # Skip videos for now (will be handled separately)
-                    if "youtube" in domain or "youtu.be" in domain:
-                        continue
-                    
-                    try:
-                        # Get content
-                        html = await WebCrawler.fetch_url_content(url)
-                        if not html:
-                            continue
-                            
-                        # Extract text from HTML
-                        content = await WebCrawler.extract_text_from_html(html)
-                        
-                        # Create a document with metadata
-                        document = {
-                            'url': url,
-                            'domain': domain,
-                            'category': category,
-                            'content': content,
-                            'timestamp': link['timestamp'],
-                            'author_name': link['author_name'],
-                            'author_id': link['author_id'],
-                            'extraction_time': datetime.now(UTC).isoformat()
-                        }
-                        
-                        # Save to knowledge database
-                        filename = f"{domain.replace('.', '_')}_{datetime.now().strftime('%Y%m%d%H%M%S')}.parquet"
-                        ParquetStorage.save_to_parquet(document, str(knowledge_dir / filename))
-                        
-                    except Exception as e:
-                        logging.error(f"Error processing link {url}: {e}")
-                        continue
-                        
-            logging.info(f"Content extraction completed for {sum(len(links) for links in links_data.values())} links")
+        if action == 'retry':
+            count = link_ingest.retry_failed()
+            await ctx.send(f"🔁 Queued {count} failed links again.")
+            return
             
-        except Exception as e:
-            logging.error(f"Error in background content extraction: {e}")
+        stats = link_ingest.get_stats()
+        counts = stats['counts']
+        guild = stats['guilds'].get(str(ctx.guild.id), {})
+        guild_total = sum(guild.values())
+        guild_finished = sum(guild.get(status, 0) for status in ('done', 'skipped', 'failed'))
+        lines = [
+            "# 📥 Link Ingestion",
+            "",
+            "## This Server",
+            f"- Progress: {guild_finished}/{guild_total} links"
+            + (f" ({guild_finished / guild_total:.0%})" if guild_total else ""),
+            f"- Extracted: {guild.get('done', 0)}, skipped: {guild.get('skipped', 0)}, failed: {guild.get('failed', 0)}",
+            f"- Waiting: {guild.get('pending', 0)}, in progress: {guild.get('running', 0)}",
+            "",
+            "## All Servers",
+            f"- Unique links: {stats['total']}",
+            f"- Extracted: {counts.get('done', 0)}, skipped: {counts.get('skipped', 0)}, failed: {counts.get('failed', 0)}",
+            f"- Waiting: {counts.get('pending', 0)}, in progress: {counts.get('running', 0)}",
+            f"- Rate: {stats['per_minute']:.1f} links/min with {stats['workers']} workers",
+        ]
+        if stats['active_domains']:
+            lines.append("- Fetching from: " + ", ".join(f"{domain} ({count})" for domain, count in stats['active_domains'].items()))
+        if stats['failures']:
+            lines += ["", "## Recent Failures"]
+            for failure in stats['failures']:
+                lines.append(f"- <{failure['url']}>: {failure['error']} after {failure['attempts']} attempts")
+            lines.append("Use `!ingest retry` to queue them again.")
+        
+        await send_in_chunks(ctx, "\n".join(lines))
 
     @bot.command(name='sdxl')
     async def sdxl_generate(ctx, *, prompt: str = None):
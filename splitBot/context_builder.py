@@ -0,0 +1,121 @@
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv('CONTEXT_TOKEN_BUDGET', '3000'))  # Prompt tokens allowed per request
+CONTEXT_REFILL_RATIO = float(os.getenv('CONTEXT_REFILL_RATIO', '0.6'))  # Share of the budget kept when the window slides
+CHARS_PER_TOKEN = 4  # Rough average for English text with llama-style tokenizers
+MESSAGE_OVERHEAD_TOKENS = 4  # Role markers and separators added by the chat template
+
+def estimate_tokens(text):
+    """Estimate the token count of text without loading a tokenizer."""
+    if not text:
+        return 0
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def message_tokens(message):
+    """Estimate the tokens a chat message adds to the prompt."""
+    return estimate_tokens(message.get('content', '')) + MESSAGE_OVERHEAD_TOKENS
+
+def split_system_messages(history):
+    """Split a history into its leading system messages and the conversation turns."""
+    count = 0
+    while count < len(history) and history[count].get('role') == 'system':
+        count += 1
+    return history[:count], history[count:]
+
+def build_context(history, new_message=None, budget=CONTEXT_TOKEN_BUDGET, max_messages=None, summary=None,
+                  refill_ratio=CONTEXT_REFILL_RATIO):
+    """Build the messages for a request within a token budget.
+
+    The leading system messages, an optional summary message and the new message
+    are always kept. Turns already covered by the summary are skipped.
+    Only role and content are sent; bookkeeping fields like timestamps are stripped.
+
+    The window keeps a stable start so consecutive requests share a byte-identical
+    prefix that Ollama can reuse from its prompt cache. Only when the turns no longer
+    fit does the window slide, dropping the oldest turns until they fill refill_ratio
+    of the room. Dropped turns are flagged out_of_window in history so later requests
+    start from the same place.
+    """
+    system_messages, turns = split_system_messages(history)
+    if summary:
+        system_messages = system_messages + [summary]
+        turns = [m for m in turns if not m.get('summarized')]
+    turns = [m for m in turns if not m.get('out_of_window')]
+    required = [{'role': m['role'], 'content': m['content']} for m in system_messages]
+    tail = [{'role': new_message['role'], 'content': new_message['content']}] if new_message else []
+
+    remaining = budget - sum(message_tokens(m) for m in required + tail)
+    room = (max_messages - len(required) - len(tail)) if max_messages else len(turns)
+
+    kept_count = len(turns)
+    used = sum(message_tokens(m) for m in turns)
+    if used > remaining or kept_count > room:
+        # Slide well past the limit so the next few requests keep this new start
+        target_tokens = remaining * refill_ratio
+        target_count = int(room * refill_ratio)
+        kept_count, used = 0, 0
+        for message in reversed(turns):
+            tokens = message_tokens(message)
+            if used + tokens > target_tokens or kept_count >= target_count:
+                break
+            kept_count += 1
+            used += tokens
+
+    start = len(turns) - kept_count
+    # Don't open the window with a reply whose question was dropped
+    while start < len(turns) and turns[start]['role'] == 'assistant':
+        start += 1
+    for message in turns[:start]:
+        message['out_of_window'] = True
+
+    kept = [{'role': m['role'], 'content': m['content']} for m in turns[start:]]
+    if start:
+        logger.info(f"Context window slid past {start} turns, keeping {len(kept)} ({budget - remaining + used} est. tokens)")
+    return required + kept + tail
+
+def trim_history(history, max_messages):
+    """Trim a history in place to its system messages plus the newest turns."""
+    system_messages, turns = split_system_messages(history)
+    excess = len(system_messages) + len(turns) - max_messages
+    if excess > 0:
+        del history[len(system_messages):len(system_messages) + excess]
+    return history
+
+class PromptEvalStats:
+    """Compares the prompt tokens sent with the ones Ollama actually had to evaluate.
+
+    Ollama only evaluates the part of a prompt that is not already in its prompt
+    cache, so the gap shows how much prefix reuse saves per request.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.prompt_tokens = 0  # Estimated tokens sent
+        self.evaluated_tokens = 0  # Tokens Ollama reported evaluating
+        self.eval_seconds = 0.0
+
+    def record(self, messages, prompt_eval_count, prompt_eval_duration=None):
+        """Record one finished request; prompt_eval_duration is in nanoseconds as Ollama reports it."""
+        if prompt_eval_count is None:
+            return
+        sent = sum(message_tokens(m) for m in messages)
+        self.requests += 1
+        self.prompt_tokens += sent
+        self.evaluated_tokens += prompt_eval_count
+        self.eval_seconds += (prompt_eval_duration or 0) / 1e9
+        logger.info(f"Prompt eval: {prompt_eval_count} of ~{sent} est. tokens ({max(0, sent - prompt_eval_count)} reused)")
+
+    def stats(self):
+        return {
+            'requests': self.requests,
+            'avg_prompt_tokens': self.prompt_tokens / self.requests if self.requests else 0.0,
+            'avg_evaluated_tokens': self.evaluated_tokens / self.requests if self.requests else 0.0,
+            'avg_tokens_saved': max(0, self.prompt_tokens - self.evaluated_tokens) / self.requests if self.requests else 0.0,
+            'avg_eval_seconds': self.eval_seconds / self.requests if self.requests else 0.0
+        }
+
+# Create global prompt eval stats instance
+prompt_eval_stats = PromptEvalStats()
@@ -0,0 +1,155 @@
+import os
+import json
+import asyncio
+import logging
+from datetime import datetime, UTC
+from pathlib import Path
+
+from context_builder import split_system_messages, message_tokens, estimate_tokens
+from usage_log import current_command
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.getenv('DATA_DIR', 'data')
+COMPACTION_KEEP_RECENT = int(os.getenv('COMPACTION_KEEP_RECENT', '10'))  # Newest turns always kept verbatim
+COMPACTION_BATCH_SIZE = int(os.getenv('COMPACTION_BATCH_SIZE', '10'))  # Unsummarized older turns needed to compact
+SUMMARY_MAX_WORDS = 200  # Target length of a rolling summary
+TURN_MAX_CHARS = 1500  # Longer turns are cut before being summarized
+
+class ConversationCompactor:
+    """Folds older conversation turns into a rolling summary per conversation.
+
+    Turns older than the newest keep_recent are summarized in batches, and each
+    batch is merged into the previous summary so only new turns are processed.
+    Summarized turns are flagged in place. The raw history is kept unless the
+    caller asks for the turns to be evicted.
+    """
+
+    def __init__(self, path=None, keep_recent=COMPACTION_KEEP_RECENT, batch_size=COMPACTION_BATCH_SIZE):
+        self.path = Path(path) if path else None
+        self.keep_recent = keep_recent
+        self.batch_size = batch_size
+        self.summaries = {}  # Maps conversation id -> summary state
+        self.running = {}  # Maps conversation id -> compaction task
+        self.requests_with_summary = 0
+        self.tokens_saved = 0
+        self.load()
+
+    def pending_turns(self, history):
+        """Older turns that have not been folded into the summary yet."""
+        _, turns = split_system_messages(history)
+        older = turns[:-self.keep_recent] if self.keep_recent else turns
+        return [m for m in older if not m.get('summarized')]
+
+    def schedule(self, conversation_id, history, evict=False):
+        """Start a background compaction if enough older turns are waiting."""
+        if conversation_id in self.running or len(self.pending_turns(history)) < self.batch_size:
+            return None
+        task = asyncio.create_task(self.compact(conversation_id, history, evict))
+        self.running[conversation_id] = task
+        task.add_done_callback(lambda _: self.running.pop(conversation_id, None))
+        return task
+
+    async def compact(self, conversation_id, history, evict=False):
+        """Summarize pending older turns into the conversation's rolling summary."""
+        current_command.set('compaction')
+        turns = self.pending_turns(history)
+        if not turns:
+            return False
+
+        state = self.summaries.get(conversation_id, {'summary': '', 'summarized_turns': 0, 'summarized_tokens': 0})
+        transcript = "\n".join(f"{m['role']}: {m['content'][:TURN_MAX_CHARS]}" for m in turns)
+        prompt = f"""Update the running summary of a conversation with the new turns below.
+
+Current summary:
+{state['summary'] or '(none yet)'}
+
+New turns:
+{transcript}
+
+Write the updated summary in under {SUMMARY_MAX_WORDS} words. Keep names, topics, questions asked,
+answers given and anything the users said they want to learn. Return only the summary."""
+
+        try:
+            # Imported here to avoid a circular import with services
+            from services import get_ollama_response, PRIORITY_BACKGROUND
+            summary = await get_ollama_response(
+                prompt, with_context=False, user_key=conversation_id,
+                priority=PRIORITY_BACKGROUND, use_cache=False
+            )
+        except Exception as e:
+            logger.error(f"Error compacting conversation {conversation_id}: {e}")
+            return False
+
+        if not summary or summary.startswith(("Error", "I'm sorry")):
+            logger.warning(f"Skipping compaction of {conversation_id}: {summary[:100] if summary else 'empty'}")
+            return False
+
+        for message in turns:
+            message['summarized'] = True
+        state['summary'] = summary.strip()
+        state['summarized_turns'] += len(turns)
+        state['summarized_tokens'] += sum(message_tokens(m) for m in turns)
+        state['updated'] = datetime.now(UTC).isoformat()
+        self.summaries[conversation_id] = state
+
+        if evict:
+            # Filter in place so turns appended during the summary call are kept
+            history[:] = [m for m in history if not m.get('summarized')]
+
+        logger.info(f"Compacted {len(turns)} turns of {conversation_id} into {estimate_tokens(state['summary'])} est. tokens")
+        self.save()
+        return True
+
+    def summary_message(self, conversation_id):
+        """The summary as a system message for a prompt, recording the tokens it saves."""
+        state = self.summaries.get(conversation_id)
+        if not state or not state.get('summary'):
+            return None
+        saved = state['summarized_tokens'] - estimate_tokens(state['summary'])
+        self.requests_with_summary += 1
+        self.tokens_saved += max(0, saved)
+        return {'role': 'system', 'content': f"Summary of the earlier conversation:\n{state['summary']}"}
+
+    def forget(self, conversation_id=None):
+        """Drop one conversation's summary, or all of them."""
+        if conversation_id is None:
+            self.summaries.clear()
+        else:
+            self.summaries.pop(conversation_id, None)
+        self.save()
+
+    def stats(self):
+        """Report how many prompt tokens summaries have saved."""
+        return {
+            'conversations': len(self.summaries),
+            'requests_with_summary': self.requests_with_summary,
+            'tokens_saved': self.tokens_saved,
+            'avg_tokens_saved_per_request': (
+                self.tokens_saved / self.requests_with_summary if self.requests_with_summary else 0.0
+            )
+        }
+
+    def load(self):
+        if not self.path or not self.path.exists():
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.summaries = json.load(f)
+        except Exception as e:
+            logger.error(f"Error loading conversation summaries: {e}")
+
+    def save(self):
+        if not self.path:
+            return
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix('.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.summaries, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.error(f"Error saving conversation summaries: {e}")
+
+# Create global compactor instance
+conversation_compactor = ConversationCompactor(path=os.path.join(DATA_DIR, 'memory', 'summaries.json'))
@@ -0,0 +1,142 @@
+"""
+Benchmark of the crawled-page extractors on a corpus of saved pages.
+
+Runs every page through the whole-page text extractor and the main-content
+extractor and reports the time each takes, the prompt tokens each produces
+and how much the main-content extractor saves. Pages listed in the corpus'
+expected.json are also checked for phrases their output must contain (the
+real content) and must not contain (navigation, ads, comments).
+
+Run it with: python extract_benchmark.py --repeat 5
+Pages the bot has already crawled can be added with --http-cache.
+"""
+
+import os
+import sys
+import json
+import time
+import glob
+import argparse
+import logging
+from tabulate import tabulate
+
+from html_parse import extract_text, choose_backend
+from context_builder import estimate_tokens
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_pages')
+DATA_DIR = os.getenv('DATA_DIR', 'data')
+
+def load_corpus(directories, http_cache=False):
+    """Saved pages as {name: html}, plus the expectations found next to them."""
+    pages, expected = {}, {}
+    for directory in directories:
+        for path in sorted(glob.glob(os.path.join(directory, '*.htm*'))):
+            with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                pages[os.path.basename(path)] = f.read()
+        expected_path = os.path.join(directory, 'expected.json')
+        if os.path.exists(expected_path):
+            with open(expected_path, 'r', encoding='utf-8') as f:
+                expected.update(json.load(f))
+    if http_cache:
+        for path in sorted(glob.glob(os.path.join(DATA_DIR, 'http_cache', 'bodies', '*', '*'))):
+            with open(path, 'rb') as f:
+                body = f.read()
+            # Bodies are stored without their headers; skip anything that is not HTML
+            if b'<html' in body[:2048].lower():
+                pages[f"cache:{os.path.basename(path)[:12]}"] = body.decode('utf-8', errors='replace')
+    return pages, expected
+
+def measure(html, extractor, backend, repeat):
+    """Best time over repeat runs and the extracted text."""
+    best, text = None, ''
+    for _ in range(repeat):
+        started = time.perf_counter()
+        text = extract_text(html, backend, extractor)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, text
+
+def check(text, phrases):
+    return [phrase for phrase in phrases if phrase in text]
+
+def run_benchmark(args):
+    pages, expected = load_corpus(args.pages or [CORPUS_DIR], args.http_cache)
+    if not pages:
+        print("No pages found")
+        return 1
+    backend = args.backend or choose_backend()
+    print(f"{len(pages)} pages, parser: {backend}\n")
+
+    rows, results = [], []
+    for name, html in pages.items():
+        text_seconds, text = measure(html, 'text', backend, args.repeat)
+        main_seconds, main = measure(html, 'main', backend, args.repeat)
+        text_tokens, main_tokens = estimate_tokens(text), estimate_tokens(main)
+        must = expected.get(name, {}).get('must', [])
+        must_not = expected.get(name, {}).get('must_not', [])
+        result = {
+            'page': name,
+            'html_bytes': len(html.encode('utf-8')),
+            'text_tokens': text_tokens,
+            'main_tokens': main_tokens,
+            'token_reduction': 1 - main_tokens / text_tokens if text_tokens else 0.0,
+            'text_seconds': text_seconds,
+            'main_seconds': main_seconds,
+            'text_found': len(check(text, must)),
+            'main_found': len(check(main, must)),
+            'expected': len(must),
+            'text_boilerplate': len(check(text, must_not)),
+            'main_boilerplate': len(check(main, must_not)),
+            'unwanted': len(must_not)
+        }
+        results.append(result)
+        rows.append([
+            name, f"{result['html_bytes'] / 1024:.0f}", text_tokens, main_tokens,
+            f"{result['token_reduction']:.0%}",
+            f"{text_seconds * 1000:.1f}", f"{main_seconds * 1000:.1f}",
+            f"{result['text_found']}/{len(must)}" if must else "-",
+            f"{result['main_found']}/{len(must)}" if must else "-",
+            f"{result['main_boilerplate']}/{len(must_not)}" if must_not else "-"
+        ])
+        if args.show:
+            print(f"===== {name} =====\n{main}\n")
+
+    text_total = sum(r['text_tokens'] for r in results)
+    main_total = sum(r['main_tokens'] for r in results)
+    rows.append([
+        'total', f"{sum(r['html_bytes'] for r in results) / 1024:.0f}", text_total, main_total,
+        f"{1 - main_total / text_total:.0%}" if text_total else "-",
+        f"{sum(r['text_seconds'] for r in results) * 1000:.1f}",
+        f"{sum(r['main_seconds'] for r in results) * 1000:.1f}",
+        f"{sum(r['text_found'] for r in results)}/{sum(r['expected'] for r in results)}",
+        f"{sum(r['main_found'] for r in results)}/{sum(r['expected'] for r in results)}",
+        f"{sum(r['main_boilerplate'] for r in results)}/{sum(r['unwanted'] for r in results)}"
+    ])
+    print(tabulate(
+        rows,
+        headers=['Page', 'KB', 'Text tokens', 'Main tokens', 'Saved', 'Text ms', 'Main ms',
+                 'Text content', 'Main content', 'Main boilerplate'],
+        tablefmt='github'
+    ))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'settings': vars(args), 'parser': backend, 'results': results}, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark page text extraction on saved pages")
+    parser.add_argument('--pages', action='append', help="Directory of saved .html pages (repeatable); default is bench_pages")
+    parser.add_argument('--http-cache', action='store_true', help="Also use the pages in the bot's HTTP cache")
+    parser.add_argument('--backend', choices=['selectolax', 'lxml', 'html.parser'], help="Parser to use; default is HTML_PARSER")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per page and extractor; the fastest is reported")
+    parser.add_argument('--show', action='store_true', help="Print the main content extracted from each page")
+    parser.add_argument('--output', help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    return run_benchmark(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
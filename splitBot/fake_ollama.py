@@ -0,0 +1,219 @@
+"""
+Stand-in Ollama server for benchmarks and tests.
+
+Speaks enough of Ollama's HTTP API for the bot: streaming and non-streaming
+/api/chat and /api/generate, /api/embed, /api/ps, /api/tags and /api/version.
+Replies are generated text with a configurable time to first token and token rate,
+so the bot's own overhead can be measured without a GPU.
+
+Run it with: python fake_ollama.py --port 11435 --ttft 0.2 --tokens-per-second 40
+"""
+
+import json
+import asyncio
+import hashlib
+import argparse
+import logging
+import time
+from datetime import datetime, UTC
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+WORDS = (
+    "attention lets each token weigh every other token when building its representation "
+    "gradient descent nudges the weights a little against the slope of the loss at every step"
+).split()
+
+def estimate_tokens(text):
+    return len(text) // 4 + 1 if text else 0
+
+class FakeOllama:
+    """Serves fake model replies at a fixed time to first token and token rate.
+
+    At most parallel requests generate at once, like OLLAMA_NUM_PARALLEL; the rest
+    wait for a slot. Each slot remembers its last prompt, and only the part of a new
+    prompt that differs from it counts as evaluated, which mimics Ollama's prompt cache.
+    """
+
+    def __init__(self, ttft=0.2, tokens_per_second=40.0, reply_tokens=64, parallel=4,
+                 models=('fake-model:latest',), embedding_size=64):
+        self.ttft = ttft
+        self.tokens_per_second = tokens_per_second
+        self.reply_tokens = reply_tokens
+        self.parallel = parallel
+        self.models = set(models)
+        self.embedding_size = embedding_size
+        self.slots = asyncio.Semaphore(parallel)
+        self.slot_prompts = []  # Last prompt of each slot, most recent last
+        self.loaded = {}  # Maps model -> time it was loaded
+        self.requests = 0
+        self.runner = None
+
+    # ---------- Helpers ----------
+
+    @staticmethod
+    def normalize(model):
+        return model if ':' in model else f"{model}:latest"
+
+    def load(self, model):
+        self.loaded.setdefault(self.normalize(model), time.time())
+
+    def evaluated_tokens(self, prompt):
+        """Tokens the server would have to evaluate, given the cached slot prompts."""
+        best = 0
+        for cached in self.slot_prompts:
+            common = 0
+            for a, b in zip(cached, prompt):
+                if a != b:
+                    break
+                common += 1
+            best = max(best, common)
+        self.slot_prompts.append(prompt)
+        self.slot_prompts = self.slot_prompts[-self.parallel:]
+        return max(1, estimate_tokens(prompt) - estimate_tokens(prompt[:best]))
+
+    def reply_words(self, seed):
+        offset = int(hashlib.sha256(seed.encode('utf-8')).hexdigest(), 16) % len(WORDS)
+        return [WORDS[(offset + i) % len(WORDS)] for i in range(self.reply_tokens)]
+
+    def chunk(self, model, kind, text, done=False, **extra):
+        payload = {
+            'model': model,
+            'created_at': datetime.now(UTC).isoformat(),
+            'done': done
+        }
+        if kind == 'chat':
+            payload['message'] = {'role': 'assistant', 'content': text}
+        else:
+            payload['response'] = text
+        payload.update(extra)
+        return payload
+
+    async def generate_reply(self, request, model, kind, prompt, stream):
+        """Produce the reply at the configured pace, streaming it as NDJSON if asked to."""
+        self.requests += 1
+        self.load(model)
+        started = time.perf_counter_ns()
+        async with self.slots:
+            evaluated = self.evaluated_tokens(prompt)
+            await asyncio.sleep(self.ttft)
+            prompt_done = time.perf_counter_ns()
+            words = self.reply_words(prompt)
+            delay = 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+            final = {
+                'done_reason': 'stop',
+                'prompt_eval_count': evaluated,
+                'prompt_eval_duration': prompt_done - started,
+                'eval_count': len(words)
+            }
+
+            if not stream:
+                await asyncio.sleep(delay * len(words))
+                final['eval_duration'] = time.perf_counter_ns() - prompt_done
+                final['total_duration'] = time.perf_counter_ns() - started
+                return web.json_response(self.chunk(model, kind, " ".join(words), done=True, **final))
+
+            response = web.StreamResponse(headers={'Content-Type': 'application/x-ndjson'})
+            await response.prepare(request)
+            for i, word in enumerate(words):
+                text = word if i == 0 else " " + word
+                await response.write((json.dumps(self.chunk(model, kind, text)) + "\n").encode('utf-8'))
+                await asyncio.sleep(delay)
+            final['eval_duration'] = time.perf_counter_ns() - prompt_done
+            final['total_duration'] = time.perf_counter_ns() - started
+            await response.write((json.dumps(self.chunk(model, kind, "", done=True, **final)) + "\n").encode('utf-8'))
+            await response.write_eof()
+            return response
+
+    # ---------- Routes ----------
+
+    async def handle_chat(self, request):
+        body = await request.json()
+        model = body.get('model', '')
+        messages = body.get('messages') or []
+        if not messages:
+            # An empty chat just loads the model
+            self.load(model)
+            return web.json_response(self.chunk(model, 'chat', "", done=True, done_reason='load'))
+        prompt = "".join(f"<|{m.get('role')}|>{m.get('content', '')}" for m in messages)
+        return await self.generate_reply(request, model, 'chat', prompt, body.get('stream', True))
+
+    async def handle_generate(self, request):
+        body = await request.json()
+        model = body.get('model', '')
+        if body.get('keep_alive') in (0, '0', '0s'):
+            self.loaded.pop(self.normalize(model), None)
+            return web.json_response(self.chunk(model, 'generate', "", done=True, done_reason='unload'))
+        if not body.get('prompt'):
+            # An empty prompt just loads the model
+            self.load(model)
+            return web.json_response(self.chunk(model, 'generate', "", done=True, done_reason='load'))
+        prompt = f"{body.get('system', '')}{body['prompt']}"
+        return await self.generate_reply(request, model, 'generate', prompt, body.get('stream', True))
+
+    async def handle_embed(self, request):
+        body = await request.json()
+        inputs = body.get('input') or ''
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        embeddings = []
+        for text in inputs:
+            digest = hashlib.sha256(text.encode('utf-8')).digest()
+            embeddings.append([(digest[i % len(digest)] - 128) / 128 for i in range(self.embedding_size)])
+        return web.json_response({'model': body.get('model'), 'embeddings': embeddings})
+
+    async def handle_ps(self, request):
+        return web.json_response({'models': [
+            {'name': name, 'model': name, 'size_vram': 0, 'expires_at': datetime.now(UTC).isoformat()}
+            for name in self.loaded
+        ]})
+
+    async def handle_tags(self, request):
+        return web.json_response({'models': [{'name': name, 'model': name} for name in sorted(self.models)]})
+
+    async def handle_version(self, request):
+        return web.json_response({'version': '0.0.0-fake'})
+
+    def make_app(self):
+        app = web.Application()
+        app.router.add_post('/api/chat', self.handle_chat)
+        app.router.add_post('/api/generate', self.handle_generate)
+        app.router.add_post('/api/embed', self.handle_embed)
+        app.router.add_get('/api/ps', self.handle_ps)
+        app.router.add_get('/api/tags', self.handle_tags)
+        app.router.add_get('/api/version', self.handle_version)
+        return app
+
+    async def start(self, host='127.0.0.1', port=11435):
+        """Start serving in the current event loop and return the base URL."""
+        self.runner = web.AppRunner(self.make_app(), access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, host, port).start()
+        logger.info(f"Fake Ollama listening on http://{host}:{port}")
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
+            self.runner = None
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake Ollama server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=11435)
+    parser.add_argument('--ttft', type=float, default=0.2, help="Seconds before the first token")
+    parser.add_argument('--tokens-per-second', type=float, default=40.0)
+    parser.add_argument('--reply-tokens', type=int, default=64, help="Tokens in every reply")
+    parser.add_argument('--parallel', type=int, default=4, help="Requests generated at once")
+    parser.add_argument('--model', action='append', help="Model name to advertise (repeatable)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = FakeOllama(args.ttft, args.tokens_per_second, args.reply_tokens, args.parallel,
+                        models=args.model or ('fake-model:latest',))
+    web.run_app(server.make_app(), host=args.host, port=args.port, access_log=None)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+import os
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+OLLAMA_HEALTH_TIMEOUT = float(os.getenv('OLLAMA_HEALTH_TIMEOUT', '5'))  # Seconds a health check may take
+OLLAMA_MAX_FAILURES = int(os.getenv('OLLAMA_MAX_FAILURES', '3'))  # Consecutive failures before a host is ejected
+OLLAMA_EJECT_SECONDS = float(os.getenv('OLLAMA_EJECT_SECONDS', '30'))  # First ejection period, doubled on repeat ejections
+OLLAMA_EJECT_MAX_SECONDS = 300.0  # Longest ejection period
+OLLAMA_AFFINITY_SLACK = int(os.getenv('OLLAMA_AFFINITY_SLACK', '2'))  # Extra in-flight requests accepted to reuse a loaded model
+
+def is_host_error(error):
+    """Whether an exception means the host itself is unreachable or stalled, not that the request was bad."""
+    return isinstance(error, (httpx.TransportError, ConnectionError, TimeoutError))
+
+def normalize_model_name(model_name):
+    """Ollama reports models with an explicit tag, so add the default one if missing."""
+    return model_name if ':' in model_name else f"{model_name}:latest"
+
+class OllamaHost:
+    """Health, load and residency state of one Ollama server."""
+
+    def __init__(self, url):
+        self.url = url  # None means the ollama client's default host
+        self.outstanding = 0  # Requests currently running on this host
+        self.served = 0
+        self.failures = 0  # Consecutive failures
+        self.ejections = 0  # Consecutive ejections, used to back off re-admission
+        self.ejected_until = 0.0
+        self.last_picked = 0.0
+        self.models = {}  # Resident models as reported by the host's running-model listing
+
+    @property
+    def name(self):
+        return self.url or 'default'
+
+    @property
+    def admitted(self):
+        return time.monotonic() >= self.ejected_until
+
+class OllamaHostPool:
+    """Spreads Ollama requests over several hosts.
+
+    Requests go to the admitted host with the fewest requests in flight, preferring
+    hosts that already have the model loaded unless they are busier than the rest by
+    more than affinity_slack. Hosts that fail max_failures times in a row are ejected
+    for a backoff period and re-admitted once a health check succeeds.
+    """
+
+    def __init__(self, urls, get_client, check_timeout=OLLAMA_HEALTH_TIMEOUT,
+                 max_failures=OLLAMA_MAX_FAILURES, eject_seconds=OLLAMA_EJECT_SECONDS,
+                 affinity_slack=OLLAMA_AFFINITY_SLACK):
+        self.hosts = [OllamaHost(url) for url in (urls or [None])]
+        self.get_client = get_client  # Called as get_client(host_url) -> ollama.AsyncClient
+        self.check_timeout = check_timeout
+        self.max_failures = max_failures
+        self.eject_seconds = eject_seconds
+        self.affinity_slack = affinity_slack
+
+    async def check_host(self, host):
+        """Poll one host's running models, treating the reply as a health check."""
+        try:
+            client = self.get_client(host.url)
+            response = await asyncio.wait_for(client.ps(), timeout=self.check_timeout)
+        except Exception as e:
+            logger.warning(f"Health check failed for Ollama host {host.name}: {e}")
+            self.record_failure(host)
+            return False
+
+        models = {}
+        for model in response.get('models') or []:
+            name = model.get('model') or model.get('name')
+            models[name] = {
+                'expires_at': str(model.get('expires_at')),
+                'size_vram': model.get('size_vram')
+            }
+        host.models = models
+        self.record_success(host)
+        return True
+
+    async def check_all(self):
+        """Check every host concurrently; ejected hosts that answer are re-admitted."""
+        await asyncio.gather(*(self.check_host(host) for host in self.hosts))
+
+    def record_success(self, host):
+        if not host.admitted or host.ejections:
+            logger.info(f"Re-admitting Ollama host {host.name}")
+        host.failures = 0
+        host.ejections = 0
+        host.ejected_until = 0.0
+
+    def record_failure(self, host):
+        host.failures += 1
+        if host.failures >= self.max_failures:
+            period = min(OLLAMA_EJECT_MAX_SECONDS, self.eject_seconds * 2 ** host.ejections)
+            if host.admitted:
+                logger.warning(f"Ejecting Ollama host {host.name} for {period:.0f}s after {host.failures} failures")
+            host.ejections += 1
+            host.ejected_until = time.monotonic() + period
+
+    def admitted_hosts(self):
+        return [host for host in self.hosts if host.admitted]
+
+    def pick(self, model=None, exclude=()):
+        """Choose the host for a request, or None if every host is excluded."""
+        candidates = [host for host in self.hosts if host.admitted and host not in exclude]
+        if not candidates:
+            # Everything is ejected; try the host due back soonest rather than failing outright
+            candidates = sorted(
+                (host for host in self.hosts if host not in exclude), key=lambda host: host.ejected_until
+            )[:1]
+        if not candidates:
+            return None
+
+        def load(host):
+            return (host.outstanding, host.last_picked)
+
+        if model:
+            name = normalize_model_name(model)
+            resident = [host for host in candidates if name in host.models]
+            least_busy = min(host.outstanding for host in candidates)
+            if resident and min(host.outstanding for host in resident) <= least_busy + self.affinity_slack:
+                candidates = resident
+
+        host = min(candidates, key=load)
+        host.last_picked = time.monotonic()
+        return host
+
+    @asynccontextmanager
+    async def lease(self, model=None, exclude=()):
+        """Hold a host for one request, tracking its load and failures."""
+        host = self.pick(model, exclude)
+        if host is None:
+            raise ConnectionError("No Ollama host available")
+        host.outstanding += 1
+        try:
+            yield host
+        except Exception as e:
+            if is_host_error(e):
+                self.record_failure(host)
+            raise
+        else:
+            host.served += 1
+            self.record_success(host)
+            if model:
+                # The host loads the model to serve the request, so route the next one here too
+                host.models.setdefault(normalize_model_name(model), {'expires_at': None, 'size_vram': None})
+        finally:
+            host.outstanding -= 1
+
+    def loaded_models(self):
+        """Merge the resident models of admitted hosts, noting which hosts hold each."""
+        merged = {}
+        for host in self.admitted_hosts():
+            for name, info in host.models.items():
+                entry = merged.setdefault(name, dict(info, hosts=[]))
+                entry['hosts'].append(host.url)
+        return merged
+
+    def get_status(self):
+        """Report each host's health and load."""
+        now = time.monotonic()
+        return {
+            host.name: {
+                'admitted': host.admitted,
+                'outstanding': host.outstanding,
+                'served': host.served,
+                'failures': host.failures,
+                'ejected_for': max(0.0, host.ejected_until - now),
+                'models': sorted(host.models)
+            }
+            for host in self.hosts
+        }
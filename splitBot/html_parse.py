@@ -0,0 +1,491 @@
+import os
+import re
+import logging
+
+from bs4 import BeautifulSoup, NavigableString
+from bs4.element import PreformattedString
+
+# Faster parsers are optional; without them pages are parsed with Python's html.parser
+try:
+    from selectolax.lexbor import LexborHTMLParser
+    SELECTOLAX_AVAILABLE = True
+except ImportError:
+    SELECTOLAX_AVAILABLE = False
+
+try:
+    import lxml  # Only needed as a BeautifulSoup tree builder
+    LXML_AVAILABLE = True
+except ImportError:
+    LXML_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+HTML_PARSER = os.getenv('HTML_PARSER', 'auto')  # auto, selectolax, lxml or html.parser
+HTML_EXTRACTOR = os.getenv('HTML_EXTRACTOR', 'main')  # main keeps the page's main content as markdown, text flattens the whole page
+PAGE_TEXT_MAX_CHARS = 15000  # Extracted page text is cut to this length
+FALLBACK_TEXT_MAX_CHARS = 10000  # Text recovered by the regex fallback is cut to this length
+MIN_MAIN_CONTENT_CHARS = 250  # Shorter main content means the extractor missed; the whole page text is used instead
+
+# Tags that never hold main content
+BOILERPLATE_TAGS = [
+    'script', 'style', 'noscript', 'template', 'iframe', 'svg', 'canvas', 'object', 'embed',
+    'form', 'button', 'input', 'select', 'textarea', 'nav', 'footer', 'aside'
+]
+# Class and id hints, in the spirit of Mozilla's Readability
+UNLIKELY_PATTERN = re.compile(
+    r'comment|footer|nav|menu|sidebar|breadcrumb|share|social|cookie|consent|banner|promo|related'
+    r'|advert|sponsor|\bads?\b|popup|modal|subscribe|newsletter|signup|pagination|masthead|skip-link|toolbar|editsection',
+    re.IGNORECASE
+)
+LIKELY_PATTERN = re.compile(r'article|content|main|post|entry|story|blog|docs?\b|markdown|prose|body', re.IGNORECASE)
+# Starting score of a candidate container by tag
+TAG_WEIGHTS = {
+    'article': 10, 'main': 10, 'div': 5, 'section': 3, 'pre': 3, 'td': 3, 'blockquote': 3,
+    'ol': -3, 'ul': -3, 'dl': -3, 'li': -3, 'th': -5,
+    'h1': -5, 'h2': -5, 'h3': -5, 'h4': -5, 'h5': -5, 'h6': -5
+}
+SCORED_TAGS = ['p', 'pre', 'td', 'blockquote', 'li', 'div', 'section']  # Blocks whose own text is scored
+BLOCK_TAGS = {
+    'address', 'article', 'blockquote', 'dd', 'details', 'div', 'dl', 'dt', 'figcaption', 'figure',
+    'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header', 'hr', 'li', 'main', 'ol', 'p', 'pre', 'section',
+    'summary', 'table', 'ul'
+}
+MIN_BLOCK_CHARS = 25  # Blocks with less text are not scored
+
+def choose_backend(requested=HTML_PARSER):
+    """The parser to use for page text: the requested one if installed, else the fastest available."""
+    if requested == 'selectolax' and SELECTOLAX_AVAILABLE:
+        return 'selectolax'
+    if requested in ('selectolax', 'lxml') and LXML_AVAILABLE:
+        return 'lxml'
+    if requested == 'auto':
+        if SELECTOLAX_AVAILABLE:
+            return 'selectolax'
+        if LXML_AVAILABLE:
+            return 'lxml'
+    return 'html.parser'
+
+def soup_builder():
+    """BeautifulSoup tree builder for code that needs the full soup API."""
+    return 'lxml' if LXML_AVAILABLE and HTML_PARSER != 'html.parser' else 'html.parser'
+
+def clip(text, limit):
+    return text[:limit] + ("..." if len(text) > limit else "")
+
+def page_text(html, backend):
+    if backend == 'selectolax':
+        tree = LexborHTMLParser(html)
+        for node in tree.css('script, style'):
+            node.decompose()
+        return tree.root.text(separator=' ', strip=True) if tree.root else ''
+    soup = BeautifulSoup(html, backend)
+    # Remove script and style elements
+    for script in soup(["script", "style"]):
+        script.extract()
+    return soup.get_text(separator=' ', strip=True)
+
+def link_density(node, text=None):
+    """Share of a node's text that sits inside links."""
+    text = node.get_text(' ', strip=True) if text is None else text
+    if not text:
+        return 0.0
+    return sum(len(a.get_text(' ', strip=True)) for a in node.find_all('a')) / len(text)
+
+def text_density(node, text):
+    """Characters of text per tag; menus and widgets have many tags for little text."""
+    return len(text) / (1 + sum(1 for element in node.descendants if element.name))
+
+def class_weight(node):
+    return hint_weight(' '.join(node.get('class') or []), node.get('id') or '')
+
+def hint_weight(*values):
+    weight = 0
+    for value in values:
+        if not value:
+            continue
+        if UNLIKELY_PATTERN.search(value):
+            weight -= 25
+        if LIKELY_PATTERN.search(value):
+            weight += 25
+    return weight
+
+def remove_boilerplate(soup):
+    """Drop tags that never hold content and containers whose class or id marks them as page furniture."""
+    for node in soup(BOILERPLATE_TAGS):
+        node.decompose()
+    for node in soup.find_all(True):
+        if node.decomposed or node.name in ('html', 'body', 'article', 'main', 'a'):
+            continue
+        hints = f"{' '.join(node.get('class') or [])} {node.get('id') or ''}"
+        if UNLIKELY_PATTERN.search(hints) and not LIKELY_PATTERN.search(hints):
+            node.decompose()
+
+def find_candidates(soup):
+    """Score containers by the text of the blocks inside them, as Readability does.
+
+    Each block with enough text scores by its length and commas, scaled down when
+    its text density is low, and passes the score to its parent, half to its
+    grandparent and a third above that. Candidates end up discounted by their
+    link density. Returns {id: (node, score)}.
+    """
+    scores = {}
+    for block in soup.find_all(SCORED_TAGS):
+        if block.name in ('div', 'section') and any(element.name in BLOCK_TAGS for element in block.descendants):
+            # Only containers of bare text count as a block themselves
+            continue
+        text = block.get_text(' ', strip=True)
+        if len(text) < MIN_BLOCK_CHARS:
+            continue
+        score = 1 + text.count(',') + min(len(text) // 100, 3)
+        score *= min(1.0, text_density(block, text) / 20)
+        for level, ancestor in enumerate(block.parents):
+            if level == 3 or ancestor.name in ('html', '[document]'):
+                break
+            if id(ancestor) not in scores:
+                scores[id(ancestor)] = [ancestor, TAG_WEIGHTS.get(ancestor.name, 0) + class_weight(ancestor)]
+            scores[id(ancestor)][1] += score / (level + 1)
+    return {key: (node, score * (1 - link_density(node))) for key, (node, score) in scores.items()}
+
+def main_content_nodes(soup):
+    """The best scoring container plus siblings that look like part of the same content."""
+    candidates = find_candidates(soup)
+    if not candidates:
+        return []
+    top, top_score = max(candidates.values(), key=lambda candidate: candidate[1])
+    if top.parent is None:
+        return [top]
+    threshold = max(10, top_score * 0.2)
+    nodes = []
+    for sibling in top.parent.find_all(True, recursive=False):
+        if sibling is top:
+            nodes.append(sibling)
+            continue
+        candidate = candidates.get(id(sibling))
+        if candidate and candidate[1] >= threshold:
+            nodes.append(sibling)
+        elif sibling.name == 'p':
+            text = sibling.get_text(' ', strip=True)
+            density = link_density(sibling, text)
+            if (len(text) > 80 and density < 0.25) or (text and density == 0 and re.search(r'\.( |$)', text)):
+                nodes.append(sibling)
+    return nodes
+
+def lexbor_elements(node):
+    """Element descendants of a selectolax node, without the node itself."""
+    return [element for element in node.traverse() if not element.tag.startswith('-')][1:]
+
+def lexbor_hints(node):
+    attributes = node.attributes
+    return attributes.get('class') or '', attributes.get('id') or ''
+
+def lexbor_link_density(node, text):
+    if not text:
+        return 0.0
+    return sum(len(a.text(separator=' ', strip=True)) for a in node.css('a')) / len(text)
+
+def lexbor_decompose(nodes):
+    """Decompose nodes, skipping those inside another one, which go with it."""
+    ids = {node.mem_id for node in nodes}
+    outermost = []
+    for node in nodes:
+        ancestor = node.parent
+        while ancestor is not None and ancestor.mem_id not in ids:
+            ancestor = ancestor.parent
+        if ancestor is None:
+            outermost.append(node)
+    for node in outermost:
+        node.decompose()
+
+def lexbor_main_content(html):
+    """The page title and main content nodes, picked on a selectolax tree.
+
+    Mirrors remove_boilerplate, find_candidates and main_content_nodes so the
+    scoring runs on the fast parser; only the chosen nodes need a soup to render.
+    """
+    tree = LexborHTMLParser(html)
+    title_node = tree.css_first('title')
+    title = title_node.text(separator=' ', strip=True) if title_node else ''
+    body = tree.body
+    if body is None:
+        return title, []
+    lexbor_decompose(tree.css(', '.join(BOILERPLATE_TAGS)))
+    unlikely = []
+    for node in lexbor_elements(body):
+        if node.tag in ('article', 'main', 'a'):
+            continue
+        hints = ' '.join(lexbor_hints(node))
+        if UNLIKELY_PATTERN.search(hints) and not LIKELY_PATTERN.search(hints):
+            unlikely.append(node)
+    lexbor_decompose(unlikely)
+
+    scores = {}
+    for block in body.css(', '.join(SCORED_TAGS)):
+        elements = lexbor_elements(block)
+        if block.tag in ('div', 'section') and any(element.tag in BLOCK_TAGS for element in elements):
+            continue
+        text = block.text(separator=' ', strip=True)
+        if len(text) < MIN_BLOCK_CHARS:
+            continue
+        score = 1 + text.count(',') + min(len(text) // 100, 3)
+        score *= min(1.0, len(text) / (1 + len(elements)) / 20)
+        ancestor = block.parent
+        for level in range(3):
+            if ancestor is None or ancestor.tag in ('html', '-document'):
+                break
+            if ancestor.mem_id not in scores:
+                scores[ancestor.mem_id] = [ancestor, TAG_WEIGHTS.get(ancestor.tag, 0) + hint_weight(*lexbor_hints(ancestor))]
+            scores[ancestor.mem_id][1] += score / (level + 1)
+            ancestor = ancestor.parent
+    candidates = {
+        key: (node, score * (1 - lexbor_link_density(node, node.text(separator=' ', strip=True))))
+        for key, (node, score) in scores.items()
+    }
+    if not candidates:
+        return title, []
+    top, top_score = max(candidates.values(), key=lambda candidate: candidate[1])
+    if top.parent is None:
+        return title, [top]
+    threshold = max(10, top_score * 0.2)
+    nodes = []
+    for sibling in top.parent.iter():
+        if sibling.mem_id == top.mem_id:
+            nodes.append(sibling)
+            continue
+        candidate = candidates.get(sibling.mem_id)
+        if candidate and candidate[1] >= threshold:
+            nodes.append(sibling)
+        elif sibling.tag == 'p':
+            text = sibling.text(separator=' ', strip=True)
+            density = lexbor_link_density(sibling, text)
+            if (len(text) > 80 and density < 0.25) or (text and density == 0 and re.search(r'\.( |$)', text)):
+                nodes.append(sibling)
+    return title, nodes
+
+def inline_text(node):
+    """Text of an inline run, with code spans kept as markdown and whitespace collapsed."""
+    def walk(element):
+        if isinstance(element, PreformattedString):
+            return ''
+        if isinstance(element, NavigableString):
+            return str(element)
+        if element.name in ('br', 'img'):
+            return ' '
+        if element.name == 'code':
+            return f"`{element.get_text().strip()}`"
+        return ''.join(walk(child) for child in element.children)
+    return re.sub(r'\s+', ' ', walk(node)).strip()
+
+def code_language(node):
+    for element in [node] + node.find_all('code', limit=1):
+        for name in element.get('class') or []:
+            match = re.match(r'(?:language|lang|highlight-source)-(\w+)', name)
+            if match:
+                return match.group(1)
+    return ''
+
+def is_furniture(node):
+    """Link lists and widgets that sit inside the main content, like tables of contents or share bars."""
+    text = node.get_text(' ', strip=True)
+    if not text:
+        return not node.find(['img', 'pre'])
+    density = link_density(node, text)
+    # Long runs of mostly links, like reference lists and navboxes, count too
+    return density > 0.5 and (len(text) < 300 or density > 0.8)
+
+def render_list(node, depth, blocks):
+    ordered = node.name == 'ol'
+    for index, item in enumerate(node.find_all('li', recursive=False), 1):
+        nested = item.find_all(['ul', 'ol'], recursive=False)
+        for child in nested:
+            child.extract()
+        text = inline_text(item)
+        if text:
+            marker = f"{index}." if ordered else "-"
+            blocks.append(f"{'  ' * depth}{marker} {text}")
+        for child in nested:
+            render_list(child, depth + 1, blocks)
+
+def render_table(node, blocks):
+    rows = []
+    for row in node.find_all('tr'):
+        cells = [inline_text(cell).replace('|', '\\|') for cell in row.find_all(['th', 'td'])]
+        if any(cells):
+            rows.append(f"| {' | '.join(cells)} |")
+            if len(rows) == 1:
+                rows.append(f"|{' --- |' * len(cells)}")
+    if rows:
+        blocks.append("\n".join(rows))
+
+def render_blocks(node, blocks):
+    """Append node's content to blocks as markdown; inline runs between blocks become paragraphs."""
+    pending = []
+
+    def flush():
+        text = re.sub(r'\s+', ' ', ' '.join(pending)).strip()
+        if text:
+            blocks.append(text)
+        pending.clear()
+
+    for child in node.children:
+        if isinstance(child, PreformattedString):
+            continue
+        if isinstance(child, NavigableString):
+            pending.append(str(child))
+            continue
+        name = child.name
+        if name not in BLOCK_TAGS and name != 'table':
+            if name != 'img':
+                pending.append(inline_text(child))
+            continue
+        flush()
+        if name == 'pre':
+            code = child.get_text().strip('\n')
+            if code.strip():
+                blocks.append(f"```{code_language(child)}\n{code}\n```")
+        elif name in ('h1', 'h2', 'h3', 'h4', 'h5', 'h6'):
+            text = inline_text(child)
+            if text:
+                blocks.append(f"{'#' * int(name[1])} {text}")
+        elif name in ('ul', 'ol'):
+            if not is_furniture(child):
+                lines = []
+                render_list(child, 0, lines)
+                if lines:
+                    blocks.append("\n".join(lines))
+        elif name == 'table':
+            if not is_furniture(child):
+                render_table(child, blocks)
+        elif name == 'blockquote':
+            quoted = []
+            render_blocks(child, quoted)
+            if quoted:
+                blocks.append("\n".join(f"> {line}" if line else ">" for line in "\n\n".join(quoted).splitlines()))
+        elif name == 'p':
+            text = inline_text(child)
+            if text:
+                blocks.append(text)
+        elif name != 'hr' and not is_furniture(child):
+            render_blocks(child, blocks)
+    flush()
+
+def drop_empty_sections(blocks):
+    """Remove headings left with nothing under them once their content was dropped."""
+    kept = []
+    for block in reversed(blocks):
+        level = len(block) - len(block.lstrip('#'))
+        if level and block[level:level + 1] == ' ':
+            following = kept[-1] if kept else ''
+            next_level = len(following) - len(following.lstrip('#'))
+            if not following or (next_level and following[next_level:next_level + 1] == ' ' and next_level <= level):
+                continue
+        kept.append(block)
+    return kept[::-1]
+
+def extract_main_content(html, backend=None):
+    """Extract a page's main content as compact markdown, or '' if none was found.
+
+    Boilerplate tags and containers are dropped, the remaining blocks are scored
+    by text and link density, and the best container and its related siblings
+    are rendered with headings, lists, tables and code blocks kept as markdown.
+    With selectolax the scoring runs on its tree and only the chosen nodes are
+    parsed again by BeautifulSoup for rendering. Runs in a worker process.
+    """
+    if backend == 'selectolax':
+        title, chosen = lexbor_main_content(html)
+        nodes = []
+        for node in chosen:
+            # Containers are rendered by their children, lone blocks such as a paragraph or pre as themselves
+            container = node.tag not in BLOCK_TAGS or node.tag in ('div', 'section', 'article', 'main')
+            fragment = node.inner_html if container else node.html
+            nodes.append(BeautifulSoup(f"<div>{fragment}</div>", soup_builder()).div)
+    else:
+        soup = BeautifulSoup(html, backend or soup_builder())
+        title = soup.title.get_text(' ', strip=True) if soup.title else ''
+        remove_boilerplate(soup)
+        nodes = []
+        for node in main_content_nodes(soup):
+            if node.name in BLOCK_TAGS and node.name not in ('div', 'section', 'article', 'main'):
+                # A lone block such as a paragraph or pre is rendered as itself
+                wrapper = soup.new_tag('div')
+                node.wrap(wrapper)
+                node = wrapper
+            nodes.append(node)
+    blocks = []
+    for node in nodes:
+        render_blocks(node, blocks)
+    blocks = drop_empty_sections(blocks)
+    if title and not any(block.startswith('# ') for block in blocks):
+        blocks.insert(0, f"# {title}")
+    return "\n\n".join(blocks)
+
+def extract_text(html, backend=None, extractor=None):
+    """Extract the text of an HTML page for a prompt. Runs in a worker process.
+
+    By default only the main content is kept, as markdown; pages where that finds
+    too little are flattened to their whole visible text instead.
+    """
+    backend = backend or choose_backend()
+    if (extractor or HTML_EXTRACTOR) == 'main':
+        try:
+            content = extract_main_content(html, backend)
+            if len(content) >= MIN_MAIN_CONTENT_CHARS:
+                return clip(content, PAGE_TEXT_MAX_CHARS)
+        except Exception as e:
+            logger.error(f"Error extracting main content: {e}")
+    try:
+        text = page_text(html, backend)
+        # Clean up whitespace
+        return clip(re.sub(r'\s+', ' ', text).strip(), PAGE_TEXT_MAX_CHARS)
+    except Exception as e:
+        logger.error(f"Error parsing HTML: {e}")
+        # Fall back to regex method if the parser fails
+        clean_html = re.sub(r'<script.*?>.*?</script>', '', html, flags=re.DOTALL)
+        clean_html = re.sub(r'<style.*?>.*?</style>', '', clean_html, flags=re.DOTALL)
+        text = re.sub(r'<.*?>', ' ', clean_html)
+        return clip(re.sub(r'\s+', ' ', text).strip(), FALLBACK_TEXT_MAX_CHARS)
+
+def extract_pypi(html, package_name):
+    """Extract a PyPI project page's metadata and documentation, or None. Runs in a worker process."""
+    soup = BeautifulSoup(html, soup_builder())
+
+    # Extract package metadata from the sidebar
+    metadata = {}
+    sidebar = soup.find('div', {'class': 'sidebar'})
+    if sidebar:
+        for section in sidebar.find_all('div', {'class': 'sidebar-section'}):
+            title_elem = section.find(['h3', 'h4'])
+            if title_elem:
+                section_title = title_elem.get_text().strip()
+                metadata[section_title] = [p.get_text().strip() for p in section.find_all('p')]
+
+    # Find the project description section which contains the actual documentation
+    description_div = soup.find('div', {'class': 'project-description'})
+    if not description_div:
+        return None
+
+    # Extract text while preserving structure
+    content = ""
+    for element in description_div.children:
+        if not hasattr(element, 'name'):  # Skip bare strings
+            continue
+        if element.name in ['h1', 'h2', 'h3', 'h4']:
+            heading_level = int(element.name[1])
+            content += f"{'#' * heading_level} {element.get_text().strip()}\n\n"
+        elif element.name == 'p':
+            content += f"{element.get_text().strip()}\n\n"
+        elif element.name == 'pre':
+            code = element.get_text().strip()
+            # Detect if there's a code element inside
+            code_element = element.find('code')
+            language = "python" if code_element and 'python' in str(code_element.get('class', [])).lower() else ""
+            content += f"```{language}\n{code}\n```\n\n"
+        elif element.name == 'ul':
+            for li in element.find_all('li', recursive=False):
+                content += f"- {li.get_text().strip()}\n"
+            content += "\n"
+
+    return {
+        'name': package_name,
+        'metadata': metadata,
+        'documentation': content
+    }
@@ -0,0 +1,347 @@
+import os
+import re
+import codecs
+import json
+import time
+import asyncio
+import hashlib
+import logging
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+
+import aiohttp
+
+from http_client import http_client
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.getenv('DATA_DIR', 'data')
+HTTP_CACHE_ENABLED = os.getenv('HTTP_CACHE_ENABLED', 'true').lower() == 'true'  # Cache crawled pages on disk
+HTTP_CACHE_MAX_BYTES = int(os.getenv('HTTP_CACHE_MAX_BYTES', str(200 * 1024 * 1024)))  # Size budget for cached bodies
+HTTP_CACHE_DEFAULT_TTL = float(os.getenv('HTTP_CACHE_DEFAULT_TTL', '3600'))  # Freshness when a page gives no caching headers
+HTTP_CACHE_MAX_HEURISTIC_TTL = 86400.0  # Cap on freshness guessed from Last-Modified
+HTTP_CACHE_SAVE_INTERVAL = 10.0  # Minimum seconds between writes of the index
+HTTP_MAX_DOWNLOAD_BYTES = int(os.getenv('HTTP_MAX_DOWNLOAD_BYTES', str(2 * 1024 * 1024)))  # Bytes of a page read before stopping
+KEPT_HEADERS = ('content-type', 'etag', 'last-modified', 'cache-control', 'expires', 'date')
+TEXT_TYPES = ('application/xhtml+xml', 'application/xml', 'application/json', 'application/javascript')
+
+def url_key(url):
+    return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+def parse_http_date(value):
+    try:
+        return parsedate_to_datetime(value).timestamp() if value else None
+    except (TypeError, ValueError):
+        return None
+
+def freshness_lifetime(headers, now):
+    """Seconds a response may be served without revalidation, per its caching headers."""
+    cache_control = headers.get('cache-control', '').lower()
+    if 'no-cache' in cache_control or 'no-store' in cache_control:
+        return 0.0
+    max_age = re.search(r'(?:s-maxage|max-age)=(\d+)', cache_control)
+    if max_age:
+        return float(max_age.group(1))
+    expires = parse_http_date(headers.get('expires'))
+    if expires is not None:
+        return max(0.0, expires - (parse_http_date(headers.get('date')) or now))
+    last_modified = parse_http_date(headers.get('last-modified'))
+    if last_modified is not None:
+        # The usual heuristic: a tenth of the time since the page last changed
+        return min(HTTP_CACHE_MAX_HEURISTIC_TTL, max(0.0, now - last_modified) / 10)
+    return HTTP_CACHE_DEFAULT_TTL
+
+def body_charset(headers):
+    """The charset a Content-Type names if Python knows it, otherwise UTF-8."""
+    match = re.search(r'charset=["\']?([\w-]+)', headers.get('content-type', ''), re.IGNORECASE)
+    try:
+        return codecs.lookup(match.group(1)).name if match else 'utf-8'
+    except LookupError:
+        return 'utf-8'
+
+def decode_body(body, headers):
+    return body.decode(body_charset(headers), errors='replace')
+
+def is_text_type(content_type):
+    return content_type.startswith('text/') or content_type.endswith('+xml') or content_type in TEXT_TYPES
+
+def looks_binary(block):
+    """Sniff the start of a body without a Content-Type: text has no NUL bytes."""
+    return b'\x00' in block[:1024]
+
+class HttpCache:
+    """On-disk HTTP cache for crawled pages.
+
+    Bodies are stored content-addressed under directory/bodies, so the same page
+    reached through several URLs is kept once. An index maps each URL to its
+    body hash, kept headers, ETag, Last-Modified and freshness. Fresh entries are
+    served without touching the network; stale ones are revalidated with
+    If-None-Match/If-Modified-Since, and served anyway if the site is unreachable.
+    Least recently used entries are evicted to keep bodies within max_bytes.
+    """
+
+    def __init__(self, directory=None, max_bytes=HTTP_CACHE_MAX_BYTES, max_download=HTTP_MAX_DOWNLOAD_BYTES):
+        self.directory = Path(directory) if directory else None
+        self.max_bytes = max_bytes
+        self.max_download = max_download
+        self.entries = {}  # Maps URL hash -> metadata, least recently used first
+        self.last_save = 0.0
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.load()
+
+    def body_path(self, body_hash):
+        return self.directory / 'bodies' / body_hash[:2] / body_hash
+
+    def read_body(self, body_hash):
+        return self.body_path(body_hash).read_bytes()
+
+    def write_body(self, body_hash, body):
+        path = self.body_path(body_hash)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix('.tmp')
+            tmp_path.write_bytes(body)
+            os.replace(tmp_path, path)
+
+    def touch(self, key):
+        """Mark an entry most recently used, unless it was evicted meanwhile."""
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            entry['last_access'] = time.time()
+            self.entries[key] = entry
+
+    def total_bytes(self):
+        # Count each body once even when several URLs share it
+        return sum({entry['body_hash']: entry['size'] for entry in self.entries.values()}.values())
+
+    def evict(self):
+        """Drop least recently used entries and orphaned bodies until within budget."""
+        removed = []
+        while self.entries and self.total_bytes() > self.max_bytes:
+            key = next(iter(self.entries))
+            removed.append(self.entries.pop(key)['body_hash'])
+        in_use = {entry['body_hash'] for entry in self.entries.values()}
+        for body_hash in set(removed) - in_use:
+            try:
+                self.body_path(body_hash).unlink()
+            except FileNotFoundError:
+                pass
+        return len(removed)
+
+    async def download(self, session, url, headers):
+        """Stream one GET request, reading at most max_download bytes of a text body.
+
+        Bodies whose Content-Type is not text are refused before any of them is
+        read. The text is decoded as it arrives, and reading stops at the budget.
+        Returns a dict with status, headers, body, text, truncated, skipped_bytes
+        (None when the remainder's size is unknown) and rejected (the refused type).
+        """
+        async with session.get(url, headers=headers) as response:
+            result = {
+                'status': response.status,
+                'headers': {k.lower(): v for k, v in response.headers.items()},
+                'body': b'',
+                'text': '',
+                'truncated': False,
+                'skipped_bytes': 0,
+                'rejected': None
+            }
+            if response.status != 200:
+                return result
+            
+            content_type = result['headers'].get('content-type', '').split(';')[0].strip().lower()
+            # Content-Length counts compressed bytes, so it only sizes the rest of an uncompressed body
+            known_length = response.content_length if 'content-encoding' not in result['headers'] else None
+            if content_type and not is_text_type(content_type):
+                result['rejected'] = content_type
+                result['skipped_bytes'] = known_length
+                return result
+            
+            decoder = codecs.getincrementaldecoder(body_charset(result['headers']))(errors='replace')
+            body = bytearray()
+            parts = []
+            async for block in response.content.iter_chunked(64 * 1024):
+                if not body and not content_type and looks_binary(block):
+                    result['rejected'] = 'binary data'
+                    result['skipped_bytes'] = known_length
+                    return result
+                room = self.max_download - len(body)
+                if len(block) > room:
+                    block = block[:room]
+                    result['truncated'] = True
+                body.extend(block)
+                parts.append(decoder.decode(block))
+                if result['truncated']:
+                    break
+            parts.append(decoder.decode(b'', final=True))
+            
+            result['body'] = bytes(body)
+            result['text'] = ''.join(parts)
+            if result['truncated']:
+                result['skipped_bytes'] = known_length - len(body) if known_length else None
+        return result
+
+    async def store(self, key, url, status, headers, body, now, truncated=False):
+        body_hash = hashlib.sha256(body).hexdigest()
+        await asyncio.to_thread(self.write_body, body_hash, body)
+        self.entries.pop(key, None)
+        self.entries[key] = {
+            'url': url,
+            'status': status,
+            'body_hash': body_hash,
+            'size': len(body),
+            'headers': {name: headers[name] for name in KEPT_HEADERS if name in headers},
+            'truncated': truncated,
+            'fetched_at': now,
+            'expires_at': now + freshness_lifetime(headers, now),
+            'last_access': now
+        }
+        if self.evict():
+            await self.save_async(force=True)
+        else:
+            await self.save_async()
+
+    async def fetch(self, url):
+        """Fetch url through the cache.
+
+        Returns the dict download() describes plus how it was served in 'cache'
+        ('hit', 'revalidated', 'stale' or 'miss'). Network errors are raised
+        unless a stale copy can be served instead.
+        """
+        session = await http_client.get_session()
+        if self.directory is None:
+            return self.report(url, dict(await self.download(session, url, {}), cache='miss'))
+
+        key = url_key(url)
+        now = time.time()
+        entry = self.entries.get(key)
+        cached_body = None
+        if entry is not None:
+            try:
+                cached_body = await asyncio.to_thread(self.read_body, entry['body_hash'])
+            except OSError:
+                # The body was removed behind our back; treat it as a miss
+                self.entries.pop(key, None)
+                entry = None
+
+        if entry is not None and now < entry['expires_at']:
+            self.touch(key)
+            self.hits += 1
+            metrics.inc('bot_http_cache_total', result='hit')
+            return self.cached_response(entry, cached_body, 'hit')
+
+        conditional = {}
+        if entry is not None:
+            if entry['headers'].get('etag'):
+                conditional['If-None-Match'] = entry['headers']['etag']
+            if entry['headers'].get('last-modified'):
+                conditional['If-Modified-Since'] = entry['headers']['last-modified']
+
+        try:
+            response = await self.download(session, url, conditional)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if entry is None:
+                raise
+            # Serving a stale copy beats failing while the site is down
+            logger.warning(f"Serving stale cached copy of {url}: {e}")
+            self.touch(key)
+            metrics.inc('bot_http_cache_total', result='stale')
+            return self.cached_response(entry, cached_body, 'stale')
+
+        headers = response['headers']
+        if response['status'] == 304 and entry is not None:
+            # Unchanged; refresh the freshness window with the new headers
+            merged = dict(entry['headers'], **{name: headers[name] for name in KEPT_HEADERS if name in headers})
+            self.touch(key)
+            entry['headers'] = merged
+            entry['expires_at'] = now + freshness_lifetime(merged, now)
+            await self.save_async()
+            self.revalidated += 1
+            metrics.inc('bot_http_cache_total', result='revalidated')
+            return self.cached_response(entry, cached_body, 'revalidated')
+
+        self.misses += 1
+        metrics.inc('bot_http_cache_total', result='miss')
+        cacheable = response['status'] == 200 and not response['rejected']
+        if cacheable and 'no-store' not in headers.get('cache-control', '').lower():
+            await self.store(key, url, response['status'], headers, response['body'], now, response['truncated'])
+        return self.report(url, dict(response, cache='miss'))
+
+    def cached_response(self, entry, body, cache):
+        return {
+            'status': entry['status'],
+            'headers': entry['headers'],
+            'body': body,
+            'text': decode_body(body, entry['headers']),
+            'truncated': entry.get('truncated', False),
+            'skipped_bytes': None if entry.get('truncated') else 0,
+            'rejected': None,
+            'cache': cache
+        }
+
+    def report(self, url, response):
+        """Log and count what a download left unread."""
+        if response['rejected']:
+            logger.info(f"Skipped {url}: {response['rejected']} is not a text page")
+            metrics.inc('bot_http_skipped_total', reason='type')
+            if response['skipped_bytes']:
+                metrics.inc('bot_http_skipped_bytes_total', response['skipped_bytes'])
+        elif response['truncated']:
+            skipped = response['skipped_bytes']
+            logger.info(f"Stopped reading {url} after {len(response['body'])} bytes"
+                        f"{f', skipping {skipped} more' if skipped else ''}")
+            metrics.inc('bot_http_skipped_total', reason='size')
+            if skipped:
+                metrics.inc('bot_http_skipped_bytes_total', skipped)
+        return response
+
+    def get_stats(self):
+        return {
+            'entries': len(self.entries),
+            'bytes': self.total_bytes(),
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'revalidated': self.revalidated,
+            'misses': self.misses
+        }
+
+    def load(self):
+        if not self.directory:
+            return
+        index_path = self.directory / 'index.json'
+        if not index_path.exists():
+            return
+        try:
+            with open(index_path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+            self.entries = dict(sorted(entries.items(), key=lambda item: item[1].get('last_access', 0)))
+        except Exception as e:
+            logger.error(f"Error loading HTTP cache index: {e}")
+
+    def save(self, entries=None):
+        if not self.directory:
+            return
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            index_path = self.directory / 'index.json'
+            tmp_path = index_path.with_suffix('.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.entries if entries is None else entries, f)
+            os.replace(tmp_path, index_path)
+            self.last_save = time.monotonic()
+        except Exception as e:
+            logger.error(f"Error saving HTTP cache index: {e}")
+
+    async def save_async(self, force=False):
+        """Write the index off the event loop, at most every HTTP_CACHE_SAVE_INTERVAL seconds."""
+        if force or time.monotonic() - self.last_save >= HTTP_CACHE_SAVE_INTERVAL:
+            self.last_save = time.monotonic()
+            # Hand the thread a copy so requests can keep updating the index meanwhile
+            snapshot = {key: dict(entry) for key, entry in self.entries.items()}
+            await asyncio.to_thread(self.save, snapshot)
+
+# Create global HTTP cache instance
+http_cache = HttpCache(directory=os.path.join(DATA_DIR, 'http_cache') if HTTP_CACHE_ENABLED else None)
@@ -0,0 +1,62 @@
+import os
+import logging
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+HTTP_MAX_CONNECTIONS = int(os.getenv('HTTP_MAX_CONNECTIONS', '100'))  # Open connections across all hosts
+HTTP_MAX_PER_HOST = int(os.getenv('HTTP_MAX_PER_HOST', '8'))  # Open connections to one host
+HTTP_DNS_TTL = int(os.getenv('HTTP_DNS_TTL', '300'))  # Seconds a DNS lookup is cached
+HTTP_TIMEOUT = float(os.getenv('HTTP_TIMEOUT', '30'))  # Seconds a whole request may take
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '10'))  # Seconds to get a connection
+HTTP_USER_AGENT = os.getenv('HTTP_USER_AGENT', 'OllamaTeacherBot/1.0 (+https://github.com/Leoleojames1/OllamaDiscordTeacher)')
+
+class HttpClient:
+    """Long-lived aiohttp session shared by the crawlers and searchers.
+
+    One connection pool means keep-alive connections are reused between requests,
+    DNS answers are cached and no single host gets more than max_per_host
+    connections. Responses are requested compressed and decompressed transparently.
+    """
+
+    def __init__(self, max_connections=HTTP_MAX_CONNECTIONS, max_per_host=HTTP_MAX_PER_HOST,
+                 dns_ttl=HTTP_DNS_TTL, timeout=HTTP_TIMEOUT, connect_timeout=HTTP_CONNECT_TIMEOUT):
+        self.max_connections = max_connections
+        self.max_per_host = max_per_host
+        self.dns_ttl = dns_ttl
+        self.timeout = aiohttp.ClientTimeout(total=timeout, connect=connect_timeout)
+        self.session = None
+
+    async def open(self):
+        """Create the session; must be called from the running event loop."""
+        if self.session is not None and not self.session.closed:
+            return self.session
+        connector = aiohttp.TCPConnector(
+            limit=self.max_connections,
+            limit_per_host=self.max_per_host,
+            ttl_dns_cache=self.dns_ttl,
+            enable_cleanup_closed=True
+        )
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=self.timeout,
+            auto_decompress=True,
+            headers={'User-Agent': HTTP_USER_AGENT}
+        )
+        logger.info(f"HTTP client opened ({self.max_connections} connections, {self.max_per_host} per host)")
+        return self.session
+
+    async def get_session(self):
+        """The shared session, opened on first use if on_ready has not opened it yet."""
+        if self.session is None or self.session.closed:
+            await self.open()
+        return self.session
+
+    async def close(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        self.session = None
+
+# Create global HTTP client instance
+http_client = HttpClient()
@@ -208,7 +208,7 @@ class ImageGenerationQueue:
     async def check_sexual_content(self, prompt):
         """Check if the prompt contains sexual content using Granite Guardian."""
         try:
-            import ollama
+            from services import ollama_clients
             
             # Skip extremely short prompts (unlikely to be problematic)
             if (len(prompt.strip()) < 3):
@@ -229,8 +229,8 @@ class ImageGenerationQueue:
             # Log exactly what we're sending to the model
             logging.info(f"MODERATION REQUEST: System='{system_prompt}', User='{prompt}'")
             
-            # Create client with no timeout - let it run as long as needed
-            client = ollama.AsyncClient()
+            # Shared client with no timeout - let it run as long as needed
+            client = ollama_clients.get_client()
             
             # Super long timeout (5 minutes) - practically no timeout for normal operations
             try:
@@ -283,7 +283,7 @@ class ImageGenerationQueue:
     async def check_jailbreak_attempt(self, prompt):
         """Check if the prompt is attempting to jailbreak content filters."""
         try:
-            import ollama
+            from services import ollama_clients
             
             # Log that we're checking for jailbreak attempts
             logging.info(f"MODERATION: Checking prompt for jailbreak attempts: '{prompt}'")
@@ -300,7 +300,7 @@ class ImageGenerationQueue:
             logging.info(f"MODERATION REQUEST: System='{system_prompt}', User='{prompt}'")
             
             # Set options for deterministic results
-            client = ollama.AsyncClient()
+            client = ollama_clients.get_client()
             response = await client.chat(
                 model="granite3-guardian:8b",
                 messages=messages,
@@ -0,0 +1,357 @@
+import os
+import json
+import time
+import random
+import threading
+import hashlib
+import asyncio
+import logging
+import urllib.parse
+from collections import defaultdict, deque
+from datetime import datetime, UTC
+from pathlib import Path
+
+from metrics import metrics
+from utils import ParquetStorage
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.getenv('DATA_DIR', 'data')
+INGEST_WORKERS = int(os.getenv('INGEST_WORKERS', '4'))  # Links fetched at once by the ingestion queue
+INGEST_PER_DOMAIN = int(os.getenv('INGEST_PER_DOMAIN', '1'))  # Links fetched at once from one domain
+INGEST_DOMAIN_DELAY = float(os.getenv('INGEST_DOMAIN_DELAY', '2'))  # Seconds between requests to one domain
+INGEST_MAX_ATTEMPTS = int(os.getenv('INGEST_MAX_ATTEMPTS', '4'))  # Fetches of a link before it is marked failed
+INGEST_RETRY_DELAY = float(os.getenv('INGEST_RETRY_DELAY', '60'))  # Seconds before the first retry, doubled after each
+INGEST_SAVE_INTERVAL = 5.0  # Seconds between writes of the job file while links are being processed
+INGEST_IDLE_WAIT = 30.0  # Longest a worker sleeps before checking the queue again
+TRACKING_PARAMS = ('utm_', 'fbclid', 'gclid', 'mc_cid', 'mc_eid', 'ref_src')
+
+def normalize_url(url):
+    """Canonical form of a URL so the same page shared in different ways is fetched once."""
+    parts = urllib.parse.urlsplit(url.strip())
+    query = [
+        (key, value) for key, value in urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith(TRACKING_PARAMS)
+    ]
+    path = parts.path.rstrip('/') or '/'
+    return urllib.parse.urlunsplit((
+        parts.scheme.lower(), parts.netloc.lower(), path, urllib.parse.urlencode(query), ''
+    ))
+
+def is_video(domain):
+    return "youtube" in domain or "youtu.be" in domain
+
+class LinkIngestQueue:
+    """Durable queue that fetches shared links into each guild's knowledge directory.
+
+    Jobs are keyed by normalized URL and kept in a JSON file, so a link shared
+    many times, in several guilds or across restarts is fetched once, and jobs
+    interrupted by a restart resume where they left off. Each guild that shared
+    a link gets its own document once the link has been fetched.
+
+    A fixed set of workers processes the queue. No domain gets more than
+    per_domain requests at once or one request every domain_delay seconds.
+    Failed fetches are retried with exponential backoff up to max_attempts.
+    """
+
+    def __init__(self, path, knowledge_dir, workers=INGEST_WORKERS, per_domain=INGEST_PER_DOMAIN,
+                 domain_delay=INGEST_DOMAIN_DELAY, max_attempts=INGEST_MAX_ATTEMPTS, retry_delay=INGEST_RETRY_DELAY):
+        self.path = Path(path)
+        self.knowledge_dir = Path(knowledge_dir)
+        self.workers = workers
+        self.per_domain = per_domain
+        self.domain_delay = domain_delay
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.jobs = {}  # Maps normalized URL -> job, in the order they were queued
+        self.pending = {}  # Normalized URLs waiting to be processed, oldest first
+        self.domain_active = defaultdict(int)  # Maps domain -> fetches in progress
+        self.domain_next = {}  # Maps domain -> monotonic time its next request may start
+        self.recent = deque(maxlen=200)  # Monotonic finish times, for the processing rate
+        self.wakeup = None
+        self.tasks = []
+        self.saving = None
+        self.dirty = False
+        self.write_lock = threading.Lock()
+        self.version = 0  # Bumped for every snapshot so an older write never replaces a newer one
+        self.written_version = 0
+        self.load()
+
+    def enqueue(self, links_data, guild_id):
+        """Queue the links of a !links run for a guild; returns counts of what was queued."""
+        counts = {'queued': 0, 'known': 0, 'duplicates': 0, 'videos': 0}
+        guild_id = str(guild_id)
+        now = datetime.now(UTC).isoformat()
+        for category, links in links_data.items():
+            for link in links:
+                key = normalize_url(link['url'])
+                domain = urllib.parse.urlsplit(key).netloc
+                if not domain:
+                    continue
+                if is_video(domain):
+                    # Videos are handled separately
+                    counts['videos'] += 1
+                    continue
+                job = self.jobs.get(key)
+                if job is None:
+                    job = self.jobs[key] = {
+                        'url': link['url'], 'domain': domain, 'status': 'pending', 'attempts': 0,
+                        'next_attempt': 0.0, 'error': None, 'added': now, 'finished': None,
+                        'guilds': {}, 'written': []
+                    }
+                if guild_id in job['guilds']:
+                    counts['duplicates'] += 1
+                    continue
+                # The first share of a link in a guild is the one its document credits
+                job['guilds'][guild_id] = {
+                    'category': category,
+                    'timestamp': link['timestamp'],
+                    'author_name': link['author_name'],
+                    'author_id': link['author_id']
+                }
+                if job['status'] == 'pending' and key not in self.pending:
+                    counts['queued'] += 1
+                elif job['status'] in ('done', 'failed'):
+                    # Fetched for another guild already, where the HTTP cache makes the refetch cheap,
+                    # or failed there; either way this guild's document still has to be written
+                    job.update(status='pending', attempts=0, next_attempt=0.0, error=None)
+                    counts['known'] += 1
+                else:
+                    counts['known'] += 1
+                if job['status'] == 'pending':
+                    self.pending[key] = None
+        self.schedule_save()
+        if self.wakeup:
+            self.wakeup.set()
+        return counts
+
+    def next_job(self):
+        """The oldest due job whose domain may be fetched now, and seconds until one might be."""
+        now_wall, now = time.time(), time.monotonic()
+        wait = INGEST_IDLE_WAIT
+        for key in self.pending:
+            job = self.jobs[key]
+            domain = job['domain']
+            if job['next_attempt'] > now_wall:
+                wait = min(wait, job['next_attempt'] - now_wall)
+                continue
+            if self.domain_active[domain] >= self.per_domain:
+                continue
+            domain_wait = self.domain_next.get(domain, 0.0) - now
+            if domain_wait > 0:
+                wait = min(wait, domain_wait)
+                continue
+            return key, 0.0
+        return None, wait
+
+    async def worker(self):
+        while True:
+            key, wait = self.next_job()
+            if key is None:
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            del self.pending[key]
+            job = self.jobs[key]
+            domain = job['domain']
+            self.domain_active[domain] += 1
+            self.domain_next[domain] = time.monotonic() + self.domain_delay
+            job['status'] = 'running'
+            try:
+                await self.process(key, job)
+            except asyncio.CancelledError:
+                # Shutting down; the job resumes on the next start without losing an attempt
+                job['status'] = 'pending'
+                job['attempts'] -= 1
+                self.pending[key] = None
+                raise
+            except Exception as e:
+                self.fail(key, job, str(e))
+            finally:
+                self.domain_active[domain] -= 1
+                self.wakeup.set()
+                self.schedule_save()
+
+    async def process(self, key, job):
+        """Fetch one link and write a knowledge document for every guild that shared it."""
+        # Imported here to avoid a circular import with services
+        from services import WebCrawler
+        job['attempts'] += 1
+        page = await WebCrawler.crawl_page(job['url'])
+        if page is None:
+            self.fail(key, job, "could not be fetched")
+            return
+        if not page['content']:
+            self.finish(job, 'skipped', page['note'])
+            return
+        # Guilds can share the link while documents are being written, so loop until none is missing
+        missing = [guild_id for guild_id in job['guilds'] if guild_id not in job['written']]
+        while missing:
+            for guild_id in missing:
+                await asyncio.to_thread(self.write_document, key, job, guild_id, job['guilds'][guild_id], page['content'])
+                job['written'].append(guild_id)
+            missing = [guild_id for guild_id in job['guilds'] if guild_id not in job['written']]
+        self.finish(job, 'done', page['note'])
+
+    def write_document(self, key, job, guild_id, share, content):
+        knowledge_dir = self.knowledge_dir / guild_id
+        knowledge_dir.mkdir(parents=True, exist_ok=True)
+        document = {
+            'url': job['url'],
+            'domain': job['domain'],
+            'category': share['category'],
+            'content': content,
+            'timestamp': share['timestamp'],
+            'author_name': share['author_name'],
+            'author_id': share['author_id'],
+            'extraction_time': datetime.now(UTC).isoformat()
+        }
+        # Named by URL so a refetch replaces the document instead of adding another
+        url_hash = hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]
+        filename = f"{job['domain'].replace('.', '_')}_{url_hash}.parquet"
+        ParquetStorage.save_to_parquet(document, str(knowledge_dir / filename))
+
+    def finish(self, job, status, note=None):
+        job['status'] = status
+        job['error'] = note
+        job['finished'] = datetime.now(UTC).isoformat()
+        self.recent.append(time.monotonic())
+        metrics.inc('bot_ingest_jobs_total', status=status)
+
+    def fail(self, key, job, error):
+        """Schedule a retry with exponential backoff, or give up after max_attempts."""
+        if job['attempts'] >= self.max_attempts:
+            logger.warning(f"Giving up on {job['url']} after {job['attempts']} attempts: {error}")
+            self.finish(job, 'failed', error)
+            return
+        delay = self.retry_delay * 2 ** (job['attempts'] - 1)
+        # Jitter keeps retries of one domain from arriving together
+        job['next_attempt'] = time.time() + delay * random.uniform(0.8, 1.2)
+        job['status'] = 'pending'
+        job['error'] = error
+        self.pending[key] = None
+        metrics.inc('bot_ingest_jobs_total', status='retry')
+        logger.info(f"Retrying {job['url']} in {delay:.0f}s (attempt {job['attempts']}): {error}")
+
+    def retry_failed(self):
+        """Queue every failed link again with a fresh set of attempts; returns how many."""
+        count = 0
+        for key, job in self.jobs.items():
+            if job['status'] == 'failed':
+                job.update(status='pending', attempts=0, next_attempt=0.0, error=None)
+                self.pending[key] = None
+                count += 1
+        if count:
+            self.schedule_save()
+            if self.wakeup:
+                self.wakeup.set()
+        return count
+
+    def start(self):
+        """Start the workers; must be called from the running event loop."""
+        if self.tasks:
+            return
+        self.wakeup = asyncio.Event()
+        self.tasks = [asyncio.create_task(self.worker()) for _ in range(self.workers)]
+        if self.pending:
+            logger.info(f"Resuming link ingestion with {len(self.pending)} pending links")
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        self.save()
+
+    def get_stats(self):
+        counts = defaultdict(int)
+        guilds = defaultdict(lambda: defaultdict(int))
+        for job in self.jobs.values():
+            counts[job['status']] += 1
+            for guild_id in job['guilds']:
+                guilds[guild_id][job['status']] += 1
+        now = time.monotonic()
+        per_minute = sum(1 for finished in self.recent if now - finished < 300) / 5
+        failures = [
+            {'url': job['url'], 'error': job['error'], 'attempts': job['attempts']}
+            for job in self.jobs.values() if job['status'] == 'failed'
+        ]
+        return {
+            'total': len(self.jobs),
+            'counts': dict(counts),
+            'guilds': {guild_id: dict(status) for guild_id, status in guilds.items()},
+            'active_domains': {domain: count for domain, count in self.domain_active.items() if count},
+            'per_minute': per_minute,
+            'failures': failures[-5:],
+            'workers': len(self.tasks)
+        }
+
+    def load(self):
+        if not self.path.exists():
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.jobs = json.load(f).get('jobs', {})
+        except Exception as e:
+            logger.error(f"Error loading link ingestion jobs: {e}")
+            return
+        for key, job in self.jobs.items():
+            # Jobs that were running when the bot stopped start over
+            if job['status'] == 'running':
+                job['status'] = 'pending'
+            if job['status'] == 'pending':
+                self.pending[key] = None
+
+    def write(self, jobs, version):
+        with self.write_lock:
+            if version < self.written_version:
+                return
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix('.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'jobs': jobs}, f)
+            os.replace(tmp_path, self.path)
+            self.written_version = version
+
+    def save(self):
+        try:
+            self.version += 1
+            self.write(self.jobs, self.version)
+            self.dirty = False
+        except Exception as e:
+            logger.error(f"Error saving link ingestion jobs: {e}")
+
+    def schedule_save(self):
+        """Write the job file in the background, at most once per INGEST_SAVE_INTERVAL."""
+        self.dirty = True
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            self.save()
+            return
+        if self.saving is None or self.saving.done():
+            self.saving = asyncio.create_task(self.save_later())
+
+    async def save_later(self):
+        while self.dirty:
+            self.dirty = False
+            # Copy the jobs so the thread does not see them change mid-write
+            snapshot = {key: dict(job, guilds=dict(job['guilds']), written=list(job['written']))
+                        for key, job in self.jobs.items()}
+            self.version += 1
+            try:
+                await asyncio.to_thread(self.write, snapshot, self.version)
+            except Exception as e:
+                logger.error(f"Error saving link ingestion jobs: {e}")
+            await asyncio.sleep(INGEST_SAVE_INTERVAL)
+
+# Create global link ingestion queue instance
+link_ingest = LinkIngestQueue(
+    path=os.path.join(DATA_DIR, 'knowledge', 'ingest_jobs.json'),
+    knowledge_dir=os.path.join(DATA_DIR, 'knowledge')
+)
+metrics.describe('bot_ingest_jobs_total', "Link ingestion jobs finished, by outcome (done, skipped, failed, retry)")
+metrics.gauge('bot_ingest_pending', lambda: len(link_ingest.pending), "Links waiting in the ingestion queue")
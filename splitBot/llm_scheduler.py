@@ -0,0 +1,175 @@
+import os
+import asyncio
+import logging
+from collections import defaultdict, deque, OrderedDict
+from contextlib import asynccontextmanager
+
+logger = logging.getLogger(__name__)
+
+# Request priorities - lower numbers are served first
+PRIORITY_INTERACTIVE = 0  # Mentions and commands a user is waiting on
+PRIORITY_BACKGROUND = 1  # Profile analysis and other housekeeping
+
+LLM_MAX_INFLIGHT = int(os.getenv('LLM_MAX_INFLIGHT', '2'))  # Concurrent requests allowed per model
+
+class LLMScheduler:
+    """Admits model requests fairly with a bounded number in flight per model.
+
+    Waiting requests are grouped by priority, then by guild, then by user. Each
+    priority class is served round-robin across guilds and across the users of a
+    guild, so one busy user or server cannot starve everyone else.
+    """
+
+    def __init__(self, max_inflight_per_model=LLM_MAX_INFLIGHT):
+        self.max_inflight_per_model = max_inflight_per_model
+        self.model_limits = {}  # Per-model overrides of max_inflight_per_model
+        self.inflight = defaultdict(int)  # Maps model -> running requests
+        # Maps model -> priority -> guild -> user -> deque of waiting futures
+        self.waiting = defaultdict(lambda: defaultdict(OrderedDict))
+
+    def set_limit(self, model, limit):
+        """Override the in-flight cap for a single model."""
+        self.model_limits[model] = limit
+        self._dispatch(model)
+
+    def get_limit(self, model):
+        return self.model_limits.get(model, self.max_inflight_per_model)
+
+    @staticmethod
+    def split_user_key(user_key):
+        """Split a 'guild_user' key into its fairness groups."""
+        if not user_key:
+            return 'none', 'anonymous'
+        guild, _, user = user_key.partition('_')
+        return guild, user or guild
+
+    @asynccontextmanager
+    async def slot(self, model, user_key=None, priority=PRIORITY_INTERACTIVE, on_queued=None):
+        """Hold one in-flight slot for model while the body runs.
+
+        If the request has to wait, on_queued is awaited with its 1-based queue position.
+        """
+        await self.acquire(model, user_key, priority, on_queued)
+        try:
+            yield
+        finally:
+            self.release(model)
+
+    async def acquire(self, model, user_key=None, priority=PRIORITY_INTERACTIVE, on_queued=None):
+        """Wait until a slot for model is free and this request is next in line."""
+        if self.inflight[model] < self.get_limit(model) and not self.queue_depth(model):
+            self.inflight[model] += 1
+            return
+
+        guild, user = self.split_user_key(user_key)
+        future = asyncio.get_running_loop().create_future()
+        self.waiting[model][priority].setdefault(guild, OrderedDict()).setdefault(user, deque()).append(future)
+        logger.info(f"Queued {model} request for {user_key} (priority {priority})")
+
+        if on_queued:
+            try:
+                await on_queued(self.get_position(model, future))
+            except Exception as e:
+                logger.error(f"Error sending queue position: {e}")
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # We were admitted just before being cancelled, so hand the slot on
+                self.release(model)
+            else:
+                self._discard(model, future)
+            raise
+
+    def release(self, model):
+        """Free a slot and admit the next waiting request."""
+        self.inflight[model] = max(0, self.inflight[model] - 1)
+        self._dispatch(model)
+
+    def _dispatch(self, model):
+        while self.inflight[model] < self.get_limit(model):
+            future = self._pop_next(model)
+            if future is None:
+                return
+            self.inflight[model] += 1
+            future.set_result(True)
+
+    def _pop_next(self, model):
+        """Take the next waiter in priority, guild round-robin, user round-robin order."""
+        for priority in sorted(self.waiting[model]):
+            guilds = self.waiting[model][priority]
+            while guilds:
+                guild, users = next(iter(guilds.items()))
+                user, queue = next(iter(users.items()))
+                future = queue.popleft()
+                # Rotate the user and guild to the back so others go next
+                users.move_to_end(user)
+                if not queue:
+                    del users[user]
+                guilds.move_to_end(guild)
+                if not users:
+                    del guilds[guild]
+                if not future.done():
+                    return future
+        return None
+
+    def _discard(self, model, future):
+        for guilds in self.waiting[model].values():
+            for guild, users in list(guilds.items()):
+                for user, queue in list(users.items()):
+                    if future in queue:
+                        queue.remove(future)
+                        if not queue:
+                            del users[user]
+                        if not users:
+                            del guilds[guild]
+                        return
+
+    def _service_order(self, model):
+        """List waiting futures in the order they would be admitted."""
+        order = []
+        for priority in sorted(self.waiting[model]):
+            guilds = OrderedDict(
+                (guild, OrderedDict((user, deque(queue)) for user, queue in users.items()))
+                for guild, users in self.waiting[model][priority].items()
+            )
+            while guilds:
+                guild, users = next(iter(guilds.items()))
+                user, queue = next(iter(users.items()))
+                order.append(queue.popleft())
+                users.move_to_end(user)
+                if not queue:
+                    del users[user]
+                guilds.move_to_end(guild)
+                if not users:
+                    del guilds[guild]
+        return order
+
+    def get_position(self, model, future):
+        """1-based position of a waiting request in the admission order."""
+        order = [f for f in self._service_order(model) if not f.done()]
+        return order.index(future) + 1 if future in order else 0
+
+    def queue_depth(self, model):
+        return sum(
+            len(queue)
+            for guilds in self.waiting[model].values()
+            for users in guilds.values()
+            for queue in users.values()
+        )
+
+    def get_queue_status(self):
+        """Get in-flight and waiting counts for every model seen so far"""
+        models = set(self.inflight) | set(self.waiting)
+        return {
+            model: {
+                'in_flight': self.inflight[model],
+                'waiting': self.queue_depth(model),
+                'limit': self.get_limit(model)
+            }
+            for model in sorted(models)
+        }
+
+# Create global scheduler instance
+llm_scheduler = LLMScheduler()
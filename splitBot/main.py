@@ -7,6 +7,7 @@ import json
 from pathlib import Path
 from collections import defaultdict
 import signal
+import time
 from io import BytesIO
 
 from dotenv import load_dotenv
@@ -16,10 +17,20 @@ from discord.ext import commands, tasks
 # Import our modules
 from utils import (
     send_in_chunks, get_user_key, store_user_conversation, 
-    process_file_attachment, process_image_attachment, SYSTEM_PROMPT
+    process_file_attachment, process_image_attachment, SYSTEM_PROMPT, StreamingMessage, queue_notifier,
+    MAX_CONVERSATION_LOG_SIZE
+)
+from context_builder import build_context, trim_history
+from conversation_memory import conversation_compactor
+from services import (
+    get_ollama_response, process_image_with_llava, close_services, model_manager
 )
-from services import get_ollama_response, process_image_with_llava
 from commands import register_commands
+from metrics import metrics
+from usage_log import current_command, usage_log
+from http_client import http_client
+from link_ingest import link_ingest
+from profile_analysis import profile_analyzer, PROFILE_ANALYSIS_INTERVAL
 
 # Load environment variables from .env file
 load_dotenv()
@@ -31,7 +42,7 @@ logging.info(f"Config.py MODEL_NAME: {CONFIG_MODEL_NAME}")
 
 # Update the logging configuration
 logging.basicConfig(
-    level=logging.ERROR,  # Change from WARNING to ERROR to reduce verbosity further
+    level=getattr(logging, os.getenv('LOG_LEVEL', 'ERROR').upper(), logging.ERROR),  # ERROR unless LOG_LEVEL says otherwise
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 
@@ -48,6 +59,7 @@ logger = logging.getLogger(__name__)
 TOKEN = os.getenv('DISCORD_TOKEN')
 DATA_DIR = os.getenv('DATA_DIR', 'data')
 CHANGE_NICKNAME = True  # Set to True to change nickname, False to keep the default
+STREAM_RESPONSES = os.getenv('STREAM_RESPONSES', 'true').lower() == 'true'  # Show chat replies while they generate
 
 # Create data directories
 Path(DATA_DIR).mkdir(parents=True, exist_ok=True)
@@ -83,6 +95,22 @@ bot.remove_command('help')  # Remove the default help command
 # Register all command handlers
 register_commands(bot, USER_CONVERSATIONS, COMMAND_MEMORY, conversation_logs, USER_PROFILES_DIR)
 
+@bot.before_invoke
+async def start_command_timer(ctx):
+    ctx.metrics_started = time.perf_counter()
+    # Attribute the generations this command makes to it in the usage log
+    current_command.set(ctx.command.qualified_name if ctx.command else None)
+
+@bot.after_invoke
+async def record_command_metrics(ctx):
+    """Record how long each command took, labelled by command name."""
+    started = getattr(ctx, 'metrics_started', None)
+    if started is None or ctx.command is None:
+        return
+    metrics.observe('bot_command_seconds', time.perf_counter() - started, command=ctx.command.qualified_name)
+    metrics.inc('bot_command_total', command=ctx.command.qualified_name,
+                status='error' if ctx.command_failed else 'ok')
+
 async def setup_slash_commands():
     """Set up Discord slash commands."""
     logging.info("Setting up slash commands...")
@@ -123,6 +151,8 @@ https://github.com/Leoleojames1/OllamaDiscordTeacher/tree/master
         user_key = f"{interaction.guild_id}_{interaction.user.id}"
         USER_CONVERSATIONS[user_key] = [{'role': 'system', 'content': SYSTEM_PROMPT}]
         COMMAND_MEMORY[user_key].clear()
+        conversation_compactor.forget(user_key)
+        profile_analyzer.forget(user_key)
         await interaction.response.send_message("✅ Your conversation context has been reset.", ephemeral=True)
     
     @bot.tree.command(name="profile", description="View your learning profile")
@@ -299,7 +329,9 @@ async def on_message(message: Message):
                     # Get description from vision model
                     vision_response = await process_image_with_llava(
                         image_data, 
-                        f"Describe this image in detail, addressing this query: {content}"
+                        f"Describe this image in detail, addressing this query: {content}",
+                        user_key=user_key,
+                        on_queued=queue_notifier(message.channel, message)
                     )
                     
                     await send_in_chunks(message.channel, 
@@ -333,14 +365,22 @@ async def on_message(message: Message):
             
         # Handle conversation for non-command mentions
         else:
+            chat_started = time.perf_counter()
+            chat_status = 'ok'
+            current_command.set('chat')
             try:
                 # Get selected model name
                 model_name = os.getenv('OLLAMA_MODEL', 'Unknown model')
                 
-                # Ensure we pass the correct conversation history to the model
-                # Create messages for the current conversation
-                messages_for_model = conversation_logs.copy()
-                messages_for_model.append({'role': 'user', 'content': f"{user_name} asks: {content}"})
+                # Fit the system prompt, the newest turns and this question into the token budget
+                user_turn = {'role': 'user', 'content': f"{user_name} asks: {content}"}
+                messages_for_model = build_context(
+                    conversation_logs, user_turn, max_messages=MAX_CONVERSATION_LOG_SIZE,
+                    summary=conversation_compactor.summary_message('global')
+                )
+                
+                # Post partial output as it arrives when streaming is enabled
+                streamer = StreamingMessage(message.channel, reference=message) if STREAM_RESPONSES else None
                 
                 # Get a response from the model with conversation history
                 async with message.channel.typing():
@@ -349,35 +389,50 @@ async def on_message(message: Message):
                         content,
                         with_context=True,
                         conversation_history=messages_for_model,
-                        timeout=180.0  # Increase timeout for complex requests
+                        timeout=180.0,  # Increase timeout for complex requests
+                        on_token=streamer.push if streamer else None,
+                        use_cache=False,  # Conversation replies should not repeat earlier answers
+                        user_key=user_key,
+                        on_queued=queue_notifier(message.channel, message)
                     )
                 
                 # Only continue if we got a valid response
                 if response and isinstance(response, str) and len(response.strip()) > 0:
                     # Check for any weird content insertions by limiting to a reasonable response length
-                    if len(response) > 10000:  # Increase max length
+                    if len(response) > 10000 and not streamer:  # Increase max length
                         response = response[:10000] + "\n\n[Response truncated due to length]"
                     
+                    # Add to conversation logs without the footer so it does not cost prompt tokens later
+                    conversation_logs.append(user_turn)
+                    conversation_logs.append({'role': 'assistant', 'content': response})
+                    # Fold older turns into the rolling summary in the background; the trim is a backstop
+                    conversation_compactor.schedule('global', conversation_logs, evict=True)
+                    trim_history(conversation_logs, MAX_CONVERSATION_LOG_SIZE)
+                    
                     # Add model name as a footer
                     response += f"\n\n---\n*Response generated using {model_name}*"
                     
-                    # Add to conversation logs
-                    conversation_logs.append({'role': 'user', 'content': f"{user_name} asks: {content}"})
-                    conversation_logs.append({'role': 'assistant', 'content': response})
-                    
                     # Store in user history
                     await store_user_conversation(message, response, is_bot=True)
                     
-                    # Use improved chunking for sending messages
-                    await send_in_chunks(message.channel, response, message, chunk_size=1950)  # Smaller chunks for safety
+                    if streamer:
+                        # Most of the reply is already visible; add the footer and any unshown text
+                        await streamer.finish(response)
+                    else:
+                        # Use improved chunking for sending messages
+                        await send_in_chunks(message.channel, response, message, chunk_size=1950)  # Smaller chunks for safety
                     
                     # Also update the per-user conversation history
                     USER_CONVERSATIONS[user_key].append({'role': 'user', 'content': content, 'timestamp': datetime.now(UTC).isoformat()})
                     USER_CONVERSATIONS[user_key].append({'role': 'assistant', 'content': response, 'timestamp': datetime.now(UTC).isoformat()})
             
             except Exception as e:
+                chat_status = 'error'
                 logging.error(f"Error processing message: {e}")
                 await message.channel.send(f"⚠️ {user_name}, an error occurred: {str(e)}")
+            
+            metrics.observe('bot_command_seconds', time.perf_counter() - chat_started, command='chat')
+            metrics.inc('bot_command_total', command='chat', status=chat_status)
 
 async def change_nickname(guild):
     """Change the bot's nickname in the specified guild."""
@@ -400,8 +455,26 @@ async def on_ready():
         await setup_slash_commands()
         await bot.tree.sync()  # Sync commands with Discord
         
+        # Serve Prometheus metrics locally
+        await metrics.start_server()
+        metrics.start_lag_monitor()
+        
+        # Open the HTTP connection pool shared by the crawlers and searchers
+        await http_client.open()
+        
+        # Resume extracting the content of links queued by !links
+        link_ingest.start()
+        
         # Start periodic tasks
         analyze_user_profiles.start()
+        manage_model_residency.start()
+        check_ollama_hosts.start()
+        compact_conversations.start()
+        
+        # Preload the selected models so the first conversation does not pay the load time
+        for model_name, is_vision in ((os.getenv('OLLAMA_MODEL'), False), (os.getenv('OLLAMA_VISION_MODEL'), True)):
+            if model_name:
+                await model_manager.load_model(model_name, is_vision=is_vision)
         
         # Initialize user data storage
         for guild in bot.guilds:
@@ -444,80 +517,73 @@ async def on_ready():
     except Exception as e:
         logging.error(f'Error in on_ready: {e}')
 
-@tasks.loop(minutes=30)
+@tasks.loop(seconds=PROFILE_ANALYSIS_INTERVAL)
 async def analyze_user_profiles():
-    """Analyze user conversations and update profiles periodically."""
+    """Analyze the conversations of users with new messages and update their profiles."""
     try:
-        for user_key, conversations in USER_CONVERSATIONS.items():
-            # Skip if doesn't match expected format
-            if '_' not in user_key:
-                continue
-                
-            try:
-                guild_id, user_id = user_key.split('_')
-                user_id = int(user_id)
-            except ValueError:
-                continue
-            
-            # Get user messages only
-            user_messages = [
-                conv['content'] for conv in conversations 
-                if conv['role'] == 'user'
-            ]
-            
-            if not user_messages:
-                continue
-                
-            # Create analysis prompt
-            analysis_prompt = f"""Analyze these user messages and extract key information:
-{chr(10).join(user_messages[-50:])}
-
-Please identify:
-1. Main topics of interest
-2. Technical skill level
-3. Common questions or patterns
-4. Learning progress
-5. Key concepts discussed
-
-Format the response as concise bullet points."""
-            
-            # Get AI analysis
-            analysis = await get_ollama_response(analysis_prompt, with_context=False)
-            
-            # Save to user profile
-            profile_path = os.path.join(USER_PROFILES_DIR, f"{user_key}_profile.json")
-            username = bot.get_user(user_id).name if bot.get_user(user_id) else 'Unknown'
-            profile_data = {
-                'timestamp': datetime.now(UTC).isoformat(),
-                'analysis': analysis,
-                'username': username
-            }
-            
-            with open(profile_path, 'w', encoding='utf-8') as f:
-                json.dump(profile_data, f, indent=2)
-                
+        def get_username(user_id):
+            user = bot.get_user(user_id)
+            return user.name if user else None
+        
+        await profile_analyzer.run(USER_CONVERSATIONS, get_username)
     except Exception as e:
         logging.error(f"Error in analyze_user_profiles: {e}")
 
-def signal_handler(sig, frame):
-    """Handle interrupt signals to shut down gracefully."""
+@tasks.loop(minutes=10)
+async def compact_conversations():
+    """Summarize older turns of each user's history into their rolling memory."""
+    try:
+        for user_key, conversations in list(USER_CONVERSATIONS.items()):
+            if len(conversation_compactor.pending_turns(conversations)) >= conversation_compactor.batch_size:
+                await conversation_compactor.compact(user_key, conversations)
+        stats = conversation_compactor.stats()
+        logging.info(f"Conversation summaries saved {stats['avg_tokens_saved_per_request']:.0f} prompt tokens per request")
+    except Exception as e:
+        logging.error(f"Error in compact_conversations: {e}")
+
+@tasks.loop(seconds=30)
+async def check_ollama_hosts():
+    """Health-check the Ollama hosts so failed ones are ejected and recovered ones re-admitted."""
+    try:
+        await model_manager.refresh_loaded_models(force=True)
+    except Exception as e:
+        logging.error(f"Error in check_ollama_hosts: {e}")
+    # record() only checks the flush interval when a generation finishes; a quiet bot would hold its last records
+    usage_log.flush_if_due()
+
+@tasks.loop(minutes=5)
+async def manage_model_residency():
+    """Unload models that have been idle for longer than MODEL_IDLE_UNLOAD."""
+    try:
+        await model_manager.unload_idle_models()
+    except Exception as e:
+        logging.error(f"Error in manage_model_residency: {e}")
+
+def request_shutdown():
+    """Handle interrupt signals by closing the bot, which ends run_bot()."""
     logging.info("Interrupt received, shutting down...")
-    # Cancel all running tasks
-    tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
-    for task in tasks:
-        task.cancel()
-    # Run cleanup code if needed
-    logging.info("Bot shutdown complete.")
-    # Exit cleanly
-    asyncio.get_event_loop().stop()
+    asyncio.create_task(bot.close())
+
+async def run_bot():
+    """Run the bot until it closes, then release the shared services."""
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, request_shutdown)
+        except NotImplementedError:
+            # Windows has no loop signal handlers; Ctrl+C still cancels run_bot and reaches the cleanup below
+            pass
+    try:
+        await bot.start(TOKEN)
+    finally:
+        # Runs inside this task, so asyncio.run waits for it instead of cancelling it
+        await bot.close()
+        await link_ingest.stop()
+        await close_services()
 
 def main():
     """Main function to run the bot."""
-    # Setup signal handlers
-    signal.signal(signal.SIGINT, signal_handler)
-    signal.signal(signal.SIGTERM, signal_handler)
-    
-    bot.run(TOKEN)
+    asyncio.run(run_bot())
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,236 @@
+import os
+import time
+import asyncio
+import bisect
+import logging
+from collections import defaultdict
+from contextlib import contextmanager
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')  # Interface the metrics endpoint listens on
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9108'))  # Port of the Prometheus endpoint (0 disables it)
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)  # Histogram bounds in seconds
+LOOP_LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)  # Event loop lag bounds in seconds
+LOOP_LAG_INTERVAL = 0.5  # Seconds between event loop lag probes
+
+def label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_labels(key, extra=None):
+    pairs = list(key) + list(extra or [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{escape_label(v)}"' for k, v in pairs) + "}"
+
+class Histogram:
+    """Cumulative latency histogram with fixed bucket bounds."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last slot is the +Inf bucket
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def quantile(self, fraction):
+        """Estimate a quantile by interpolating inside the bucket that contains it."""
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                if i == len(self.buckets):
+                    return lower
+                return lower + (self.buckets[i] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+class MetricsRegistry:
+    """Counters, latency histograms and gauges, rendered in Prometheus text format.
+
+    Counters and histograms are keyed by name and labels. Gauges are callbacks
+    that are read at scrape time, so queue depths are always current.
+    """
+
+    def __init__(self):
+        self.descriptions = {}  # Maps metric name -> help text
+        self.counters = defaultdict(float)  # Maps (name, labels) -> value
+        self.histograms = {}  # Maps (name, labels) -> Histogram
+        self.gauges = {}  # Maps name -> callback returning {labels dict tuple: value} or a number
+        self.buckets = {}  # Maps histogram name -> bucket bounds, if not LATENCY_BUCKETS
+        self.started = time.time()
+        self.runner = None
+        self.lag_task = None
+        self.max_loop_lag = 0.0
+
+    def describe(self, name, text, buckets=None):
+        self.descriptions[name] = text
+        if buckets:
+            self.buckets[name] = buckets
+
+    def inc(self, name, value=1, **labels):
+        self.counters[(name, label_key(labels))] += value
+
+    def observe(self, name, value, **labels):
+        key = (name, label_key(labels))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(self.buckets.get(name, LATENCY_BUCKETS))
+        histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Time a block into the name histogram and count it by outcome in name_total."""
+        started = time.perf_counter()
+        status = 'ok'
+        try:
+            yield
+        except BaseException:
+            status = 'error'
+            raise
+        finally:
+            self.observe(f"{name}_seconds", time.perf_counter() - started, **labels)
+            self.inc(f"{name}_total", status=status, **labels)
+
+    @contextmanager
+    def stage(self, stage, source):
+        """Time one stage of a request into bot_stage_seconds."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('bot_stage_seconds', time.perf_counter() - started, stage=stage, source=source)
+
+    def gauge(self, name, callback, text=None):
+        """Register a gauge read from callback() at scrape time."""
+        self.gauges[name] = callback
+        if text:
+            self.describe(name, text)
+
+    def read_gauges(self):
+        values = {}
+        for name, callback in self.gauges.items():
+            try:
+                result = callback()
+            except Exception as e:
+                logger.error(f"Error reading gauge {name}: {e}")
+                continue
+            if isinstance(result, dict):
+                values[name] = {label_key(dict(labels)): value for labels, value in result.items()}
+            else:
+                values[name] = {(): result}
+        return values
+
+    def render(self):
+        """Render every metric in the Prometheus text exposition format."""
+        lines = []
+
+        def header(name, kind):
+            if name in self.descriptions:
+                lines.append(f"# HELP {name} {self.descriptions[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        for name in sorted({name for name, _ in self.counters}):
+            header(name, 'counter')
+            for (metric, key), value in sorted(self.counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{format_labels(key)} {value:g}")
+
+        for name in sorted({name for name, _ in self.histograms}):
+            header(name, 'histogram')
+            for (metric, key), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(list(histogram.buckets) + ['+Inf'], histogram.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{format_labels(key, [('le', bound)])} {cumulative}")
+                lines.append(f"{name}_sum{format_labels(key)} {histogram.total:.6f}")
+                lines.append(f"{name}_count{format_labels(key)} {histogram.count}")
+
+        for name, series in sorted(self.read_gauges().items()):
+            header(name, 'gauge')
+            for key, value in sorted(series.items()):
+                lines.append(f"{name}{format_labels(key)} {value:g}")
+
+        header('bot_uptime_seconds', 'gauge')
+        lines.append(f"bot_uptime_seconds {time.time() - self.started:.0f}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self, name):
+        """Count, p50 and p95 of each label set of a histogram, busiest first."""
+        rows = []
+        for (metric, key), histogram in self.histograms.items():
+            if metric == name:
+                rows.append((dict(key), histogram.count, histogram.quantile(0.5), histogram.quantile(0.95)))
+        return sorted(rows, key=lambda row: row[1], reverse=True)
+
+    def counter_total(self, name, **labels):
+        """Sum a counter over every label set that matches labels."""
+        wanted = set(label_key(labels))
+        return sum(value for (metric, key), value in self.counters.items() if metric == name and wanted <= set(key))
+
+    async def watch_loop_lag(self, interval=LOOP_LAG_INTERVAL):
+        """Measure how late the event loop wakes from a sleep; anything blocking it shows up here."""
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(interval)
+            lag = max(0.0, time.perf_counter() - started - interval)
+            self.max_loop_lag = max(self.max_loop_lag, lag)
+            self.observe('bot_event_loop_lag_seconds', lag)
+
+    def start_lag_monitor(self):
+        """Start probing event loop lag; must be called from the running event loop."""
+        if self.lag_task is None or self.lag_task.done():
+            self.lag_task = asyncio.create_task(self.watch_loop_lag())
+
+    async def handle_metrics(self, request):
+        return web.Response(text=self.render(), content_type='text/plain', charset='utf-8',
+                            headers={'X-Content-Type-Options': 'nosniff'})
+
+    async def start_server(self, host=METRICS_HOST, port=METRICS_PORT):
+        """Serve /metrics over HTTP; does nothing if disabled or already running."""
+        if not port or self.runner:
+            return
+        app = web.Application()
+        app.router.add_get('/metrics', self.handle_metrics)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        try:
+            await web.TCPSite(runner, host, port).start()
+        except OSError as e:
+            logger.error(f"Could not start metrics endpoint on {host}:{port}: {e}")
+            await runner.cleanup()
+            return
+        self.runner = runner
+        logger.info(f"Metrics available at http://{host}:{port}/metrics")
+
+    async def stop_server(self):
+        if self.lag_task:
+            self.lag_task.cancel()
+            self.lag_task = None
+        if self.runner:
+            await self.runner.cleanup()
+            self.runner = None
+
+# Create global metrics registry instance
+metrics = MetricsRegistry()
+metrics.describe('bot_command_seconds', "Time to handle a bot command or mention chat")
+metrics.describe('bot_command_total', "Bot commands handled, by outcome")
+metrics.describe('bot_event_loop_lag_seconds', "How late the event loop ran a scheduled wakeup", buckets=LOOP_LAG_BUCKETS)
+metrics.describe('bot_stage_seconds', "Time spent in one stage of a request (fetch, parse, prefill, generate, send)")
+metrics.describe('bot_llm_request_seconds', "Time for a model request including queueing")
+metrics.describe('bot_llm_request_total', "Model requests, by outcome")
+metrics.describe('bot_llm_tokens_total', "Prompt and output tokens reported by Ollama, by model")
+metrics.describe('bot_llm_first_token_seconds', "Time from sending a model request to its first streamed token")
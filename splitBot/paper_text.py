@@ -0,0 +1,185 @@
+import io
+import os
+import re
+import math
+import asyncio
+import logging
+from collections import Counter, defaultdict
+
+import aiohttp
+import pandas as pd
+
+from metrics import metrics
+from process_pool import process_pool
+from http_client import http_client
+from utils import ParquetStorage
+
+# pypdf is optional; without it full-text mode is unavailable
+try:
+    import pypdf
+    PYPDF_AVAILABLE = True
+except ImportError:
+    PYPDF_AVAILABLE = False
+    logging.warning("pypdf package not installed. To use the --full flag, run: pip install pypdf")
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.getenv('DATA_DIR', 'data')
+ARXIV_PDF_MAX_BYTES = int(os.getenv('ARXIV_PDF_MAX_BYTES', str(25 * 1024 * 1024)))  # Larger PDFs are refused
+ARXIV_PDF_TIMEOUT = float(os.getenv('ARXIV_PDF_TIMEOUT', '60'))  # Seconds a PDF download may take
+PAPER_CHUNK_CHARS = int(os.getenv('PAPER_CHUNK_CHARS', '2000'))  # Length of a full-text chunk
+PAPER_CHUNK_OVERLAP = 200  # Characters repeated between neighbouring chunks
+PAPER_CONTEXT_CHUNKS = int(os.getenv('PAPER_CONTEXT_CHUNKS', '6'))  # Chunks put into a prompt across all papers
+
+# A heading is a short line like "3.2 Scaled Dot-Product Attention" or a well-known unnumbered section name
+HEADING_PATTERN = re.compile(
+    r'^(?:\d+(?:\.\d+)*\.?\s+[A-Z][^.!?]{2,80}'
+    r'|(?:Abstract|Introduction|Background|Related Work|Method(?:s|ology)?|Experiments?|Results'
+    r'|Discussion|Conclusions?|Acknowledge?ments|Appendix.{0,60}))$'
+)
+END_PATTERN = re.compile(r'^(?:\d+\.?\s+)?(?:References|Bibliography)$', re.IGNORECASE)
+STOPWORDS = {
+    'the', 'and', 'for', 'are', 'was', 'what', 'how', 'why', 'does', 'this', 'that', 'with',
+    'from', 'which', 'their', 'there', 'about', 'into', 'can', 'use', 'used', 'paper', 'papers'
+}
+
+def split_sections(text):
+    """Split extracted paper text into (section, text) pairs, stopping at the references."""
+    sections = []
+    title, lines = 'Front matter', []
+    for line in text.splitlines():
+        stripped = line.strip()
+        if END_PATTERN.match(stripped):
+            break
+        if HEADING_PATTERN.match(stripped):
+            if lines:
+                sections.append({'section': title, 'text': ' '.join(lines)})
+            title, lines = stripped, []
+        elif stripped:
+            lines.append(stripped)
+    if lines:
+        sections.append({'section': title, 'text': ' '.join(lines)})
+    return sections
+
+def extract_pdf_sections(pdf_bytes):
+    """Extract a PDF's text page by page and split it into sections. Runs in a worker process."""
+    reader = pypdf.PdfReader(io.BytesIO(pdf_bytes))
+    pages = []
+    for page in reader.pages:
+        try:
+            pages.append(page.extract_text() or '')
+        except Exception as e:
+            # One unreadable page should not lose the rest of the paper
+            logger.warning(f"Could not extract a PDF page: {e}")
+    # Rejoin words hyphenated across line breaks
+    text = re.sub(r'(\w)-\n(\w)', r'\1\2', '\n'.join(pages))
+    return split_sections(text)
+
+def chunk_sections(sections, chunk_chars=PAPER_CHUNK_CHARS, overlap=PAPER_CHUNK_OVERLAP):
+    """Cut each section into overlapping chunks that end on word boundaries."""
+    chunks = []
+    for section in sections:
+        text = section['text']
+        start = 0
+        while start < len(text):
+            end = min(len(text), start + chunk_chars)
+            if end < len(text):
+                space = text.rfind(' ', start + chunk_chars // 2, end)
+                end = space if space > 0 else end
+            chunks.append({'chunk_index': len(chunks), 'section': section['section'], 'text': text[start:end].strip()})
+            if end >= len(text):
+                break
+            start = max(start + 1, end - overlap)
+    return chunks
+
+def terms(text):
+    return [word for word in re.findall(r'[a-z0-9]{3,}', text.lower()) if word not in STOPWORDS]
+
+def select_chunks(chunks, question, limit=PAPER_CONTEXT_CHUNKS):
+    """Pick the chunks most relevant to question with BM25 scoring, in document order."""
+    query = set(terms(question))
+    if not chunks or not query:
+        return chunks[:limit]
+
+    counts = [Counter(terms(chunk['text'])) for chunk in chunks]
+    lengths = [sum(count.values()) or 1 for count in counts]
+    average = sum(lengths) / len(lengths)
+    document_frequency = {term: sum(1 for count in counts if term in count) for term in query}
+
+    def score(index):
+        total = 0.0
+        for term in query:
+            tf = counts[index][term]
+            if not tf:
+                continue
+            idf = math.log(1 + (len(chunks) - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5))
+            total += idf * tf * 2.2 / (tf + 1.2 * (0.25 + 0.75 * lengths[index] / average))
+        return total
+
+    ranked = sorted(range(len(chunks)), key=score, reverse=True)[:limit]
+    return [chunks[index] for index in sorted(ranked)]
+
+class PaperFullText:
+    """Downloads arXiv PDFs and turns them into chunks a prompt can draw from.
+
+    Each paper is downloaded and extracted once; its chunks are stored next to
+    the paper's Parquet file and loaded from there afterwards. Concurrent
+    requests for the same paper wait for the first extraction.
+    """
+
+    def __init__(self, papers_dir, max_bytes=ARXIV_PDF_MAX_BYTES, chunk_chars=PAPER_CHUNK_CHARS):
+        self.papers_dir = papers_dir
+        self.max_bytes = max_bytes
+        self.chunk_chars = chunk_chars
+        self.locks = defaultdict(asyncio.Lock)  # One lock per paper so concurrent callers share an extraction
+        self.extracted = 0
+        self.cache_hits = 0
+
+    def chunks_path(self, arxiv_id):
+        return os.path.join(self.papers_dir, f"{arxiv_id}_chunks.parquet")
+
+    async def download_pdf(self, url):
+        """Stream a PDF into memory, giving up once it passes max_bytes."""
+        session = await http_client.get_session()
+        with metrics.stage('fetch', 'arxiv_pdf'):
+            async with session.get(url, timeout=aiohttp.ClientTimeout(total=ARXIV_PDF_TIMEOUT)) as response:
+                response.raise_for_status()
+                if (response.content_length or 0) > self.max_bytes:
+                    raise ValueError(f"PDF is larger than {self.max_bytes // (1024 * 1024)} MB")
+                buffer = bytearray()
+                async for block in response.content.iter_chunked(64 * 1024):
+                    buffer.extend(block)
+                    if len(buffer) > self.max_bytes:
+                        raise ValueError(f"PDF is larger than {self.max_bytes // (1024 * 1024)} MB")
+        if not buffer.startswith(b'%PDF'):
+            raise ValueError("The download is not a PDF")
+        return bytes(buffer)
+
+    async def get_chunks(self, paper_info):
+        """The full-text chunks of a paper, extracting them on first use."""
+        if not PYPDF_AVAILABLE:
+            raise ValueError("Full-text mode needs the pypdf package. Install it with: pip install pypdf")
+        arxiv_id = paper_info['arxiv_id']
+        async with self.locks[arxiv_id]:
+            path = self.chunks_path(arxiv_id)
+            cached = await asyncio.to_thread(ParquetStorage.load_from_parquet, path)
+            if cached is not None:
+                self.cache_hits += 1
+                return cached.to_dict('records')
+
+            pdf_bytes = await self.download_pdf(paper_info['pdf_link'])
+            with metrics.stage('parse', 'arxiv_pdf'):
+                sections = await process_pool.run(extract_pdf_sections, pdf_bytes)
+            chunks = [dict(chunk, arxiv_id=arxiv_id) for chunk in chunk_sections(sections, self.chunk_chars)]
+            # Store even an empty result so scanned PDFs without text are not downloaded again
+            frame = pd.DataFrame(chunks, columns=['arxiv_id', 'chunk_index', 'section', 'text'])
+            await asyncio.to_thread(ParquetStorage.save_to_parquet, frame, path)
+            self.extracted += 1
+            logger.info(f"Extracted {len(chunks)} chunks from {len(sections)} sections of {arxiv_id}")
+            return chunks
+
+    def get_stats(self):
+        return {'extracted': self.extracted, 'cache_hits': self.cache_hits}
+
+# Create global full-text instance
+paper_fulltext = PaperFullText(papers_dir=os.path.join(DATA_DIR, 'papers'))
@@ -0,0 +1,57 @@
+import os
+import asyncio
+import logging
+import functools
+import concurrent.futures
+
+logger = logging.getLogger(__name__)
+
+def available_cores():
+    """Cores this process may run on, which can be fewer than the machine has."""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+# One core is left to the event loop by default
+WORKER_PROCESSES = int(os.getenv('WORKER_PROCESSES') or max(1, available_cores() - 1))  # Processes for CPU-heavy parsing (0 runs it in a thread)
+
+class ProcessPool:
+    """Runs CPU-heavy work such as PDF and HTML parsing in worker processes.
+
+    Keeps the event loop and the GIL free for the bot while PDFs and pages are
+    parsed. The pool is created on first use; functions passed to run() must be
+    module-level so they can be pickled.
+    """
+
+    def __init__(self, workers=WORKER_PROCESSES):
+        self.workers = workers
+        self.executor = None
+        self.submitted = 0
+
+    def get_executor(self):
+        if self.executor is None and self.workers > 0:
+            self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers)
+        return self.executor
+
+    async def run(self, func, *args, **kwargs):
+        """Run func(*args, **kwargs) in a worker process and await its result."""
+        self.submitted += 1
+        call = functools.partial(func, *args, **kwargs)
+        executor = self.get_executor()
+        if executor is None:
+            return await asyncio.to_thread(call)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(executor, call)
+        except concurrent.futures.process.BrokenProcessPool:
+            # A crashed worker breaks the pool; start a fresh one for the next call
+            logger.error("Worker process pool broke, restarting it")
+            self.executor = None
+            raise
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+
+# Create global process pool instance
+process_pool = ProcessPool()
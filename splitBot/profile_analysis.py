@@ -0,0 +1,269 @@
+import os
+import json
+import hashlib
+import time
+import asyncio
+import logging
+from datetime import datetime, UTC
+from pathlib import Path
+
+from usage_log import current_command
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.getenv('DATA_DIR', 'data')
+PROFILE_ANALYSIS_INTERVAL = float(os.getenv('PROFILE_ANALYSIS_INTERVAL', '1800'))  # Seconds between profile analysis runs
+PROFILE_ANALYSIS_CONCURRENCY = int(os.getenv('PROFILE_ANALYSIS_CONCURRENCY', '4'))  # Model calls made at once during a profile run
+PROFILE_CHUNK_MESSAGES = int(os.getenv('PROFILE_CHUNK_MESSAGES', '20'))  # User messages summarized together
+PROFILE_MAX_CHUNKS_PER_RUN = int(os.getenv('PROFILE_MAX_CHUNKS_PER_RUN', '4'))  # Chunks merged into a profile per run
+PROFILE_ANALYSIS_SPREAD = 0.8  # Fraction of the interval over which a run's analyses are started
+PROFILE_CHUNK_CHARS = 6000  # A chunk is closed early once its messages reach this length
+PROFILE_MESSAGE_MAX_CHARS = 1500  # Longer messages are cut before being summarized
+PROFILE_CHUNK_CACHE_SIZE = 5000  # Chunk summaries kept, oldest dropped first
+
+def newest_user_message(conversations):
+    """Timestamp of the newest user message in a conversation, or None."""
+    timestamps = [
+        m['timestamp'] for m in conversations
+        if m.get('role') == 'user' and m.get('timestamp')
+    ]
+    return max(timestamps) if timestamps else None
+
+def chunk_messages(messages, max_messages=PROFILE_CHUNK_MESSAGES, max_chars=PROFILE_CHUNK_CHARS):
+    """Split messages into consecutive chunks bounded by count and total length."""
+    chunks, current, size = [], [], 0
+    for message in messages:
+        text = message['content'][:PROFILE_MESSAGE_MAX_CHARS]
+        if current and (len(current) >= max_messages or size + len(text) > max_chars):
+            chunks.append(current)
+            current, size = [], 0
+        current.append(dict(message, content=text))
+        size += len(text)
+    if current:
+        chunks.append(current)
+    return chunks
+
+def chunk_key(chunk):
+    return hashlib.sha256("\n".join(m['content'] for m in chunk).encode('utf-8')).hexdigest()
+
+class ProfileAnalyzer:
+    """Keeps user profiles up to date by analyzing only users with new messages.
+
+    A high-water mark per user records the newest message already analyzed and is
+    persisted, so a run skips everyone who has been quiet since the last one.
+    Analyses run at background priority with at most concurrency model calls at
+    once, and their start times are spread over spread_seconds instead of in one burst.
+
+    Profiles are built map-reduce style: new messages are split into chunks that
+    are summarized concurrently, and the chunk summaries are merged into the
+    existing profile. At most max_chunks are merged per run, oldest first, so
+    a long history is folded in over several runs at a bounded cost each.
+    Chunk summaries are cached by content so a failed merge does not redo them.
+    """
+
+    def __init__(self, profiles_dir, path=None, concurrency=PROFILE_ANALYSIS_CONCURRENCY,
+                 spread_seconds=PROFILE_ANALYSIS_INTERVAL * PROFILE_ANALYSIS_SPREAD,
+                 max_chunks=PROFILE_MAX_CHUNKS_PER_RUN):
+        self.profiles_dir = profiles_dir
+        self.path = Path(path) if path else None
+        self.concurrency = concurrency
+        self.spread_seconds = spread_seconds
+        self.max_chunks = max_chunks
+        self.marks = {}  # Maps user key -> timestamp of the newest analyzed message
+        self.chunk_summaries = {}  # Maps chunk content hash -> summary, oldest first
+        self.semaphore = None  # Bounds model calls during a run
+        self.chunk_hits = 0
+        self.chunk_misses = 0
+        self.last_run = {}
+        self.load()
+
+    def pending_users(self, user_conversations):
+        """Users with messages newer than their high-water mark, least recently analyzed first."""
+        pending = []
+        for user_key, conversations in list(user_conversations.items()):
+            # Skip keys that don't match the guild_user format
+            guild_id, _, user_id = user_key.partition('_')
+            if not user_id.isdigit():
+                continue
+            newest = newest_user_message(conversations)
+            if newest and newest > self.marks.get(user_key, ''):
+                pending.append((self.marks.get(user_key, ''), user_key, newest))
+        return [(user_key, newest) for _, user_key, newest in sorted(pending)]
+
+    async def generate(self, prompt, user_key):
+        """One background model call bounded by the run's concurrency; None on failure."""
+        # Imported here to avoid a circular import with services
+        from services import get_ollama_response, PRIORITY_BACKGROUND
+        try:
+            async with self.semaphore:
+                # Profile analysis yields to interactive requests
+                response = await get_ollama_response(
+                    prompt, with_context=False, user_key=user_key,
+                    priority=PRIORITY_BACKGROUND, use_cache=False
+                )
+        except Exception as e:
+            logger.error(f"Error analyzing profile of {user_key}: {e}")
+            return None
+        if not response or response.startswith(("Error", "I'm sorry")):
+            logger.warning(f"Profile analysis of {user_key} failed: {response[:100] if response else 'empty'}")
+            return None
+        return response.strip()
+
+    async def summarize_chunk(self, user_key, chunk):
+        """Map step: summarize one chunk of messages, reusing a cached summary."""
+        key = chunk_key(chunk)
+        if key in self.chunk_summaries:
+            self.chunk_hits += 1
+            return self.chunk_summaries[key]
+        self.chunk_misses += 1
+        transcript = "\n".join(f"- {m['content']}" for m in chunk)
+        summary = await self.generate(f"""Summarize what these messages from one user show about them as a learner:
+{transcript}
+
+Note the topics they asked about, their apparent skill level, recurring questions
+and any concepts they seem to have learned. Answer in at most 5 short bullet points.""", user_key)
+        if summary:
+            self.chunk_summaries[key] = summary
+            while len(self.chunk_summaries) > PROFILE_CHUNK_CACHE_SIZE:
+                del self.chunk_summaries[next(iter(self.chunk_summaries))]
+        return summary
+
+    def build_merge_prompt(self, previous, summaries):
+        notes = "\n\n".join(summaries)
+        return f"""Update this learner profile with the notes on the user's newer messages.
+
+Current profile:
+{previous or '(none yet)'}
+
+Notes on newer messages:
+{notes}
+
+Please identify:
+1. Main topics of interest
+2. Technical skill level
+3. Common questions or patterns
+4. Learning progress
+5. Key concepts discussed
+
+Keep what is still true, update what changed, and format the response as concise bullet points."""
+
+    def load_profile(self, user_key):
+        profile_path = os.path.join(self.profiles_dir, f"{user_key}_profile.json")
+        if not os.path.exists(profile_path):
+            return {}
+        try:
+            with open(profile_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.error(f"Error reading profile of {user_key}: {e}")
+            return {}
+
+    async def analyze_user(self, user_key, conversations, newest, get_username):
+        """Merge a user's unanalyzed messages into their profile; returns whether it succeeded."""
+        mark = self.marks.get(user_key, '')
+        new_messages = sorted(
+            (m for m in conversations
+             if m.get('role') == 'user' and mark < m.get('timestamp', '') <= newest),
+            key=lambda m: m['timestamp']
+        )
+        chunks = chunk_messages(new_messages)[:self.max_chunks]
+        if not chunks:
+            return False
+
+        summaries = await asyncio.gather(*(self.summarize_chunk(user_key, chunk) for chunk in chunks))
+        if not all(summaries):
+            # Leave the mark alone so the user is retried next run; finished chunks stay cached
+            return False
+
+        profile_data = self.load_profile(user_key)
+        # Only merge into analyses this pipeline wrote; placeholders and old analyses start over
+        previous = profile_data.get('analysis') if profile_data.get('analyzed_through') else None
+        analysis = await self.generate(self.build_merge_prompt(previous, summaries), user_key)
+        if not analysis:
+            return False
+
+        _, _, user_id = user_key.partition('_')
+        analyzed_through = chunks[-1][-1]['timestamp']
+        profile_data = {
+            'timestamp': datetime.now(UTC).isoformat(),
+            'analysis': analysis,
+            'username': get_username(int(user_id)) or profile_data.get('username', 'Unknown'),
+            'analyzed_through': analyzed_through,
+            'messages_analyzed': profile_data.get('messages_analyzed', 0) + sum(len(chunk) for chunk in chunks)
+        }
+        profile_path = os.path.join(self.profiles_dir, f"{user_key}_profile.json")
+        with open(profile_path, 'w', encoding='utf-8') as f:
+            json.dump(profile_data, f, indent=2)
+
+        self.marks[user_key] = analyzed_through
+        return True
+
+    async def run(self, user_conversations, get_username):
+        """Analyze every user with new messages, pacing and bounding the work."""
+        current_command.set('profile_analysis')
+        pending = self.pending_users(user_conversations)
+        if not pending:
+            return {'pending': 0, 'analyzed': 0, 'failed': 0}
+
+        started = time.monotonic()
+        spacing = self.spread_seconds / len(pending)
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def one(index, user_key, newest):
+            # Start each analysis at its own point in the spread window
+            await asyncio.sleep(max(0.0, started + index * spacing - time.monotonic()))
+            return await self.analyze_user(user_key, user_conversations.get(user_key, []), newest, get_username)
+
+        results = await asyncio.gather(
+            *(one(i, user_key, newest) for i, (user_key, newest) in enumerate(pending)),
+            return_exceptions=True
+        )
+        analyzed = sum(1 for result in results if result is True)
+        self.save()
+        self.last_run = {
+            'pending': len(pending),
+            'analyzed': analyzed,
+            'failed': len(pending) - analyzed,
+            'seconds': time.monotonic() - started,
+            'chunk_cache_hits': self.chunk_hits,
+            'chunk_cache_misses': self.chunk_misses
+        }
+        logger.info(f"Analyzed {analyzed}/{len(pending)} profiles with new messages in {self.last_run['seconds']:.0f}s")
+        return self.last_run
+
+    def forget(self, user_key=None):
+        """Drop one user's high-water mark, or all of them, so they are analyzed again."""
+        if user_key is None:
+            self.marks.clear()
+        else:
+            self.marks.pop(user_key, None)
+        self.save()
+
+    def load(self):
+        if not self.path or not self.path.exists():
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            self.marks = state.get('marks', {})
+            self.chunk_summaries = state.get('chunk_summaries', {})
+        except Exception as e:
+            logger.error(f"Error loading profile analysis state: {e}")
+
+    def save(self):
+        if not self.path:
+            return
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix('.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'marks': self.marks, 'chunk_summaries': self.chunk_summaries}, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.error(f"Error saving profile analysis state: {e}")
+
+# Create global profile analyzer instance
+profile_analyzer = ProfileAnalyzer(
+    profiles_dir=os.path.join(DATA_DIR, 'user_profiles'),
+    path=os.path.join(DATA_DIR, 'memory', 'profile_analysis.json')
+)
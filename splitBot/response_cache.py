@@ -0,0 +1,219 @@
+import os
+import re
+import json
+import math
+import time
+import hashlib
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE', '500'))  # Maximum cached responses
+RESPONSE_CACHE_TTL = float(os.getenv('RESPONSE_CACHE_TTL', '86400'))  # Seconds a cached response stays valid
+RESPONSE_CACHE_PERSIST = os.getenv('RESPONSE_CACHE_PERSIST', 'true').lower() == 'true'  # Keep the cache across restarts
+RESPONSE_CACHE_EMBED_MODEL = os.getenv('RESPONSE_CACHE_EMBED_MODEL')  # e.g. nomic-embed-text; unset disables semantic hits
+RESPONSE_CACHE_SIMILARITY = float(os.getenv('RESPONSE_CACHE_SIMILARITY', '0.95'))  # Cosine similarity for a semantic hit
+RESPONSE_CACHE_SAVE_INTERVAL = 30.0  # Minimum seconds between writes of the cache file
+
+def normalize_prompt(text):
+    """Collapse whitespace so formatting-only differences share a cache entry."""
+    return re.sub(r'\s+', ' ', text or '').strip()
+
+def make_cache_key(model, messages, options=None):
+    """Hash the model, normalized messages and generation options into a cache key."""
+    payload = {
+        'model': model,
+        'messages': [
+            {'role': m.get('role'), 'content': normalize_prompt(m.get('content'))}
+            for m in messages
+        ],
+        'options': options or {}
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+def cosine_similarity(a, b, norm_a=None, norm_b=None):
+    dot = sum(x * y for x, y in zip(a, b))
+    norm_a = norm_a or math.sqrt(sum(x * x for x in a))
+    norm_b = norm_b or math.sqrt(sum(x * x for x in b))
+    if not norm_a or not norm_b:
+        return 0.0
+    return dot / (norm_a * norm_b)
+
+class ResponseCache:
+    """LRU cache of model answers with a TTL and optional disk persistence.
+
+    Lookups first try an exact key match. If an embedding function is configured,
+    one-shot prompts can also hit an entry whose prompt embedding is nearly identical
+    within the same scope (same model, options and preceding messages).
+    """
+
+    def __init__(self, max_entries=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL, path=None,
+                 embed_func=None, similarity=RESPONSE_CACHE_SIMILARITY):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = Path(path) if path else None
+        self.embed_func = embed_func  # async text -> list of floats
+        self.similarity = similarity
+        self.entries = OrderedDict()  # Maps key -> entry dict, oldest first
+        self.pending_embeddings = {}  # Embeddings computed during a miss, reused by put()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.dirty = False
+        self.last_save = 0.0
+        self.saving = None  # Background save task
+        self.version = 0  # Bumped per snapshot so an older write never replaces a newer file
+        self.written_version = 0
+        self.write_lock = threading.Lock()
+        self.load()
+
+    def _expired(self, entry):
+        return time.time() - entry['created'] > self.ttl
+
+    async def get(self, key, scope=None, prompt_text=None):
+        """Return a cached response for key, or a semantically similar prompt in the same scope."""
+        entry = self.entries.get(key)
+        if entry is not None:
+            if not self._expired(entry):
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry['response']
+            del self.entries[key]
+            self.dirty = True
+
+        if self.embed_func and scope and prompt_text:
+            response = await self._semantic_get(key, scope, prompt_text)
+            if response is not None:
+                self.semantic_hits += 1
+                return response
+
+        self.misses += 1
+        return None
+
+    async def _semantic_get(self, key, scope, prompt_text):
+        try:
+            embedding = await self.embed_func(normalize_prompt(prompt_text))
+        except Exception as e:
+            logger.error(f"Error embedding prompt for response cache: {e}")
+            return None
+
+        norm = math.sqrt(sum(x * x for x in embedding))
+        best_key, best_score = None, 0.0
+        for other_key, entry in self.entries.items():
+            if entry.get('scope') != scope or not entry.get('embedding') or self._expired(entry):
+                continue
+            score = cosine_similarity(embedding, entry['embedding'], norm, entry.get('norm'))
+            if score > best_score:
+                best_key, best_score = other_key, score
+
+        if best_key is not None and best_score >= self.similarity:
+            self.entries.move_to_end(best_key)
+            logger.info(f"Semantic cache hit (similarity {best_score:.3f})")
+            return self.entries[best_key]['response']
+        self.pending_embeddings[key] = embedding
+        return None
+
+    def discard_pending(self, key):
+        """Drop the embedding kept for a miss whose answer will not be put()."""
+        self.pending_embeddings.pop(key, None)
+
+    def put(self, key, response, scope=None):
+        """Store a response, evicting the least recently used entries beyond max_entries."""
+        embedding = self.pending_embeddings.pop(key, None)
+        self.entries[key] = {
+            'response': response,
+            'created': time.time(),
+            'scope': scope,
+            'embedding': embedding,
+            'norm': math.sqrt(sum(x * x for x in embedding)) if embedding else None
+        }
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        self.dirty = True
+        self.schedule_save()
+
+    def stats(self):
+        """Report cache size and hit rate."""
+        lookups = self.hits + self.semantic_hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'hits': self.hits,
+            'semantic_hits': self.semantic_hits,
+            'misses': self.misses,
+            'hit_rate': (self.hits + self.semantic_hits) / lookups if lookups else 0.0
+        }
+
+    def clear(self):
+        self.entries.clear()
+        self.pending_embeddings.clear()
+        self.dirty = True
+        self.schedule_save()
+
+    def load(self):
+        """Load persisted entries, skipping ones that have expired."""
+        if not self.path or not self.path.exists():
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            for key, entry in data.get('entries', []):
+                if not self._expired(entry):
+                    self.entries[key] = entry
+            logger.info(f"Loaded {len(self.entries)} cached responses from {self.path}")
+        except Exception as e:
+            logger.error(f"Error loading response cache: {e}")
+
+    def write(self, entries, version):
+        with self.write_lock:
+            if version < self.written_version:
+                return
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix('.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'entries': entries}, f)
+            os.replace(tmp_path, self.path)
+            self.written_version = version
+
+    def save(self):
+        """Write the cache to disk atomically if it changed. Blocks; used on shutdown."""
+        self.last_save = time.monotonic()
+        if not self.path or not self.dirty:
+            return
+        try:
+            self.version += 1
+            self.write(list(self.entries.items()), self.version)
+            self.dirty = False
+        except Exception as e:
+            logger.error(f"Error saving response cache: {e}")
+
+    def schedule_save(self):
+        """Write the cache file in the background, at most once per RESPONSE_CACHE_SAVE_INTERVAL."""
+        if not self.path:
+            return
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            self.save()
+            return
+        if self.saving is None or self.saving.done():
+            self.saving = asyncio.create_task(self.save_later())
+
+    async def save_later(self):
+        # Wait out the interval since the last write so bursts of puts share one
+        await asyncio.sleep(max(0.0, self.last_save + RESPONSE_CACHE_SAVE_INTERVAL - time.monotonic()))
+        while self.dirty:
+            self.dirty = False
+            self.last_save = time.monotonic()
+            # Entries are replaced, never changed in place, so a shallow copy is a stable snapshot
+            snapshot = list(self.entries.items())
+            self.version += 1
+            try:
+                await asyncio.to_thread(self.write, snapshot, self.version)
+            except Exception as e:
+                logger.error(f"Error saving response cache: {e}")
+            await asyncio.sleep(RESPONSE_CACHE_SAVE_INTERVAL)
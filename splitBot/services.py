@@ -3,17 +3,18 @@ import re
 import asyncio
 import logging
 import urllib.parse
-import urllib.request
 import xml.etree.ElementTree as ET
 import json
 import time
 from datetime import datetime, timezone, UTC
 from pathlib import Path
 import aiohttp
-from bs4 import BeautifulSoup
+import httpx
 from pytube import YouTube
 import concurrent.futures
 import unicodedata
+import hashlib
+from collections import defaultdict
 
 # Import Groq if available
 try:
@@ -27,65 +28,38 @@ except ImportError:
 import ollama
 
 from utils import ParquetStorage, SYSTEM_PROMPT
+from llm_scheduler import llm_scheduler, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
+from response_cache import ResponseCache, make_cache_key, RESPONSE_CACHE_PERSIST, RESPONSE_CACHE_EMBED_MODEL
+from singleflight import SingleFlight
+from backend_router import Backend, backend_router
+from host_pool import OllamaHostPool, is_host_error, normalize_model_name
+from context_builder import prompt_eval_stats
+from metrics import metrics
+from usage_log import usage_log
+from process_pool import process_pool, WORKER_PROCESSES
+import html_parse
+from http_client import http_client
+from http_cache import http_cache
 from config import MODEL_NAME as CONFIG_MODEL_NAME
 
 # ---------- Web Crawling Integration ----------
 
+CRAWL_FETCH_CONCURRENCY = int(os.getenv('CRAWL_FETCH_CONCURRENCY', '5'))  # Pages downloaded at once
+CRAWL_PARSE_CONCURRENCY = int(os.getenv('CRAWL_PARSE_CONCURRENCY', str(max(WORKER_PROCESSES, 2))))  # Pages parsed at once
+CRAWL_SUMMARIZE_CONCURRENCY = int(os.getenv('CRAWL_SUMMARIZE_CONCURRENCY', '2'))  # Page summaries generated at once per crawl
+
 class WebCrawler:
+    # Per-stage limits shared by every crawl, so stages of different URLs overlap
+    fetch_slots = asyncio.Semaphore(CRAWL_FETCH_CONCURRENCY)
+    parse_slots = asyncio.Semaphore(CRAWL_PARSE_CONCURRENCY)
+    parser_backend = html_parse.choose_backend()
+    
     @staticmethod
     async def extract_pypi_content(html, package_name):
-        """Specifically extract PyPI package documentation from HTML."""
+        """Specifically extract PyPI package documentation from HTML, parsed in a worker process."""
         try:
-            soup = BeautifulSoup(html, 'html.parser')
-            
-            # Extract package metadata from the sidebar
-            metadata = {}
-            sidebar = soup.find('div', {'class': 'sidebar'})
-            if (sidebar):
-                for section in sidebar.find_all('div', {'class': 'sidebar-section'}):
-                    title_elem = section.find(['h3', 'h4'])
-                    if title_elem:
-                        section_title = title_elem.get_text().strip()
-                        content_list = []
-                        for p in section.find_all('p'):
-                            content_list.append(p.get_text().strip())
-                        metadata[section_title] = content_list
-            
-            # Find the project description section which contains the actual documentation
-            description_div = soup.find('div', {'class': 'project-description'})
-            
-            if (description_div):
-                # Extract text while preserving structure
-                content = ""
-                for element in description_div.children:
-                    if hasattr(element, 'name'):  # Check if it's a tag
-                        if element.name in ['h1', 'h2', 'h3', 'h4']:
-                            heading_level = int(element.name[1])
-                            heading_text = element.get_text().strip()
-                            content += f"{'#' * heading_level} {heading_text}\n\n"
-                        elif element.name == 'p':
-                            content += f"{element.get_text().strip()}\n\n"
-                        elif element.name == 'pre':
-                            code = element.get_text().strip()
-                            # Detect if there's a code element inside
-                            code_element = element.find('code')
-                            language = "python" if code_element and 'python' in str(code_element.get('class', [])).lower() else ""
-                            content += f"```{language}\n{code}\n```\n\n"
-                        elif element.name == 'ul':
-                            for li in element.find_all('li', recursive=False):
-                                content += f"- {li.get_text().strip()}\n"
-                            content += "\n"
-                
-                # Construct a structured representation
-                package_info = {
-                    'name': package_name,
-                    'metadata': metadata,
-                    'documentation': content
-                }
-                
-                return package_info
-            else:
-                return None
+            with metrics.stage('parse', 'pypi'):
+                return await process_pool.run(html_parse.extract_pypi, html, package_name)
         except Exception as e:
             logging.error(f"Error extracting PyPI content: {e}")
             return None
@@ -145,62 +119,101 @@ class WebCrawler:
         
         return md
     
+    @staticmethod
+    async def crawl_page(url):
+        """Fetch and parse one page, returning {'url', 'content', 'note'} or None if it could not be fetched.
+
+        Each stage waits for a slot of its own, so while one page is parsed the
+        next ones are already downloading. content is None for pages that are not
+        text, and note says what was left unread.
+        """
+        async with WebCrawler.fetch_slots:
+            response = await WebCrawler.fetch_page(url)
+        if not response:
+            return None
+        if response['rejected']:
+            return {'url': url, 'content': None, 'note': f"skipped, {response['rejected']} is not a text page"}
+        html_content = response['text']
+        if not html_content:
+            return None
+        
+        note = None
+        if response['truncated']:
+            skipped = response['skipped_bytes']
+            note = f"only the first {len(response['body']) // 1024} KB were read"
+            if skipped:
+                note += f", {skipped // 1024} KB skipped"
+        
+        async with WebCrawler.parse_slots:
+            # Check if it's a PyPI package
+            pypi_match = re.match(r'https?://pypi\.org/project/([^/]+)/?.*', url)
+            if pypi_match:
+                package_data = await WebCrawler.extract_pypi_content(html_content, pypi_match.group(1))
+                if not package_data:
+                    return None
+                content_text = package_data.get('documentation', 'No documentation available')
+            else:
+                content_text = await WebCrawler.extract_text_from_html(html_content)
+        return {'url': url, 'content': content_text, 'note': note}
+    
+    @staticmethod
+    def crawl_pages(urls):
+        """Start crawling every URL concurrently; returns one task per URL in input order."""
+        return [asyncio.create_task(WebCrawler.crawl_page(url)) for url in urls]
+    
     @staticmethod
     async def fetch_url_content(url):
-        """Fetch content from a URL."""
+        """Fetch the text of a URL, or None if it could not be fetched or is not a text page."""
+        response = await WebCrawler.fetch_page(url)
+        if not response or response['rejected']:
+            return None
+        return response['text']
+    
+    @staticmethod
+    async def fetch_page(url):
+        """Fetch a URL through the HTTP cache, returning the response dict or None on failure.
+
+        Only text pages are read, and at most the first HTTP_MAX_DOWNLOAD_BYTES of them.
+        """
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url) as response:
-                    if response.status == 200:
-                        html = await response.text()
-                        
-                        # Save crawled content
-                        crawl_data = {
-                            'url': url,
-                            'timestamp': datetime.now(UTC).isoformat(),
-                            'content': html[:100000]  # Limit content size
-                        }
-                        
-                        # Generate a filename from the URL
-                        filename = re.sub(r'[^\w]', '_', url.split('//')[-1])[:50]
-                        file_path = f"{DATA_DIR}/crawls/{filename}_{int(datetime.now().timestamp())}.parquet"
-                        ParquetStorage.save_to_parquet(crawl_data, file_path)
-                        
-                        return html
-                    else:
-                        return None
+            with metrics.stage('fetch', 'crawl'):
+                response = await http_cache.fetch(url)
+            if response['status'] != 200:
+                return None
+            if response['cache'] != 'miss' or response['rejected']:
+                # Unchanged since the last download, which already saved a snapshot
+                return response
+            html = response['text']
+            
+            # Save crawled content
+            crawl_data = {
+                'url': url,
+                'timestamp': datetime.now(UTC).isoformat(),
+                'content': html[:100000]  # Limit content size
+            }
+            
+            # Generate a filename from the URL
+            filename = re.sub(r'[^\w]', '_', url.split('//')[-1])[:50]
+            file_path = f"{DATA_DIR}/crawls/{filename}_{int(datetime.now().timestamp())}.parquet"
+            ParquetStorage.save_to_parquet(crawl_data, file_path)
+            
+            return response
         except Exception as e:
             logging.error(f"Error fetching URL {url}: {e}")
             return None
 
     @staticmethod
     async def extract_text_from_html(html):
-        """Extract main text content from HTML using BeautifulSoup."""
-        if html:
+        """Extract main text content from HTML in a worker process, keeping the event loop free."""
+        if not html:
+            return "Failed to extract text from the webpage."
+        with metrics.stage('parse', 'crawl'):
             try:
-                soup = BeautifulSoup(html, 'html.parser')
-                
-                # Remove script and style elements
-                for script in soup(["script", "style"]):
-                    script.extract()
-                    
-                # Get text
-                text = soup.get_text(separator=' ', strip=True)
-                
-                # Clean up whitespace
-                text = re.sub(r'\s+', ' ', text).strip()
-                
-                # Limit to first ~10,000 characters
-                return text[:15000] + ("..." if len(text) > 15000 else "")
+                return await process_pool.run(html_parse.extract_text, html, WebCrawler.parser_backend)
             except Exception as e:
-                logging.error(f"Error parsing HTML: {e}")
-                # Fall back to regex method if BeautifulSoup fails
-                clean_html = re.sub(r'<script.*?>.*?</script>', '', html, flags=re.DOTALL)
-                clean_html = re.sub(r'<style.*?>.*?</style>', '', clean_html, flags=re.DOTALL)
-                text = re.sub(r'<.*?>', ' ', clean_html)
-                text = re.sub(r'\s+', ' ', text).strip()
-                return text[:10000] + ("..." if len(text) > 10000 else "")
-        return "Failed to extract text from the webpage."
+                # A broken pool should not lose the page; parse it in a thread instead
+                logging.error(f"Error parsing HTML in a worker process: {e}")
+                return await asyncio.to_thread(html_parse.extract_text, html, WebCrawler.parser_backend)
     
     @staticmethod
     async def extract_youtube_content(url):
@@ -255,9 +268,6 @@ class WebCrawler:
 
 # Configuration variables from environment
 
-# Import model name from config
-from config import MODEL_NAME as CONFIG_MODEL_NAME
-
 # Update the model selection logic
 
 # Import directly from environment, with fallback to a reliable model
@@ -267,211 +277,492 @@ GROQ_MODEL = os.getenv('GROQ_MODEL')
 TEMPERATURE = float(os.getenv('TEMPERATURE', '0.7'))  # Temperature setting for the AI model
 TIMEOUT = float(os.getenv('TIMEOUT', '120.0'))  # Timeout setting for the API call
 DATA_DIR = os.getenv('DATA_DIR', 'data')
+OLLAMA_HOST = os.getenv('OLLAMA_HOST')  # None lets the ollama client use its default host
+OLLAMA_HOSTS = [h.strip() for h in os.getenv('OLLAMA_HOSTS', '').split(',') if h.strip()] or [OLLAMA_HOST]  # Hosts to balance over
+OLLAMA_MAX_CONNECTIONS = int(os.getenv('OLLAMA_MAX_CONNECTIONS', '20'))  # Connection cap per client
+OLLAMA_MAX_KEEPALIVE = int(os.getenv('OLLAMA_MAX_KEEPALIVE', '10'))  # Idle connections kept open per client
+OLLAMA_KEEPALIVE_EXPIRY = float(os.getenv('OLLAMA_KEEPALIVE_EXPIRY', '60.0'))  # Seconds an idle connection is kept
+MODEL_KEEP_ALIVE = os.getenv('OLLAMA_KEEP_ALIVE', '30m')  # How long Ollama keeps our models loaded
+MODEL_IDLE_UNLOAD = float(os.getenv('MODEL_IDLE_UNLOAD', '3600'))  # Seconds unused before we unload a model (0 disables)
+MODEL_RESIDENCY_TTL = float(os.getenv('MODEL_RESIDENCY_TTL', '15'))  # Seconds between running-model polls
+LLM_AUTO_ROUTE = os.getenv('LLM_AUTO_ROUTE', 'true').lower() == 'true'  # Let the router send requests to the faster backend
+ARXIV_API_URL = 'https://export.arxiv.org/api/query'
+ARXIV_TIMEOUT = float(os.getenv('ARXIV_TIMEOUT', '30'))  # Seconds an arXiv API request may take
+GROQ_ALLOWED_USERS = {u.strip() for u in os.getenv('GROQ_ALLOWED_USERS', '').split(',') if u.strip()}  # Empty lets everyone use --groq
+
+# ---------- Ollama Client Pool ----------
+
+class OllamaClientPool:
+    """Process-wide registry of Ollama clients keyed by host and timeout.
+
+    Each client owns an HTTP connection pool, so reusing clients keeps connections
+    alive between requests instead of reconnecting for every chat call.
+    """
+
+    def __init__(self, max_connections=OLLAMA_MAX_CONNECTIONS, max_keepalive_connections=OLLAMA_MAX_KEEPALIVE,
+                 keepalive_expiry=OLLAMA_KEEPALIVE_EXPIRY):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        self.clients = {}  # Maps (host, timeout) -> ollama.AsyncClient
+
+    def get_client(self, host=None, timeout=None):
+        """Return the shared client for a host/timeout pair, creating it on first use."""
+        key = (host or OLLAMA_HOSTS[0], timeout)
+        client = self.clients.get(key)
+        if client is None:
+            client = ollama.AsyncClient(host=key[0], timeout=timeout, limits=self.limits)
+            self.clients[key] = client
+            logging.info(f"Created Ollama client for host={key[0] or 'default'} timeout={timeout}")
+        return client
+
+    async def close(self):
+        """Close every pooled client and its connections."""
+        clients = list(self.clients.values())
+        self.clients.clear()
+        for client in clients:
+            try:
+                close = getattr(client, 'close', None)
+                if close is None:
+                    # AsyncClient.close() only exists from ollama 0.6.2; requirements.txt still allows
+                    # older releases, whose httpx client is the only way to close the connections
+                    transport = getattr(client, '_client', None)
+                    close = getattr(transport, 'aclose', None)
+                if close is not None:
+                    await close()
+            except Exception as e:
+                logging.error(f"Error closing Ollama client: {e}")
+
+# Create global client pool instance
+ollama_clients = OllamaClientPool()
+
+# Create global host pool instance
+ollama_hosts = OllamaHostPool(OLLAMA_HOSTS, ollama_clients.get_client)
+
+async def close_services():
+    """Release shared network resources on shutdown."""
+    response_cache.save()
+    http_cache.save()
+    await usage_log.flush()
+    await ollama_clients.close()
+    await http_client.close()
+    process_pool.shutdown()
+    await metrics.stop_server()
 
 # ---------- Ollama Integration ----------
 
 class ModelManager:
-    """Manages Ollama model loading and unloading"""
+    """Tracks which Ollama models are resident and keeps the ones we use loaded"""
     
-    def __init__(self):
+    def __init__(self, keep_alive=MODEL_KEEP_ALIVE, idle_unload=MODEL_IDLE_UNLOAD, residency_ttl=MODEL_RESIDENCY_TTL):
         self.current_base_model = None
         self.current_vision_model = None
-        self.model_info = {}  # Cache model metadata
+        self.keep_alive = keep_alive  # Passed to Ollama so loaded models are not evicted early
+        self.idle_unload = idle_unload  # Seconds a model may sit unused before we unload it
+        self.residency_ttl = residency_ttl  # Seconds a running-model listing stays valid
+        self.model_info = {}  # Resident models as reported by Ollama's running-model listing
+        self.last_used = {}  # Maps model name -> monotonic time of last request
+        self.last_refresh = 0.0
+        self.load_locks = defaultdict(asyncio.Lock)  # One lock per model so concurrent callers share a load
+        
+    normalize_name = staticmethod(normalize_model_name)
+        
+    async def refresh_loaded_models(self, force=False):
+        """Poll every Ollama host for the models that are actually loaded."""
+        if not force and time.monotonic() - self.last_refresh < self.residency_ttl:
+            return self.model_info
+            
+        try:
+            # Doubles as the host health check, so ejected hosts get re-admitted here
+            await ollama_hosts.check_all()
+            self.model_info = ollama_hosts.loaded_models()
+            self.last_refresh = time.monotonic()
+        except Exception as e:
+            logging.error(f"Error listing running Ollama models: {e}")
+            
+        return self.model_info
+        
+    def is_loaded(self, model_name):
+        """Check the last known residency of a model without polling."""
+        return self.normalize_name(model_name) in self.model_info
         
     async def load_model(self, model_name, is_vision=False):
-        """Load a model and unload others if needed"""
+        """Make sure a model is resident, preloading it with keep_alive if Ollama evicted it"""
         try:
-            # Check if model is already loaded
-            if (is_vision and self.current_vision_model == model_name) or (not is_vision and self.current_base_model == model_name):
-                return True
-                
-            # Get model info if not cached
-            if model_name not in self.model_info:
-                client = ollama.AsyncClient()
-                try:
-                    # Test if model is available by attempting a minimal chat
-                    test_message = {'role': 'user', 'content': 'test'}
-                    await client.chat(model=model_name, messages=[test_message])
-                    self.model_info[model_name] = {'loaded': True}
-                    
-                    # Update current model tracking
-                    if is_vision:
-                        self.current_vision_model = model_name
-                    else:
-                        self.current_base_model = model_name
-                    
-                    logging.info(f"Successfully loaded model: {model_name}")
-                    return True
-                    
-                except Exception as e:
-                    logging.error(f"Model {model_name} not available: {e}")
-                    return False
+            name = self.normalize_name(model_name)
+            self.last_used[name] = time.monotonic()
+            
+            await self.refresh_loaded_models()
+            if name not in self.model_info:
+                async with self.load_locks[name]:
+                    # Another caller may have finished loading while we waited for the lock
+                    if name not in self.model_info:
+                        async with ollama_hosts.lease(model_name) as host:
+                            client = ollama_clients.get_client(host.url)
+                            # An empty prompt loads the model without generating anything
+                            await client.generate(model=model_name, prompt='', keep_alive=self.keep_alive)
+                        self.model_info[name] = {'expires_at': None, 'size_vram': None, 'hosts': [host.url]}
+                        logging.info(f"Successfully loaded model: {model_name} on {host.name}")
+                        
+            # Update current model tracking
+            if is_vision:
+                self.current_vision_model = model_name
+            else:
+                self.current_base_model = model_name
+            return True
                     
         except Exception as e:
-            logging.error(f"Error loading model {model_name}: {e}")
+            logging.error(f"Model {model_name} not available: {e}")
             return False
 
     async def unload_model(self, model_name):
-        """Mark model as unloaded in our tracking"""
+        """Ask every Ollama host holding a model to unload it and drop it from our tracking"""
         try:
+            name = self.normalize_name(model_name)
+            for host in ollama_hosts.hosts:
+                if name in host.models:
+                    client = ollama_clients.get_client(host.url)
+                    await client.generate(model=model_name, prompt='', keep_alive=0)
+                    host.models.pop(name, None)
+            
             if self.current_base_model == model_name:
                 self.current_base_model = None
             if self.current_vision_model == model_name:
                 self.current_vision_model = None
             
-            if model_name in self.model_info:
-                del self.model_info[model_name]
+            self.model_info.pop(name, None)
+            self.last_used.pop(name, None)
                 
-            logging.info(f"Model unloaded from tracking: {model_name}")
+            logging.info(f"Model unloaded: {model_name}")
             return True
             
         except Exception as e:
             logging.error(f"Error unloading model {model_name}: {e}")
             return False
+            
+    async def unload_idle_models(self):
+        """Unload models this bot loaded that have not been used for idle_unload seconds"""
+        if not self.idle_unload:
+            return
+            
+        await self.refresh_loaded_models(force=True)
+        now = time.monotonic()
+        for name, last_used in list(self.last_used.items()):
+            if now - last_used > self.idle_unload and name in self.model_info:
+                logging.info(f"Unloading idle model {name} after {int(now - last_used)}s")
+                await self.unload_model(name)
 
 # Create global model manager instance
 model_manager = ModelManager()
 
-# Update get_ollama_response to use model manager
-async def get_ollama_response(prompt, with_context=True, use_groq=False, conversation_history=None, timeout=None):
-    """Gets a response from the Ollama or Groq model."""
-    if use_groq:
-        # Groq handling remains unchanged
-        try:
-            if not GROQ_AVAILABLE:
-                return "Groq API not available. Please install the Groq package with: pip install groq"
-                
-            groq_api_key = os.getenv('GROQ_API_KEY')
-            groq_model = os.getenv('GROQ_MODEL', 'meta-llama/llama-4-scout-17b-16e-instruct')
-            
-            if not groq_api_key:
-                return "Groq API key not set. Please set GROQ_API_KEY in your environment variables."
-                
-            # Initialize Groq client
-            client = AsyncGroq(api_key=groq_api_key)
-            
-            # Format messages for the model
-            if with_context and conversation_history:
-                messages_to_send = conversation_history
-            else:
-                messages_to_send = [
-                    {
-                        "role": "system",
-                        "content": SYSTEM_PROMPT
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ]
-                
-            # Log the Groq model being used
-            logging.info(f"Using Groq model: {groq_model}")
-            
-            # Make request to Groq API
-            chat_completion = await client.chat.completions.create(
-                model=groq_model,
-                messages=messages_to_send,
-                temperature=TEMPERATURE,
-                max_tokens=1024,
-            )
-            
-            return chat_completion.choices[0].message.content
-            
-        except Exception as e:
-            logging.error(f"Error using Groq API: {e}")
-            return f"Error with Groq API: {str(e)}"
-    else:
-        try:
-            # Get selected model from environment
-            model_name = os.getenv('OLLAMA_MODEL')
-            if not model_name:
-                raise Exception("No model selected. Please select a model in the UI.")
-            
-            # Try loading the model
-            if not await model_manager.load_model(model_name):
-                raise Exception(f"Could not load model: {model_name}")
+# Generation settings shared by chat requests and their cache keys
+CHAT_OPTIONS = {
+    'temperature': TEMPERATURE,
+    'num_predict': 512,
+    'stop': ['User:', 'Human:', '###']
+}
+GROQ_OPTIONS = {'temperature': TEMPERATURE, 'max_tokens': 1024}
 
-            # Format messages for the model
-            if with_context and conversation_history:
-                messages_to_send = conversation_history
-            else:
-                messages_to_send = [
-                    {
-                        "role": "system",
-                        "content": SYSTEM_PROMPT
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ]
-
-            # Using the streaming approach with AsyncClient
-            response_text = ""
-            # Use the timeout parameter if provided, otherwise use the default TIMEOUT value
-            actual_timeout = timeout if timeout is not None else TIMEOUT
-            
-            try:
-                # Create client with the correct timeout
-                client = ollama.AsyncClient(timeout=actual_timeout)
+async def embed_text(text):
+    """Embed text with the response cache's embedding model."""
+    async with ollama_hosts.lease(RESPONSE_CACHE_EMBED_MODEL) as host:
+        client = ollama_clients.get_client(host.url)
+        response = await client.embed(model=RESPONSE_CACHE_EMBED_MODEL, input=text)
+    return list(response['embeddings'][0])
+
+# Create global response cache instance
+response_cache = ResponseCache(
+    path=os.path.join(DATA_DIR, 'cache', 'responses.json') if RESPONSE_CACHE_PERSIST else None,
+    embed_func=embed_text if RESPONSE_CACHE_EMBED_MODEL else None
+)
+
+# Create global in-flight request coalescer
+inflight_generations = SingleFlight()
+
+# Queue and load gauges, read whenever metrics are scraped
+metrics.gauge('bot_llm_queue_depth', lambda: {
+    (('model', model),): status['waiting'] for model, status in llm_scheduler.get_queue_status().items()
+}, "Model requests waiting for a slot")
+metrics.gauge('bot_llm_in_flight', lambda: {
+    (('model', model),): status['in_flight'] for model, status in llm_scheduler.get_queue_status().items()
+}, "Model requests currently running")
+metrics.gauge('bot_ollama_host_outstanding', lambda: {
+    (('host', host.name),): host.outstanding for host in ollama_hosts.hosts
+}, "Requests running on each Ollama host")
+metrics.gauge('bot_ollama_host_admitted', lambda: {
+    (('host', host.name),): int(host.admitted) for host in ollama_hosts.hosts
+}, "Whether each Ollama host is in rotation")
+metrics.gauge('bot_shared_generations_in_flight', lambda: len(inflight_generations.calls),
+              "Upstream generations currently shared by coalesced requests")
+metrics.gauge('bot_response_cache_entries', lambda: len(response_cache.entries), "Answers held in the response cache")
+
+async def lookup_cached_response(cache_key, model_key, messages, options, question=None):
+    """Look up a cached answer, returning (scope, cached_response).
+
+    Near-duplicate matching only runs for one-shot prompts that name the user's
+    question. Only the question is embedded, and it can only match answers whose
+    prompt carried the same source material (the prompt without the question).
+    """
+    if question is None:
+        return None, await response_cache.get(cache_key)
+    source = messages[-1].get('content', '').replace(question, '')
+    scope = make_cache_key(model_key, messages[:-1] + [{'role': 'user', 'content': source}], options)
+    cached = await response_cache.get(cache_key, scope, question)
+    return scope, cached
+
+def build_messages(prompt, with_context=True, conversation_history=None):
+    """Format the messages for a request, using the conversation history when given."""
+    if with_context and conversation_history:
+        return conversation_history
+    return [
+        {
+            "role": "system",
+            "content": SYSTEM_PROMPT
+        },
+        {
+            "role": "user",
+            "content": prompt
+        }
+    ]
+
+async def groq_chat(groq_model, messages, on_token=None, timeout=None):
+    """Run a chat request against the Groq API and return the reply text."""
+    groq_api_key = os.getenv('GROQ_API_KEY')
+    
+    # Initialize Groq client
+    client = AsyncGroq(api_key=groq_api_key, timeout=timeout if timeout is not None else TIMEOUT)
+    
+    # Log the Groq model being used
+    logging.info(f"Using Groq model: {groq_model}")
+    
+    # Stream from Groq when the caller wants partial output
+    if on_token:
+        stream = await client.chat.completions.create(
+            model=groq_model,
+            messages=messages,
+            temperature=TEMPERATURE,
+            max_tokens=1024,
+            stream=True
+        )
+        response_text = ""
+        async for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                response_text += delta
+                await on_token(delta)
+        return response_text
+    
+    # Make request to Groq API
+    chat_completion = await client.chat.completions.create(
+        model=groq_model,
+        messages=messages,
+        temperature=TEMPERATURE,
+        max_tokens=1024,
+    )
+    
+    return chat_completion.choices[0].message.content
+
+def scale_model_limit(model_name):
+    """Let the scheduler run LLM_MAX_INFLIGHT requests per admitted Ollama host for a model."""
+    hosts = max(1, len(ollama_hosts.admitted_hosts()))
+    if llm_scheduler.get_limit(model_name) != llm_scheduler.max_inflight_per_model * hosts:
+        llm_scheduler.set_limit(model_name, llm_scheduler.max_inflight_per_model * hosts)
+
+async def ollama_chat(model_name, messages, timeout=None, on_token=None, options=None, user_key=None):
+    """Stream a chat request from Ollama and return the collected reply text.
+
+    The request runs on the host picked by ollama_hosts. If that host is unreachable
+    before anything has streamed, the next host is tried. The token counts and
+    durations of the final chunk go to usage_log, tagged with user_key.
+    """
+    # Use the timeout parameter if provided, otherwise use the default TIMEOUT value
+    actual_timeout = timeout if timeout is not None else TIMEOUT
+    
+    failed_hosts = []
+    while True:
+        response_text = ""
+        try:
+            async with ollama_hosts.lease(model_name, exclude=failed_hosts) as host:
+                # Reuse the pooled client for this host and timeout
+                client = ollama_clients.get_client(host.url, timeout=actual_timeout)
                 
                 # Get the stream of responses
                 stream_generator = await client.chat(
                     model=model_name,
-                    messages=messages_to_send,
-                    options={
-                        'temperature': TEMPERATURE,
-                        'num_predict': 512,
-                        'stop': ['User:', 'Human:', '###']
-                    },
-                    stream=True
+                    messages=messages,
+                    options=options if options is not None else CHAT_OPTIONS,
+                    stream=True,
+                    keep_alive=model_manager.keep_alive
                 )
                 
                 # Process the streaming response
                 async for chunk in stream_generator:
                     if 'message' in chunk and 'content' in chunk['message']:
                         response_text += chunk['message']['content']
-                
-                if response_text:
-                    return response_text
-                else:
-                    return "I'm sorry, I couldn't generate a response. Please try rephrasing your question. If the issue persists, please contact @BORCH the developer of Ollama Teacher & OARC."
-            except TypeError as te:
-                # Handle the case where timeout might be passed incorrectly
-                if "unexpected keyword argument 'timeout'" in str(te):
-                    logging.warning(f"Timeout parameter not supported by AsyncClient. Trying again without timeout...")
-                    # Try again without timeout parameter
-                    client = ollama.AsyncClient()
-                    stream_generator = await client.chat(
-                        model=model_name,
-                        messages=messages_to_send,
-                        options={
-                            'temperature': TEMPERATURE,
-                            'num_predict': 512,
-                            'stop': ['User:', 'Human:', '###']
-                        },
-                        stream=True
-                    )
-                    
-                    # Process the streaming response
-                    async for chunk in stream_generator:
-                        if 'message' in chunk and 'content' in chunk['message']:
-                            response_text += chunk['message']['content']
-                    
-                    if response_text:
-                        return response_text
-                    else:
-                        return "I'm sorry, I couldn't generate a response. Please try rephrasing your question."
-                else:
-                    raise
-    
+                        if on_token and chunk['message']['content']:
+                            await on_token(chunk['message']['content'])
+                    if chunk.get('done'):
+                        # The final chunk reports how much of the prompt had to be evaluated
+                        prompt_eval_stats.record(messages, chunk.get('prompt_eval_count'), chunk.get('prompt_eval_duration'))
+                        if chunk.get('prompt_eval_duration'):
+                            metrics.observe('bot_stage_seconds', chunk['prompt_eval_duration'] / 1e9,
+                                            stage='prefill', source=model_name)
+                        if chunk.get('eval_duration'):
+                            metrics.observe('bot_stage_seconds', chunk['eval_duration'] / 1e9,
+                                            stage='generate', source=model_name)
+                        metrics.inc('bot_llm_tokens_total', chunk.get('prompt_eval_count') or 0, model=model_name, kind='prompt')
+                        metrics.inc('bot_llm_tokens_total', chunk.get('eval_count') or 0, model=model_name, kind='output')
+                        usage_log.record(model_name, chunk, messages, user_key=user_key, host=host.name)
+            
+            return response_text
         except Exception as e:
-            logging.error(f"Error in get_ollama_response: {e}")
-            return f"Error: {str(e)}. Please make sure a model is selected in the UI."
+            if response_text or not is_host_error(e) or len(failed_hosts) + 1 >= len(ollama_hosts.hosts):
+                raise
+            logging.warning(f"Ollama host {host.name} failed, retrying on another host: {e}")
+            failed_hosts.append(host)
+
+def groq_allowed(user_key=None):
+    """Check whether a user may have requests sent to Groq."""
+    if not GROQ_AVAILABLE or not os.getenv('GROQ_API_KEY'):
+        return False
+    if not GROQ_ALLOWED_USERS:
+        return True
+    _, user = llm_scheduler.split_user_key(user_key)
+    return user in GROQ_ALLOWED_USERS
+
+def groq_routable(user_key=None, use_groq=False):
+    """Check whether Groq may serve a request: only on --groq, or for users on a non-empty allow-list.
+
+    Groq is a paid external API, so requests without --groq never go there just
+    because it has a key configured.
+    """
+    if not groq_allowed(user_key):
+        return False
+    if use_groq:
+        return True
+    _, user = llm_scheduler.split_user_key(user_key)
+    return user in GROQ_ALLOWED_USERS
+
+def chat_backends(user_key=None, use_groq=False):
+    """The backends a user's chat request may be routed to, local model first."""
+    backends = []
+    model_name = os.getenv('OLLAMA_MODEL')
+    if model_name:
+        async def chat_ollama(messages, timeout, on_token):
+            if not await model_manager.load_model(model_name):
+                raise Exception(f"Could not load model: {model_name}")
+            return await ollama_chat(model_name, messages, timeout, on_token, user_key=user_key)
+        scale_model_limit(model_name)
+        backends.append(Backend(model_name, chat_ollama, CHAT_OPTIONS))
+
+    if groq_routable(user_key, use_groq):
+        groq_model = os.getenv('GROQ_MODEL', 'meta-llama/llama-4-scout-17b-16e-instruct')
+        async def chat_groq(messages, timeout, on_token):
+            return await groq_chat(groq_model, messages, on_token, timeout)
+        backends.append(Backend(f"groq:{groq_model}", chat_groq, GROQ_OPTIONS))
+    return backends
+
+async def get_ollama_response(prompt, with_context=True, use_groq=False, conversation_history=None, timeout=None,
+                              on_token=None, user_key=None, priority=PRIORITY_INTERACTIVE, on_queued=None,
+                              use_cache=True, question=None):
+    """Gets a response from the Ollama or Groq model.
+
+    backend_router picks among the backends the user may use, preferring Groq
+    when use_groq is set and the local model when automatic routing is off, and
+    falls back to the other backend if the first one fails. Groq is only among
+    them with use_groq or for users listed in GROQ_ALLOWED_USERS.
+
+    If on_token is given it is awaited with each text fragment as it streams in,
+    so callers can show partial output before the full reply is ready. Requests
+    wait for a slot in llm_scheduler; user_key and priority decide their turn and
+    on_queued is awaited with the queue position if they have to wait. Answers are
+    served from and stored in response_cache unless use_cache is False. question is
+    the user's own question inside a one-shot prompt about some source material;
+    only with it can a similarly worded earlier question about the same source
+    be answered from the cache.
+    """
+    messages_to_send = build_messages(prompt, with_context, conversation_history)
+    if with_context and conversation_history:
+        question = None
+    
+    if use_groq:
+        if not GROQ_AVAILABLE:
+            return "Groq API not available. Please install the Groq package with: pip install groq"
+        if not os.getenv('GROQ_API_KEY'):
+            return "Groq API key not set. Please set GROQ_API_KEY in your environment variables."
+        if not groq_allowed(user_key):
+            return "You don't have access to the Groq API. Ask an admin to add you to GROQ_ALLOWED_USERS."
+    
+    try:
+        backends = chat_backends(user_key, use_groq)
+        if not backends:
+            raise Exception("No model selected. Please select a model in the UI.")
+        
+        if use_groq:
+            prefer = backends[-1].key
+        elif not LLM_AUTO_ROUTE:
+            prefer = backends[0].key
+        else:
+            prefer = None
+        
+        # Key on every backend the request may use so a cached answer is valid whichever one replied
+        route_key = "|".join(backend.key for backend in backends)
+        route_options = {backend.key: backend.options for backend in backends}
+        cache_key = make_cache_key(route_key, messages_to_send, route_options)
+        if use_cache:
+            scope, cached = await lookup_cached_response(
+                cache_key, route_key, messages_to_send, route_options, question
+            )
+            if cached is not None:
+                if on_token:
+                    await on_token(cached)
+                return cached
+        
+        queued_callback = on_queued
+        
+        async def call(backend, relay):
+            nonlocal queued_callback
+            # Only the first attempt reports its queue position; hedges and fallbacks stay quiet
+            notify, queued_callback = queued_callback, None
+            started = time.perf_counter()
+            first_token = False
+            
+            async def timed_relay(token):
+                nonlocal first_token
+                if not first_token:
+                    first_token = True
+                    metrics.observe('bot_llm_first_token_seconds', time.perf_counter() - started, model=backend.key)
+                await relay(token)
+            
+            with metrics.timer('bot_llm_request', model=backend.key):
+                async with llm_scheduler.slot(backend.key, user_key, priority, notify):
+                    return await backend.chat(messages_to_send, timeout, timed_relay)
+        
+        async def generate(broadcast):
+            return await backend_router.run(backends, call, broadcast, prefer=prefer)
+        
+        # Identical concurrent requests share one generation
+        try:
+            response_text = await inflight_generations.run(cache_key, generate, on_token)
+            if response_text and use_cache:
+                response_cache.put(cache_key, response_text, scope)
+        finally:
+            # put() has taken the prompt's embedding; a failed or cancelled generation must not leave it behind
+            response_cache.discard_pending(cache_key)
+        
+        if response_text:
+            return response_text
+        else:
+            return "I'm sorry, I couldn't generate a response. Please try rephrasing your question. If the issue persists, please contact @BORCH the developer of Ollama Teacher & OARC."
+    
+    except Exception as e:
+        logging.error(f"Error in get_ollama_response: {e}")
+        return f"Error: {str(e)}. Please make sure a model is selected in the UI."
 
 # Update process_image_with_llava similarly
-async def process_image_with_llava(image_data, prompt, model_name=None):
+async def process_image_with_llava(image_data, prompt, model_name=None, user_key=None, on_queued=None):
     """Process image data with a vision model."""
     try:
         vision_model = model_name or os.getenv('OLLAMA_VISION_MODEL')
@@ -491,20 +782,18 @@ async def process_image_with_llava(image_data, prompt, model_name=None):
 
         # Call vision model
         logging.info(f"Using vision model: {vision_model}")
-        client = ollama.AsyncClient()
-        response_text = ""
+        scale_model_limit(vision_model)
         
-        stream = await client.chat(
-            model=vision_model,
-            messages=messages,
-            stream=True
-        )
-
-        async for chunk in stream:
-            if 'message' in chunk and 'content' in chunk['message']:
-                response_text += chunk['message']['content']
-
-        return response_text
+        async def generate(broadcast):
+            with metrics.timer('bot_llm_request', model=vision_model):
+                async with llm_scheduler.slot(vision_model, user_key, PRIORITY_INTERACTIVE, on_queued):
+                    return await ollama_chat(vision_model, messages, on_token=broadcast, options={}, user_key=user_key)
+        
+        # The same image and question asked concurrently share one generation
+        request_key = make_cache_key(vision_model, [{'role': 'user', 'content': prompt}], {
+            'image': hashlib.sha256(image_data).hexdigest()
+        })
+        return await inflight_generations.run(request_key, generate)
 
     except Exception as e:
         logging.error(f"Vision model error: {e}")
@@ -530,29 +819,25 @@ class ArxivSearcher:
         raise ValueError("Could not extract arXiv ID from the provided input")
 
     @staticmethod
-    async def fetch_paper_info(arxiv_id):
-        """Fetch paper metadata from arXiv API."""
-        base_url = 'http://export.arxiv.org/api/query'
-        query_params = {
-            'id_list': arxiv_id,
-            'max_results': 1
+    def parse_feed(xml_data):
+        """Parse an arXiv Atom feed into paper info dicts keyed by arXiv ID.
+
+        Each paper is keyed both with and without its version suffix so it can be
+        matched to however the ID was requested. Runs in a worker thread.
+        """
+        root = ET.fromstring(xml_data)
+        namespaces = {
+            'atom': 'http://www.w3.org/2005/Atom',
+            'arxiv': 'http://arxiv.org/schemas/atom'
         }
         
-        url = f"{base_url}?{urllib.parse.urlencode(query_params)}"
-        
-        try:
-            with urllib.request.urlopen(url) as response:
-                xml_data = response.read().decode('utf-8')
-            
-            root = ET.fromstring(xml_data)
-            namespaces = {
-                'atom': 'http://www.w3.org/2005/Atom',
-                'arxiv': 'http://arxiv.org/schemas/atom'
-            }
-            
-            entry = root.find('atom:entry', namespaces)
-            if entry is None:
-                raise ValueError("No paper found with the provided ID")
+        papers = {}
+        for entry in root.findall('atom:entry', namespaces):
+            entry_id = entry.find('atom:id', namespaces).text.strip()
+            if '/abs/' not in entry_id:
+                # arXiv reports a malformed ID as an entry pointing at its error docs
+                raise ValueError(entry.find('atom:summary', namespaces).text.strip())
+            arxiv_id = entry_id.split('/abs/')[-1]
             
             paper_info = {
                 'arxiv_id': arxiv_id,
@@ -579,21 +864,109 @@ class ArxivSearcher:
                 elem = entry.find(f'arxiv:{field}', namespaces)
                 if elem is not None:
                     paper_info[field] = elem.text
-                    
-            # Save paper info to Parquet
-            file_path = f"{DATA_DIR}/papers/{arxiv_id}.parquet"
-            ParquetStorage.save_to_parquet(paper_info, file_path)
-            
-            # Also append to all papers list
-            all_papers_path = f"{DATA_DIR}/papers/all_papers.parquet"
-            ParquetStorage.append_to_parquet(paper_info, all_papers_path)
             
-            return paper_info
-            
-        except urllib.error.URLError as e:
+            papers[arxiv_id] = paper_info
+            papers.setdefault(re.sub(r'v\d+$', '', arxiv_id), paper_info)
+        return papers
+
+    @staticmethod
+    def save_papers(papers):
+        """Cache each paper in its own Parquet file and add them all to the papers list."""
+        for paper_info in papers:
+            ParquetStorage.save_to_parquet(paper_info, f"{DATA_DIR}/papers/{paper_info['arxiv_id']}.parquet")
+        ParquetStorage.append_to_parquet(papers, f"{DATA_DIR}/papers/all_papers.parquet")
+
+    @staticmethod
+    async def fetch_papers(arxiv_ids):
+        """Fetch metadata for several papers with one arXiv API request.
+
+        Returns a list in the order of arxiv_ids holding each paper's info, or
+        None for IDs arXiv does not know. Parsing and saving run off the event loop.
+        """
+        unique_ids = list(dict.fromkeys(arxiv_ids))
+        if not unique_ids:
+            return []
+        query_params = {
+            'id_list': ','.join(unique_ids),
+            'max_results': len(unique_ids)
+        }
+        url = f"{ARXIV_API_URL}?{urllib.parse.urlencode(query_params)}"
+        
+        try:
+            session = await http_client.get_session()
+            with metrics.stage('fetch', 'arxiv'):
+                async with session.get(url, timeout=aiohttp.ClientTimeout(total=ARXIV_TIMEOUT)) as response:
+                    # arXiv rejects the whole batch with a 400 when one ID in it is malformed
+                    rejected = len(unique_ids) > 1 and 400 <= response.status < 500 and response.status != 429
+                    if not rejected:
+                        response.raise_for_status()
+                        xml_data = await response.text()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
             raise ConnectionError(f"Failed to connect to arXiv API: {e}")
+        if rejected:
+            return await ArxivSearcher.fetch_each(unique_ids, arxiv_ids)
+        
+        try:
+            with metrics.stage('parse', 'arxiv'):
+                found = await asyncio.to_thread(ArxivSearcher.parse_feed, xml_data)
         except ET.ParseError as e:
             raise ValueError(f"Failed to parse API response: {e}")
+        except ValueError:
+            if len(unique_ids) == 1:
+                raise
+            # Or it answers with an error entry, which fails the whole batch just the same
+            return await ArxivSearcher.fetch_each(unique_ids, arxiv_ids)
+        
+        papers = {}
+        for arxiv_id in unique_ids:
+            paper_info = found.get(arxiv_id) or found.get(re.sub(r'v\d+$', '', arxiv_id))
+            if paper_info is not None:
+                # Keep the ID as requested so the cached file is found next time
+                papers[arxiv_id] = dict(paper_info, arxiv_id=arxiv_id)
+        
+        if papers:
+            await asyncio.to_thread(ArxivSearcher.save_papers, list(papers.values()))
+        return [papers.get(arxiv_id) for arxiv_id in arxiv_ids]
+
+    @staticmethod
+    async def fetch_each(unique_ids, arxiv_ids):
+        """Look a failed batch's IDs up one by one, so one malformed ID only loses itself."""
+        results = await asyncio.gather(
+            *(ArxivSearcher.fetch_papers([arxiv_id]) for arxiv_id in unique_ids), return_exceptions=True
+        )
+        found = {
+            arxiv_id: result[0] for arxiv_id, result in zip(unique_ids, results)
+            if not isinstance(result, BaseException) and result[0] is not None
+        }
+        return [found.get(arxiv_id) for arxiv_id in arxiv_ids]
+
+    @staticmethod
+    def load_cached_paper(arxiv_id):
+        existing_paper = ParquetStorage.load_from_parquet(f"{DATA_DIR}/papers/{arxiv_id}.parquet")
+        if existing_paper is not None and len(existing_paper) > 0:
+            return existing_paper.iloc[0].to_dict()
+        return None
+
+    @staticmethod
+    async def get_papers(arxiv_ids):
+        """Paper info for each ID in order, from the local cache or one batched arXiv request."""
+        cached = await asyncio.to_thread(lambda: [ArxivSearcher.load_cached_paper(arxiv_id) for arxiv_id in arxiv_ids])
+        missing = [arxiv_id for arxiv_id, paper_info in zip(arxiv_ids, cached) if paper_info is None]
+        if missing:
+            logging.info(f"Fetching {len(missing)} paper(s) from arXiv: {', '.join(missing)}")
+            fetched = dict(zip(missing, await ArxivSearcher.fetch_papers(missing)))
+        else:
+            fetched = {}
+        return [paper_info if paper_info is not None else fetched.get(arxiv_id)
+                for arxiv_id, paper_info in zip(arxiv_ids, cached)]
+
+    @staticmethod
+    async def fetch_paper_info(arxiv_id):
+        """Fetch paper metadata from arXiv API."""
+        paper_info = (await ArxivSearcher.fetch_papers([arxiv_id]))[0]
+        if paper_info is None:
+            raise ValueError("No paper found with the provided ID")
+        return paper_info
 
     @staticmethod
     async def format_paper_for_learning(paper_info):
@@ -634,46 +1007,50 @@ class DuckDuckGoSearcher:
             encoded_query = urllib.parse.quote(search_query)
             url = f"https://api.duckduckgo.com/?q={encoded_query}&format=json&pretty=1"
             
-            async with aiohttp.ClientSession() as session:
+            session = await http_client.get_session()
+            with metrics.stage('fetch', 'ddg'):
                 async with session.get(url) as response:
-                    if response.status == 200:
-                        result_text = await response.text()
-                        try:
-                            results = json.loads(result_text)
-                            
-                            # Save search results to Parquet
-                            search_data = {
-                                'query': search_query,
-                                'timestamp': datetime.now(UTC).isoformat(),
-                                'raw_results': result_text
-                            }
-                            
-                            # Generate a filename from the query
-                            filename = re.sub(r'[^\w]', '_', search_query)[:50]
-                            file_path = f"{DATA_DIR}/searches/{filename}_{int(datetime.now().timestamp())}.parquet"
-                            ParquetStorage.save_to_parquet(search_data, file_path)
-                            
-                            # Format the response nicely for Discord
-                            formatted_results = "# DuckDuckGo Search Results\n\n"
-                            
-                            if 'AbstractText' in results and results['AbstractText']:
-                                formatted_results += f"## Summary\n{results['AbstractText']}\n\n"
-                                
-                            if 'RelatedTopics' in results:
-                                formatted_results += "## Related Topics\n\n"
-                                count = 0
-                                for topic in results['RelatedTopics']:
-                                    if count >= max_results:
-                                        break
-                                    if 'Text' in topic and 'FirstURL' in topic:
-                                        formatted_results += f"- [{topic['Text']}]({topic['FirstURL']})\n"
-                                        count += 1
-                            
-                            return formatted_results
-                        except json.JSONDecodeError:
-                            return "Error: Could not parse the search results."
-                    else:
-                        return f"Error: Received status code {response.status} from DuckDuckGo API."
+                    status = response.status
+                    result_text = await response.text() if status == 200 else None
+            
+            if status != 200:
+                return f"Error: Received status code {status} from DuckDuckGo API."
+            
+            try:
+                with metrics.stage('parse', 'ddg'):
+                    results = json.loads(result_text)
+                
+                # Save search results to Parquet
+                search_data = {
+                    'query': search_query,
+                    'timestamp': datetime.now(UTC).isoformat(),
+                    'raw_results': result_text
+                }
+                
+                # Generate a filename from the query
+                filename = re.sub(r'[^\w]', '_', search_query)[:50]
+                file_path = f"{DATA_DIR}/searches/{filename}_{int(datetime.now().timestamp())}.parquet"
+                ParquetStorage.save_to_parquet(search_data, file_path)
+                
+                # Format the response nicely for Discord
+                formatted_results = "# DuckDuckGo Search Results\n\n"
+                
+                if 'AbstractText' in results and results['AbstractText']:
+                    formatted_results += f"## Summary\n{results['AbstractText']}\n\n"
+                    
+                if 'RelatedTopics' in results:
+                    formatted_results += "## Related Topics\n\n"
+                    count = 0
+                    for topic in results['RelatedTopics']:
+                        if count >= max_results:
+                            break
+                        if 'Text' in topic and 'FirstURL' in topic:
+                            formatted_results += f"- [{topic['Text']}]({topic['FirstURL']})\n"
+                            count += 1
+                
+                return formatted_results
+            except json.JSONDecodeError:
+                return "Error: Could not parse the search results."
         except Exception as e:
             logging.error(f"DuckDuckGo search error: {e}")
             return f"An error occurred during the search: {str(e)}"
@@ -0,0 +1,91 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+class _Subscriber:
+    def __init__(self, callback):
+        self.callback = callback
+        self.sent = 0  # Characters of the shared text already delivered
+
+class _SharedGeneration:
+    """One upstream generation and the callers waiting on it."""
+
+    def __init__(self):
+        self.text = ""
+        self.subscribers = []
+        self.waiters = 0
+        self.task = None
+
+    async def broadcast(self, token):
+        """Forward a streamed fragment to every subscriber."""
+        self.text += token
+        for subscriber in list(self.subscribers):
+            await self.deliver(subscriber)
+
+    async def deliver(self, subscriber):
+        delta = self.text[subscriber.sent:]
+        if not delta:
+            return
+        subscriber.sent = len(self.text)
+        try:
+            await subscriber.callback(delta)
+        except Exception as e:
+            # A failing listener must not break the generation for everyone else
+            logger.error(f"Error delivering shared stream: {e}")
+            if subscriber in self.subscribers:
+                self.subscribers.remove(subscriber)
+
+class SingleFlight:
+    """Coalesces identical concurrent requests into one upstream generation.
+
+    The first caller for a key starts the generation; later callers with the same
+    key attach to it, get the text streamed so far replayed to their on_token
+    callback, then receive the remaining stream and the same final result.
+    """
+
+    def __init__(self):
+        self.calls = {}  # Maps request key -> _SharedGeneration
+        self.started = 0
+        self.coalesced = 0
+
+    async def run(self, key, generate, on_token=None):
+        """Run generate(on_token) once per key among concurrent callers and return its result."""
+        shared = self.calls.get(key)
+        if shared is None:
+            shared = _SharedGeneration()
+            self.calls[key] = shared
+            self.started += 1
+            shared.task = asyncio.create_task(generate(shared.broadcast))
+            shared.task.add_done_callback(lambda _, key=key, shared=shared: self._forget(key, shared))
+        else:
+            self.coalesced += 1
+            logger.info(f"Joined in-flight generation {key[:12]} ({len(shared.text)} chars streamed so far)")
+
+        subscriber = None
+        if on_token:
+            subscriber = _Subscriber(on_token)
+            shared.subscribers.append(subscriber)
+            await shared.deliver(subscriber)
+
+        shared.waiters += 1
+        try:
+            # Shield so one caller giving up does not cancel the others' result
+            return await asyncio.shield(shared.task)
+        finally:
+            shared.waiters -= 1
+            if subscriber in shared.subscribers:
+                shared.subscribers.remove(subscriber)
+            if shared.waiters == 0 and not shared.task.done():
+                shared.task.cancel()
+
+    def _forget(self, key, shared):
+        if self.calls.get(key) is shared:
+            del self.calls[key]
+
+    def stats(self):
+        return {
+            'in_flight': len(self.calls),
+            'started': self.started,
+            'coalesced': self.coalesced
+        }
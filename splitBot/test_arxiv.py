@@ -0,0 +1,68 @@
+import os
+import re
+import asyncio
+import logging
+import tempfile
+from aiohttp import web
+
+# Keep the papers fetch_papers saves out of the real data directory
+os.environ['DATA_DIR'] = tempfile.mkdtemp(prefix='ollama-teacher-arxiv-')
+os.makedirs(os.path.join(os.environ['DATA_DIR'], 'papers'))
+
+import services
+from services import ArxivSearcher
+from http_client import http_client
+
+logging.basicConfig(level=logging.INFO)
+
+VALID_ID = re.compile(r'^\d{4}\.\d{4,5}(v\d+)?$')
+
+def entry(arxiv_id):
+    return f"""<entry>
+    <id>http://arxiv.org/abs/{arxiv_id}v1</id>
+    <title>Paper {arxiv_id}</title>
+    <author><name>Alice</name></author>
+    <summary>Abstract of {arxiv_id}.</summary>
+    <published>2017-06-12T17:57:34Z</published>
+    <link href="http://arxiv.org/abs/{arxiv_id}v1" rel="alternate" type="text/html"/>
+    <link href="http://arxiv.org/pdf/{arxiv_id}v1" rel="related" type="application/pdf"/>
+    <category term="cs.CL"/>
+  </entry>"""
+
+async def test_malformed_id():
+    print("=== TESTING ARXIV BATCH WITH A MALFORMED ID ===")
+
+    requests = []
+
+    async def query(request):
+        ids = request.query['id_list'].split(',')
+        requests.append(ids)
+        if not all(VALID_ID.match(arxiv_id) for arxiv_id in ids):
+            # Like arXiv, reject the whole batch
+            return web.Response(status=400, text=f"incorrect id format for {ids}")
+        body = ''.join(entry(arxiv_id) for arxiv_id in ids)
+        return web.Response(text=f'<feed xmlns="http://www.w3.org/2005/Atom">{body}</feed>', content_type='application/atom+xml')
+
+    app = web.Application()
+    app.router.add_get('/api/query', query)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    services.ARXIV_API_URL = f"http://127.0.0.1:{port}/api/query"
+
+    try:
+        papers = await ArxivSearcher.fetch_papers(['1706.03762', 'not-an-id', '1810.04805'])
+    finally:
+        await http_client.close()
+        await runner.cleanup()
+
+    print(f"\nRequests made: {requests}")
+    print(f"Results: {[paper and paper['arxiv_id'] for paper in papers]}")
+    print(f"Batch tried first: {'PASSED ✅' if len(requests[0]) == 3 else 'FAILED ❌'}")
+    print(f"Valid papers found: {'PASSED ✅' if papers[0] and papers[0]['title'] == 'Paper 1706.03762' and papers[2] and papers[2]['arxiv_id'] == '1810.04805' else 'FAILED ❌'}")
+    print(f"Malformed ID left empty: {'PASSED ✅' if papers[1] is None else 'FAILED ❌'}")
+
+if __name__ == "__main__":
+    asyncio.run(test_malformed_id())
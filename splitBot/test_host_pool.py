@@ -0,0 +1,105 @@
+import json
+import asyncio
+import logging
+from aiohttp import web
+import ollama
+from host_pool import OllamaHostPool
+
+logging.basicConfig(level=logging.INFO)
+
+class StubOllama:
+    """A minimal local Ollama stand-in answering /api/ps and streaming /api/chat."""
+
+    def __init__(self, port, loaded=(), delay=0.05):
+        self.port = port
+        self.loaded = list(loaded)
+        self.delay = delay
+        self.chats = 0
+        self.runner = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    async def ps(self, request):
+        return web.json_response({'models': [{'name': name, 'model': name} for name in self.loaded]})
+
+    async def chat(self, request):
+        body = await request.json()
+        self.chats += 1
+        name = body['model'] if ':' in body['model'] else f"{body['model']}:latest"
+        if name not in self.loaded:
+            self.loaded.append(name)
+        response = web.StreamResponse(headers={'Content-Type': 'application/x-ndjson'})
+        await response.prepare(request)
+        for word in f"reply from {self.port}".split():
+            await asyncio.sleep(self.delay)
+            chunk = {'model': body['model'], 'message': {'role': 'assistant', 'content': word + ' '}, 'done': False}
+            await response.write((json.dumps(chunk) + '\n').encode())
+        done = {'model': body['model'], 'message': {'role': 'assistant', 'content': ''}, 'done': True}
+        await response.write((json.dumps(done) + '\n').encode())
+        await response.write_eof()
+        return response
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/api/ps', self.ps)
+        app.router.add_post('/api/chat', self.chat)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, '127.0.0.1', self.port).start()
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+async def chat(pool, model):
+    async with pool.lease(model) as host:
+        client = ollama.AsyncClient(host=host.url)
+        text = ""
+        async for chunk in await client.chat(model=model, messages=[{'role': 'user', 'content': 'hi'}], stream=True):
+            text += chunk['message']['content']
+        return text.strip()
+
+async def test_host_pool():
+    stubs = [StubOllama(18431, loaded=['phi3:latest']), StubOllama(18432), StubOllama(18433)]
+    for stub in stubs:
+        await stub.start()
+    pool = OllamaHostPool([stub.url for stub in stubs], lambda url: ollama.AsyncClient(host=url),
+                          max_failures=2, eject_seconds=0.5, affinity_slack=1)
+
+    print("=== TESTING OLLAMA HOST POOL ===")
+    await pool.check_all()
+    print(f"\nHosts: {pool.get_status()}")
+
+    # Affinity: a single request goes to the host that already has the model
+    reply = await chat(pool, 'phi3')
+    print(f"\nAffinity reply: {reply!r}")
+    print(f"Model affinity: {'PASSED ✅' if reply.endswith('18431') else 'FAILED ❌'}")
+
+    # Balancing: a burst spreads over every host once the loaded one is busy
+    await asyncio.gather(*(chat(pool, 'phi3') for _ in range(9)))
+    counts = [stub.chats for stub in stubs]
+    print(f"\nChats per host: {counts}")
+    print(f"Least outstanding balancing: {'PASSED ✅' if all(counts) else 'FAILED ❌'}")
+
+    # Ejection: a host that stops answering is taken out of rotation
+    await stubs[2].stop()
+    for _ in range(2):
+        await pool.check_all()
+    ejected = not pool.get_status()[stubs[2].url]['admitted']
+    print(f"Ejection of a dead host: {'PASSED ✅' if ejected else 'FAILED ❌'}")
+    before = stubs[2].chats
+    await asyncio.gather(*(chat(pool, 'phi3') for _ in range(4)))
+    print(f"Ejected host skipped: {'PASSED ✅' if stubs[2].chats == before else 'FAILED ❌'}")
+
+    # Re-admission: once it is back and a health check succeeds
+    await stubs[2].start()
+    await asyncio.sleep(0.6)
+    await pool.check_all()
+    print(f"Re-admission: {'PASSED ✅' if pool.get_status()[stubs[2].url]['admitted'] else 'FAILED ❌'}")
+
+    for stub in stubs:
+        await stub.stop()
+
+if __name__ == "__main__":
+    asyncio.run(test_host_pool())
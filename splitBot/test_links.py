@@ -0,0 +1,117 @@
+import os
+import asyncio
+import logging
+import tempfile
+from datetime import datetime, UTC
+
+# Keep the files !links writes out of the real data directory
+os.environ['DATA_DIR'] = tempfile.mkdtemp(prefix='ollama-teacher-links-')
+
+import commands
+from commands import register_commands
+from link_ingest import LinkIngestQueue
+
+logging.basicConfig(level=logging.INFO)
+
+class FakeBot:
+    """Collects the handlers register_commands() attaches."""
+
+    def __init__(self):
+        self.commands = {}
+
+    def command(self, name=None, **kwargs):
+        def decorator(func):
+            self.commands[name or func.__name__] = func
+            return func
+        return decorator
+
+class FakeAuthor:
+    def __init__(self, user_id, name, bot=False):
+        self.id = user_id
+        self.name = name
+        self.display_name = name
+        self.bot = bot
+
+class FakeMessage:
+    def __init__(self, content, author):
+        self.content = content
+        self.author = author
+        self.created_at = datetime.now(UTC)
+
+class FakeTyping:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+class FakeChannel:
+    """Serves history() as an async iterator, like discord.py 2.x."""
+
+    def __init__(self, messages):
+        self.messages = messages
+
+    async def history(self, limit=None):
+        for message in self.messages[:limit]:
+            yield message
+
+class FakeGuild:
+    def __init__(self, guild_id):
+        self.id = guild_id
+
+class FakeContext:
+    def __init__(self, channel, guild):
+        self.channel = channel
+        self.guild = guild
+        self.sent = []
+
+    def typing(self):
+        return FakeTyping()
+
+    async def send(self, content=None, **kwargs):
+        self.sent.append(content)
+
+async def test_links():
+    print("=== TESTING !links ===")
+
+    queue = LinkIngestQueue(
+        path=os.path.join(os.environ['DATA_DIR'], 'knowledge', 'ingest_jobs.json'),
+        knowledge_dir=os.path.join(os.environ['DATA_DIR'], 'knowledge')
+    )
+    # The command uses the module's queue; swap in one that is never started
+    commands.link_ingest = queue
+
+    bot = FakeBot()
+    register_commands(bot, {}, {}, [], os.environ['DATA_DIR'])
+
+    alice, bob = FakeAuthor(1, 'alice'), FakeAuthor(2, 'bob')
+    channel = FakeChannel([
+        FakeMessage("Read https://docs.python.org/3/library/asyncio.html, it's great!", alice),
+        FakeMessage("Same page: https://docs.python.org/3/library/asyncio.html?utm_source=chat", bob),
+        FakeMessage("Paper https://arxiv.org/abs/1706.03762 and a video https://youtu.be/abc", bob),
+        FakeMessage("https://github.com/ollama/ollama", FakeAuthor(3, 'bot', bot=True)),
+    ])
+    ctx = FakeContext(channel, FakeGuild(42))
+    await bot.commands['links'](ctx)
+
+    errors = [message for message in ctx.sent if message and message.startswith("⚠️")]
+    queued = [message for message in ctx.sent if message and message.startswith("📥")]
+    print(f"\nMessages sent: {ctx.sent}")
+    print(f"No errors: {'PASSED ✅' if not errors else 'FAILED ❌'}")
+    print(f"Queue reported: {'PASSED ✅' if queued else 'FAILED ❌'}")
+    print(f"\nQueued jobs: {list(queue.jobs)}")
+    print(f"Links deduplicated, video and bot skipped: {'PASSED ✅' if len(queue.jobs) == 2 and len(queue.pending) == 2 else 'FAILED ❌'}")
+    print(f"Guild recorded: {'PASSED ✅' if all('42' in job['guilds'] for job in queue.jobs.values()) else 'FAILED ❌'}")
+
+    # A link that failed for one guild is fetched again when another guild shares it
+    failed_key = next(iter(queue.jobs))
+    queue.pending.pop(failed_key)
+    queue.finish(queue.jobs[failed_key], 'failed', "HTTP 503")
+    other = FakeContext(channel, FakeGuild(43))
+    await bot.commands['links'](other)
+    job = queue.jobs[failed_key]
+    print(f"\nFailed job after a share from another guild: {job['status']}, in queue: {failed_key in queue.pending}")
+    print(f"Failed link requeued: {'PASSED ✅' if job['status'] == 'pending' and failed_key in queue.pending and '43' in job['guilds'] else 'FAILED ❌'}")
+
+if __name__ == "__main__":
+    asyncio.run(test_links())
@@ -0,0 +1,110 @@
+import asyncio
+import logging
+from backend_router import Backend, BackendRouter, RouterError
+
+logging.basicConfig(level=logging.INFO)
+
+def fake_backend(key, first_token_delay, reply="ok", fail=False):
+    """A local stand-in for a model backend that streams reply after a delay."""
+    async def chat(messages, timeout, on_token):
+        await asyncio.sleep(first_token_delay)
+        if fail:
+            raise TimeoutError(f"{key} timed out")
+        for word in reply.split():
+            await on_token(word + " ")
+        return reply
+    return Backend(key, chat)
+
+async def run_request(router, backends, prefer=None):
+    streamed = []
+
+    async def call(backend, on_token):
+        return await backend.chat([], None, on_token)
+
+    async def on_token(token):
+        streamed.append(token)
+
+    reply = await router.run(backends, call, on_token, prefer=prefer)
+    return reply, "".join(streamed).strip()
+
+async def test_router():
+    print("=== TESTING BACKEND ROUTER ===")
+
+    # Fallback: the first backend times out, the second answers
+    router = BackendRouter()
+    backends = [fake_backend("ollama", 0.05, fail=True), fake_backend("groq", 0.01, "from groq")]
+    reply, streamed = await run_request(router, backends)
+    print(f"\nFallback reply: {reply!r} (streamed {streamed!r})")
+    print(f"Fallback: {'PASSED ✅' if reply == 'from groq' and router.fallbacks == 1 else 'FAILED ❌'}")
+
+    # Routing: after warming up, requests go to the faster backend
+    router = BackendRouter()
+    backends = [fake_backend("slow", 0.05, "slow"), fake_backend("fast", 0.01, "fast")]
+    for _ in range(6):
+        await run_request(router, backends, prefer="slow")
+        await run_request(router, backends, prefer="fast")
+    reply, _ = await run_request(router, backends)
+    print(f"\nRouted reply: {reply!r}")
+    print(f"Latency routing: {'PASSED ✅' if reply == 'fast' else 'FAILED ❌'}")
+
+    # Health: a backend that keeps failing is avoided
+    router = BackendRouter()
+    backends = [fake_backend("broken", 0.0, fail=True), fake_backend("working", 0.02, "working")]
+    for _ in range(6):
+        await run_request(router, backends, prefer="broken")
+    print(f"\nBackend stats: {router.get_stats()['backends']}")
+    print(f"Unhealthy ranked last: {'PASSED ✅' if router.rank(backends, prefer='broken')[0].key == 'working' else 'FAILED ❌'}")
+
+    # Hedging: the primary stalls past its p95, so a second backend races it
+    router = BackendRouter(hedge=True, hedge_min_delay=0.01)
+    quick = fake_backend("primary", 0.01, "primary")
+    for _ in range(6):
+        await run_request(router, [quick])
+    backends = [fake_backend("primary", 0.5, "primary"), fake_backend("hedge", 0.05, "hedge")]
+    reply, streamed = await run_request(router, backends, prefer="primary")
+    print(f"\nHedged reply: {reply!r} (streamed {streamed!r})")
+    print(f"Hedging: {'PASSED ✅' if reply == 'hedge' and streamed == 'hedge' and router.hedge_wins == 1 else 'FAILED ❌'}")
+
+    # Everything failing surfaces every error
+    router = BackendRouter()
+    try:
+        await run_request(router, [fake_backend("a", 0.0, fail=True), fake_backend("b", 0.0, fail=True)])
+        print("\nAll backends down: FAILED ❌")
+    except RouterError as e:
+        print(f"\nAll backends down: {'PASSED ✅' if len(e.errors) == 2 else 'FAILED ❌'} ({e})")
+
+async def test_default_routing():
+    print("\n=== TESTING GROQ OPT-IN ===")
+    import os
+    os.environ.update({'GROQ_API_KEY': 'test-key', 'OLLAMA_MODEL': 'llama3'})
+    import services
+    services.GROQ_AVAILABLE = True  # Pretend the groq package is installed
+    services.GROQ_ALLOWED_USERS = set()
+
+    # With only GROQ_API_KEY set, ordinary requests stay on Ollama
+    keys = [backend.key for backend in services.chat_backends('1_100')]
+    print(f"\nDefault backends: {keys}")
+    print(f"Default stays on Ollama: {'PASSED ✅' if keys == ['llama3'] else 'FAILED ❌'}")
+
+    # Even when Groq has been answering faster, the router never sees it
+    router = BackendRouter()
+    fast_groq = {'llama3': fake_backend("llama3", 0.05, "from ollama"), 'groq': fake_backend("groq", 0.0, "from groq")}
+    for _ in range(6):
+        await run_request(router, list(fast_groq.values()))
+    reply, _ = await run_request(router, [fast_groq[key] for key in keys])
+    print(f"Routed reply: {reply!r} ({'PASSED ✅' if reply == 'from ollama' else 'FAILED ❌'})")
+
+    # --groq opts in
+    keys = [backend.key for backend in services.chat_backends('1_100', use_groq=True)]
+    print(f"--groq adds Groq: {'PASSED ✅' if len(keys) == 2 and keys[1].startswith('groq:') else 'FAILED ❌'}")
+
+    # Users on a non-empty allow-list are routed automatically, others are not
+    services.GROQ_ALLOWED_USERS = {'100'}
+    allowed = [backend.key for backend in services.chat_backends('1_100')]
+    other = [backend.key for backend in services.chat_backends('1_200')]
+    print(f"Allow-listed user may be routed to Groq: {'PASSED ✅' if len(allowed) == 2 else 'FAILED ❌'}")
+    print(f"Other users stay on Ollama: {'PASSED ✅' if other == ['llama3'] else 'FAILED ❌'}")
+
+if __name__ == "__main__":
+    asyncio.run(test_router())
+    asyncio.run(test_default_routing())
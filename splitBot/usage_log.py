@@ -0,0 +1,143 @@
+import os
+import time
+import asyncio
+import logging
+import contextvars
+from datetime import datetime, UTC
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from context_builder import message_tokens
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.getenv('DATA_DIR', 'data')
+USAGE_LOG_ENABLED = os.getenv('USAGE_LOG_ENABLED', 'true').lower() == 'true'  # Record token usage of every generation
+USAGE_LOG_BATCH_SIZE = int(os.getenv('USAGE_LOG_BATCH_SIZE', '200'))  # Records buffered before a Parquet file is written
+USAGE_LOG_FLUSH_SECONDS = float(os.getenv('USAGE_LOG_FLUSH_SECONDS', '300'))  # Longest a record waits in the buffer
+
+# Name of the command being handled, set when a command or mention starts so
+# generations deep inside services can be attributed to it
+current_command = contextvars.ContextVar('current_command', default=None)
+
+USAGE_SCHEMA = pa.schema([
+    ('timestamp', pa.timestamp('us', tz='UTC')),
+    ('command', pa.string()),
+    ('user_key', pa.string()),
+    ('guild_id', pa.string()),
+    ('user_id', pa.string()),
+    ('model', pa.string()),
+    ('host', pa.string()),
+    ('prompt_messages', pa.int32()),
+    ('prompt_tokens', pa.int64()),  # Tokens Ollama evaluated; a reused prompt prefix is not counted
+    ('prompt_size_tokens', pa.int64()),  # Estimated size of the whole prompt
+    ('output_tokens', pa.int64()),
+    ('load_seconds', pa.float64()),
+    ('prefill_seconds', pa.float64()),
+    ('decode_seconds', pa.float64()),
+    ('total_seconds', pa.float64()),
+    ('decode_tokens_per_s', pa.float64()),
+])
+
+def nanoseconds_to_seconds(value):
+    return value / 1e9 if value else 0.0
+
+class TokenUsageLog:
+    """Buffers per-generation token accounting and writes it to Parquet in batches.
+
+    Each batch becomes its own file under directory, so writing never rewrites
+    earlier data and the directory can be read back as one dataset.
+    """
+
+    def __init__(self, directory=None, batch_size=USAGE_LOG_BATCH_SIZE, flush_seconds=USAGE_LOG_FLUSH_SECONDS):
+        self.directory = Path(directory) if directory else None
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.buffer = []
+        self.last_flush = time.monotonic()
+        self.flushing = None  # Task writing the current batch
+        self.recorded = 0
+        self.written = 0
+
+    def record(self, model, chunk, messages=None, user_key=None, host=None, command=None):
+        """Record the counts and durations Ollama reports in a generation's final chunk."""
+        if self.directory is None:
+            return None
+        guild_id, _, user_id = (user_key or '').partition('_')
+        output_tokens = chunk.get('eval_count') or 0
+        decode_seconds = nanoseconds_to_seconds(chunk.get('eval_duration'))
+        self.buffer.append({
+            'timestamp': datetime.now(UTC),
+            'command': command or current_command.get() or 'unknown',
+            'user_key': user_key,
+            'guild_id': guild_id or None,
+            'user_id': user_id or None,
+            'model': model,
+            'host': host,
+            'prompt_messages': len(messages or []),
+            'prompt_tokens': chunk.get('prompt_eval_count') or 0,
+            'prompt_size_tokens': sum(message_tokens(m) for m in messages or []),
+            'output_tokens': output_tokens,
+            'load_seconds': nanoseconds_to_seconds(chunk.get('load_duration')),
+            'prefill_seconds': nanoseconds_to_seconds(chunk.get('prompt_eval_duration')),
+            'decode_seconds': decode_seconds,
+            'total_seconds': nanoseconds_to_seconds(chunk.get('total_duration')),
+            'decode_tokens_per_s': output_tokens / decode_seconds if decode_seconds else None,
+        })
+        self.recorded += 1
+        if len(self.buffer) >= self.batch_size:
+            return self.schedule_flush()
+        return self.flush_if_due()
+
+    def flush_if_due(self):
+        """Start a background flush if records have waited flush_seconds; called by record() and a periodic task."""
+        if self.buffer and time.monotonic() - self.last_flush >= self.flush_seconds:
+            return self.schedule_flush()
+        return None
+
+    def schedule_flush(self):
+        """Write the buffered records in the background unless a write is already running."""
+        if self.flushing is None or self.flushing.done():
+            self.flushing = asyncio.create_task(self.flush())
+        return self.flushing
+
+    def write_batch(self, records):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        table = pa.Table.from_pylist(records, schema=USAGE_SCHEMA)
+        stamp = datetime.now(UTC).strftime('%Y%m%d_%H%M%S_%f')
+        pq.write_table(table, self.directory / f"usage_{stamp}.parquet")
+
+    async def flush(self):
+        """Write everything buffered so far to a new Parquet file off the event loop."""
+        self.last_flush = time.monotonic()
+        if not self.buffer or self.directory is None:
+            return 0
+        records, self.buffer = self.buffer, []
+        try:
+            await asyncio.to_thread(self.write_batch, records)
+        except Exception as e:
+            logger.error(f"Error writing token usage log: {e}")
+            # Keep the records for the next attempt rather than losing them
+            self.buffer = records + self.buffer
+            return 0
+        self.written += len(records)
+        return len(records)
+
+    def load(self):
+        """Read every written batch back as one DataFrame."""
+        if self.directory is None or not any(self.directory.glob('usage_*.parquet')):
+            return pd.DataFrame(columns=USAGE_SCHEMA.names)
+        return pq.read_table(self.directory).to_pandas()
+
+    def get_stats(self):
+        return {
+            'recorded': self.recorded,
+            'written': self.written,
+            'buffered': len(self.buffer)
+        }
+
+# Create global usage log instance
+usage_log = TokenUsageLog(directory=os.path.join(DATA_DIR, 'usage') if USAGE_LOG_ENABLED else None)
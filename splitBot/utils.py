@@ -9,23 +9,17 @@ from pathlib import Path
 from datetime import datetime, timezone, UTC
 from tabulate import tabulate  # Add this import
 import re
+import time
+from metrics import metrics
 
-# System prompt for initializing the conversation
-SYSTEM_PROMPT = """
-You are Ollama Teacher, a friendly AI assistant focused on AI, machine learning, and programming topics.
-
-As an assistant:
-- Respond directly to questions with clear, helpful information
-- Be conversational and personable while staying focused on the user's query
-- Format output using markdown when appropriate for clarity
-- Provide code examples when relevant, properly formatted in code blocks
-- Address users by name when available
-"""
+# System prompt for initializing the conversation, defined once in config
+from config import SYSTEM_PROMPT
 
 # Constants
 MAX_CONVERSATION_LOG_SIZE = 50  # Maximum size of the conversation log (including the system prompt)
 MAX_TEXT_ATTACHMENT_SIZE = 20000  # Maximum combined characters for text attachments
 MAX_FILE_SIZE = 2 * 1024 * 1024  # Maximum file size in bytes (2 MB)
+STREAM_EDIT_INTERVAL = float(os.getenv('STREAM_EDIT_INTERVAL', '1.0'))  # Seconds between edits of a streamed reply
 
 # Default learning resources
 DEFAULT_RESOURCES = [
@@ -109,7 +103,8 @@ async def send_in_chunks(ctx, text, reference=None, chunk_size=1950):
             
         ref = reference if i == 0 else None
         try:
-            await ctx.send(chunk, reference=ref)
+            with metrics.stage('send', 'chunks'):
+                await ctx.send(chunk, reference=ref)
             # Small delay between chunks to prevent rate limiting
             if i < len(chunks) - 1:
                 await asyncio.sleep(0.5)
@@ -120,6 +115,98 @@ async def send_in_chunks(ctx, text, reference=None, chunk_size=1950):
             except:
                 pass
 
+class StreamingMessage:
+    """Shows a model reply in Discord while it is still being generated.
+
+    The first message is posted as soon as visible text arrives, then edited at
+    throttled intervals. Text beyond Discord's length limit rolls over into a new message.
+    """
+
+    def __init__(self, ctx, reference=None, edit_interval=STREAM_EDIT_INTERVAL, max_length=1950):
+        self.ctx = ctx
+        self.reference = reference
+        self.edit_interval = edit_interval
+        self.max_length = max_length
+        self.text = ""  # Everything received so far
+        self.current = ""  # Text belonging to the message being edited
+        self.message = None  # Discord message currently being edited
+        self.shown = ""  # Content last sent for the current message
+        self.sent_messages = 0
+        self.last_flush = 0.0
+        self.lock = asyncio.Lock()
+
+    async def push(self, token):
+        """Add a streamed fragment and refresh Discord if the throttle allows it."""
+        # Append under the lock: _roll_over replaces self.current after awaiting a send
+        async with self.lock:
+            self.text += token
+            self.current += token
+            await self._roll_over()
+            # Post the first message immediately, then only edit every edit_interval seconds
+            if self.message is None and self.current.strip():
+                await self._flush()
+            elif time.monotonic() - self.last_flush >= self.edit_interval:
+                await self._flush()
+
+    async def finish(self, final_text):
+        """Flush the final reply, appending whatever the stream did not already show."""
+        async with self.lock:
+            if final_text.startswith(self.text):
+                remainder = final_text[len(self.text):]
+            else:
+                # The stream produced nothing usable (e.g. an error message); show the final text as is
+                remainder = final_text if not self.text.strip() else "\n\n" + final_text
+            self.text += remainder
+            self.current += remainder
+            await self._roll_over()
+            if self.current.strip():
+                await self._flush()
+            elif self.sent_messages == 0:
+                await self.ctx.send("⚠️ No content to display. The result was empty.", reference=self.reference)
+
+    async def _roll_over(self):
+        """Freeze full messages and start new ones until the current text fits."""
+        while len(self.current) > self.max_length:
+            cut = self.current.rfind("\n", 0, self.max_length)
+            if cut < self.max_length // 2:
+                cut = self.max_length
+            page, rest = self.current[:cut], self.current[cut:]
+            # Keep code blocks intact across the message boundary
+            if page.count("```") % 2 == 1:
+                page += "\n```"
+                rest = "```\n" + rest.lstrip("\n")
+            self.current = page
+            await self._flush()
+            self.message = None
+            self.shown = ""
+            rest = rest.lstrip("\n")
+            self.current = ("(continued)\n" if rest.startswith("```") else "(continued) ") + rest
+
+    async def _flush(self):
+        """Send or edit the current message with the latest text."""
+        content = self.current
+        if not content.strip() or content == self.shown:
+            return
+        try:
+            with metrics.stage('send', 'stream'):
+                if self.message is None:
+                    # Only the first message replies to the user, like send_in_chunks
+                    ref = self.reference if self.sent_messages == 0 else None
+                    self.message = await self.ctx.send(content, reference=ref)
+                    self.sent_messages += 1
+                else:
+                    await self.message.edit(content=content)
+            self.shown = content
+        except Exception as e:
+            logging.error(f"Error updating streamed message: {e}")
+        self.last_flush = time.monotonic()
+
+def queue_notifier(ctx, reference=None):
+    """Build an on_queued callback that tells a user their place in the model queue."""
+    async def notify(position):
+        await ctx.send(f"⏳ Your request is queued at position {position}. I'll answer as soon as it starts.", reference=reference)
+    return notify
+
 def get_user_key(ctx_or_message):
     """Generate a unique key for user storage.
     Works with both Context and Message objects."""
@@ -326,7 +413,8 @@ Convert this to a pandas operation that will:
 Return only the pandas code, no explanation."""
 
             # Get the pandas code to execute
-            pandas_code = await get_ollama_response(prompt, with_context=False)
+            # The data changes between queries, so always generate fresh code
+            pandas_code = await get_ollama_response(prompt, with_context=False, use_cache=False)
             pandas_code = pandas_code.strip()
 
             # Execute safely